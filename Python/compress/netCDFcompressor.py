@@ -44,6 +44,8 @@ from functools import partial
 # User library imports =========================================================
 
 from scinet_cesm_utils import which, secondsToStr
+try: from wrfavg.catalog import WRFCatalog, CatalogError # catalog of WRF output files (optional)
+except ImportError: WRFCatalog = None
 
 
 # Stuff for comparing two netcdf files >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
@@ -308,6 +310,7 @@ if __name__ == "__main__":
     parser.add_argument('-n',           nargs=1, type=int, default=[int(multiprocessing.cpu_count()/4)], 
                                         help='number of parallel processes (default: CPU_count/4')
     parser.add_argument('--debug',      action='store_true', help='Debug mode: only list files and operations (no conversion)')
+    parser.add_argument('--nocatalog',  action='store_true', help='WRF mode: list folder instead of using the file catalog')
     
     ncflags = parser.add_argument_group('nccopy flags')
     ncflags.add_argument('-d',   nargs=1, type=int,  default=[1], help="compression level")
@@ -437,7 +440,21 @@ if __name__ == "__main__":
 
     # Generating the list of files that need to be worked on
     list_of_files = []
-    if mode == "WRF":
+    catalog = None
+    if mode == "WRF" and WRFCatalog is not None and not args.nocatalog:
+        # query the catalog of WRF output files (only lists the folder, if it was modified)
+        try: catalog = WRFCatalog(comp_direc)
+        except CatalogError as err:
+            print('WARNING: {:s} - globbing files instead.'.format(str(err))) # fall back to globbing
+    if catalog is not None:
+        catdomain = args.domain[0] if args.domain else None
+        for filetype in filetypes:
+            for year in years:
+                if debug: print('DEBUG: catalog query: wrf{0}, domain {1}, year {2}'.format(filetype, catdomain, year))
+                list_of_files.extend(catalog.listFiles(filetype=filetype, domain=catdomain, 
+                                                       begindate='{0:04d}'.format(year), enddate='{0:04d}'.format(year+1)))
+        catalog.close() # don't share the connection with worker processes
+    elif mode == "WRF":
         for filetype in filetypes:
             for year in years:
                 pattern = "wrf{0}_{1}_{2}*".format(filetype, domain, year)
@@ -477,6 +494,15 @@ if __name__ == "__main__":
     pool = Pool(processes=nprocs, initializer=init, initargs=(lock,))
 
     returneddata = pool.map(partial_job_func, list_of_files)
+    
+    # update size and modification time of converted files in the catalog
+    if catalog is not None and not debug:
+        try:
+            catalog = WRFCatalog(comp_direc, lupdate=False)
+            catalog.updateFiles([item.fname for item in returneddata if item.pass1 and item.pass2])
+            catalog.close()
+        except CatalogError as err:
+            print('WARNING: {:s} - catalog will be updated next time.'.format(str(err)))
 
     pool.close()
 
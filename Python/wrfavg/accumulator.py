@@ -0,0 +1,61 @@
+'''
+Created on 2026-10-18
+
+A module providing reusable buffers for the accumulation of time sums in wrfout_average; sums are reduced
+into preallocated buffers and missing values are masked instead of copied.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+
+
+class ReductionBuffers(object):
+  '''
+    A set of reusable buffers for reductions along the time axis; buffers are allocated on first use and are
+    identified by purpose, shape and dtype (so that variables with the same shape share buffers).
+  '''
+
+  def __init__(self):
+    self.buffers = dict() # buffers by (purpose, shape, dtype)
+    self.nbytes = 0 # total size of allocated buffers (for diagnostics)
+
+  def getBuffer(self, purpose, shape, dtype):
+    ''' Return a buffer for the given purpose, shape and dtype (contents are undefined). '''
+    key = (purpose, tuple(shape), np.dtype(dtype))
+    if key not in self.buffers:
+      self.buffers[key] = np.empty(shape, dtype=dtype)
+      self.nbytes += self.buffers[key].nbytes
+    return self.buffers[key]
+
+  def addSum(self, acc, data, axis=0, missing_value=None):
+    ''' Add the sum of data along axis to the accumulator acc (in place); if missing_value is given, all elements
+        with a missing value along axis become NaN (the same result as summing after replacing missing values
+        with NaN). The accumulator can be a view (e.g. a band of a larger array). '''
+    # N.B.: the sum is not reduced directly into the accumulator, because acc + sum(data) is not the same as
+    #       adding the elements of data to acc one by one (rounding)
+    shape = [n for i,n in enumerate(data.shape) if i != axis]
+    sumbuf = self.getBuffer('sum', shape, np.sum(data[:0], axis=axis).dtype) # same dtype as a regular sum
+    np.sum(data, axis=axis, out=sumbuf)
+    if missing_value is not None:
+      eqbuf = self.getBuffer('equal', data.shape, np.bool_)
+      np.equal(data, missing_value, out=eqbuf)
+      mask = self.getBuffer('mask', shape, np.bool_)
+      np.logical_or.reduce(eqbuf, axis=axis, out=mask)
+      sumbuf[mask] = np.NaN # also works for views
+    np.add(acc, sumbuf, out=acc)
+    return acc
+
+  def clear(self):
+    ''' Release all buffers. '''
+    self.buffers = dict(); self.nbytes = 0
+
+
+def getAccumulatorDtype(dtype, dtype_float, missing_value=None, laccumulated=False):
+  ''' Return the dtype that the accumulator of a variable with the given dtype would have, if it was replaced by
+      the sum of a float array of zeros (dtype_float) and the time sums of the variable in every step. '''
+  tmp = np.zeros((1,1), dtype=dtype)
+  if laccumulated: return (-1 * tmp[0]).dtype # accumulated variables are initialized with the first time step
+  if missing_value is not None: tmp = np.where(tmp == missing_value, np.NaN, tmp) # same type as in the original code
+  return ( np.zeros((1,), dtype=dtype_float) + tmp.sum(axis=0) ).dtype
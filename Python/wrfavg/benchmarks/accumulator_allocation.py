@@ -0,0 +1,68 @@
+'''
+Created on 2026-10-18
+
+A microbenchmark of the accumulation of one month in wrfout_average: the bytes allocated by the original (copying)
+implementation are compared to the reusable buffers in wrfavg.accumulator, and the sums are checked for equality.
+Usage: python accumulator_allocation.py [nvar] [nfile]
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')) # the Python folder
+import numpy as np
+from time import time as clock
+from wrfavg.accumulator import ReductionBuffers, getAccumulatorDtype
+
+# settings
+nvar = int(sys.argv[1]) if len(sys.argv) > 1 else 50 # number of variables
+nfile = int(sys.argv[2]) if len(sys.argv) > 2 else 3 # input files per month
+shape = (40,10,60,80) # time steps per file, levels, south_north, west_east
+missing_value = -999.
+np.random.seed(1)
+slabs = [np.random.rand(*shape).astype('float32') for i in range(nfile)] # input data (same for every variable)
+for slab in slabs: slab[:,0,:10,:10] = missing_value # levels below ground
+
+class Counter(object):
+  ''' count the bytes of all arrays that are allocated in the accumulation (temporaries included) '''
+  def __init__(self): self.nbytes = 0
+  def __call__(self, array): self.nbytes += array.nbytes; return array
+
+def copyMonth(count):
+  ''' original implementation: re-allocate accumulators, copy with NaN and replace accumulators '''
+  data = [count(np.zeros(shape[1:], dtype='float32')) for i in range(nvar)]
+  for slab in slabs:
+    for i in range(nvar):
+      tmp = count(np.where(count(slab == missing_value), np.NaN, slab))
+      data[i] = count(data[i] + count(tmp.sum(axis=0)))
+  return data
+def bufferMonth(count, data, buffers):
+  ''' buffered implementation: zero accumulators and reduce in place with masks '''
+  nbytes = buffers.nbytes
+  for acc in data: acc.fill(0)
+  for slab in slabs:
+    for i in range(nvar): buffers.addSum(data[i], slab, axis=0, missing_value=missing_value)
+  count.nbytes += buffers.nbytes - nbytes # only new buffers
+  return data
+
+def measure(func, *args):
+  ''' return result, bytes allocated by func and run time '''
+  count = Counter()
+  t0 = clock(); result = func(count, *args); t1 = clock()
+  return result, count.nbytes, t1-t0
+
+# first month allocates buffers, the second month shows the steady state
+reference, ncopy, tcopy = measure(copyMonth)
+buffers = ReductionBuffers()
+data = [np.zeros(shape[1:], dtype=getAccumulatorDtype('float32', 'float32', missing_value)) for i in range(nvar)]
+result, nfirst, tfirst = measure(bufferMonth, data, buffers)
+result, nbuffer, tbuffer = measure(bufferMonth, data, buffers)
+# check results
+assert all([np.array_equal(np.isnan(a),np.isnan(b)) for a,b in zip(reference,result)])
+assert all([np.array_equal(a[~np.isnan(a)],b[~np.isnan(b)]) for a,b in zip(reference,result)])
+# report
+print('\n   Bytes allocated per month ({:d} variables, {:d} files of {:s}):'.format(nvar,nfile,str(shape)))
+print('   Copy/NaN (original): {:10.1f} MB   {:6.2f} s'.format(ncopy/1024.**2,tcopy))
+print('   Buffers (1st month): {:10.1f} MB   {:6.2f} s'.format(nfirst/1024.**2,tfirst))
+print('   Buffers (2nd month): {:10.1f} MB   {:6.2f} s\n'.format(nbuffer/1024.**2,tbuffer))
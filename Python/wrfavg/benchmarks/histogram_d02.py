@@ -0,0 +1,54 @@
+'''
+Created on 2026-10-18
+
+A benchmark of the per-gridpoint histograms (Histogram in derived_variables) on a d02-sized grid: the time per
+time step and the memory of the counts are reported for the default srfc bins, and the counts are checked.
+Usage: python histogram_d02.py [nslab] [nstep]
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')) # the Python folder
+import numpy as np
+from time import time as clock
+from wrfavg.histogram import linearBins, logBins
+from wrfavg.derived_variables import DerivedVariable, Histogram
+
+# settings
+nslab = int(sys.argv[1]) if len(sys.argv) > 1 else 3 # number of slabs (files)
+nstep = int(sys.argv[2]) if len(sys.argv) > 2 else 40 # time steps per slab
+shape = (nstep,261,210) # time steps, south_north, west_east (d02)
+axes = ('Time','south_north','west_east')
+np.random.seed(1)
+# default srfc bins (see histogram_variables in wrfout_average)
+rain = DerivedVariable(name='RAIN', units='kg/m^2/s', prerequisites=[], axes=axes, dtype=np.dtype('float32'))
+t2 = DerivedVariable(name='T2', units='K', prerequisites=[], axes=axes, dtype=np.dtype('float32'))
+cases = [(Histogram(rain, logBins(0.1/86400., 1000./86400., 40), scale='log'),
+          lambda: np.where(np.random.rand(*shape) < 0.6, 0., np.random.lognormal(-11., 2., shape)).astype('float32')),
+         (Histogram(t2, linearBins(200., 330., 130), scale='linear'),
+          lambda: ( 270. + 15.*np.random.randn(*shape) ).astype('float32'))]
+
+print('\n   Histograms on a {:d}x{:d} grid ({:d} slabs of {:d} time steps):'.format(shape[1],shape[2],nslab,nstep))
+for hist,sample in cases:
+  hist.checked = True # there is no input file to check prerequisites
+  varname = hist.prerequisites[0]
+  slabs = [sample() for i in xrange(nslab)]
+  tmp = dict()
+  t0 = clock()
+  for slab in slabs: counts = hist.computeValues({varname:slab}, aggax=0, delta=21600., tmp=tmp)
+  t1 = clock()
+  # check counts against a direct count of the bin indices (with open bins below and above the edges)
+  data = np.concatenate(slabs, axis=0).reshape((nslab*nstep,-1))
+  edges = np.concatenate([[-np.inf], hist.edges, [np.inf]])
+  for ipt in np.random.randint(0, data.shape[1], 100):
+    reference = np.histogram(data[:,ipt], bins=edges)[0]
+    assert np.array_equal(counts.reshape((counts.shape[0],-1))[:,ipt], reference), ipt
+  assert np.all(counts.sum(axis=0) == nslab*nstep)
+  # report
+  record = counts[0].size * counts.shape[0] * hist.dtype.itemsize # monthly record in the output file
+  print('   {:4s} {:3d} bins: {:5.1f} ms per time step; {:5.1f} MB of {:s} counts; {:5.1f} MB per {:s} record'.format(
+        varname, counts.shape[0], 1000.*(t1-t0)/(nslab*nstep), counts.nbytes/1024.**2, str(counts.dtype),
+        record/1024.**2, str(hist.dtype)))
+print('   (the monthly accumulator of the counts needs the same memory again)\n')
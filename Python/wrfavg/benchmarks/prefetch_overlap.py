@@ -0,0 +1,64 @@
+'''
+Created on 2026-10-18
+
+A benchmark of the background reader in wrfavg.prefetch with synthetic plev3d-sized files: the wall-clock time
+of reading and averaging in sequence is compared to reading in the background (the overlap of I/O and computation).
+Usage: python prefetch_overlap.py [nfile] [depth]
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, sys, shutil, tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')) # the Python folder
+import numpy as np
+from time import time
+import netCDF4 as nc
+from wrfavg.prefetch import PrefetchedDataset, FilePrefetcher
+
+# settings
+nfile = int(sys.argv[1]) if len(sys.argv) > 1 else 8 # number of files
+depth = int(sys.argv[2]) if len(sys.argv) > 2 else 1 # prefetch depth
+shape = (124,20,100,100) # 'monthly' 6-hourly plev3d-like file
+varlist = ['U_PL','V_PL','T_PL']
+
+# create synthetic files
+folder = tempfile.mkdtemp(prefix='prefetch_benchmark_') + '/'
+filelist = ['wrfplev3d_d01_1979-{:02d}-01_00:00:00'.format(i+1) for i in xrange(nfile)]
+print('\nCreating {:d} synthetic files in {:s}'.format(nfile,folder))
+for filename in filelist:
+  ds = nc.Dataset(folder+filename, 'w', format='NETCDF4')
+  for dim,size in zip(('Time','num_press_levels_stag','south_north','west_east'),shape):
+    ds.createDimension(dim,size)
+  for varname in varlist:
+    var = ds.createVariable(varname, 'f4', ('Time','num_press_levels_stag','south_north','west_east'))
+    var[:] = np.random.rand(*shape).astype('f4')
+  ds.close()
+
+def compute(dataset):
+  ''' stand-in for the averaging of one file '''
+  for varname in varlist:
+    tmp = dataset.variables[varname][:]
+    for i in xrange(3): tmp = np.sort(tmp, axis=-1) # numpy releases the GIL here
+
+try:
+  # sequential reference: read, then compute
+  t0 = time(); tread = 0.
+  for filename in filelist:
+    t1 = time(); dataset = PrefetchedDataset(folder+filename, varlist=varlist); tread += time() - t1
+    compute(dataset); dataset.close()
+  tseq = time() - t0
+  # with background reader
+  t0 = time(); twait = 0.
+  prefetcher = FilePrefetcher(filelist, folder=folder, varlist=varlist, depth=depth)
+  for filename in filelist:
+    t1 = time(); dataset = prefetcher.nextFile(filename); twait += time() - t1
+    compute(dataset); dataset.close()
+  prefetcher.close()
+  tpre = time() - t0
+  # report
+  print('\n   Sequential: {:6.2f} s   (time spent reading: {:6.2f} s)'.format(tseq,tread))
+  print('   Prefetched: {:6.2f} s   (time spent waiting: {:6.2f} s; depth={:d})'.format(tpre,twait,depth))
+  print('   Overlap:    {:6.2f} s   ({:3.0f}% of read time hidden)\n'.format(tseq-tpre,100.*(tseq-tpre)/tread))
+finally:
+  shutil.rmtree(folder)
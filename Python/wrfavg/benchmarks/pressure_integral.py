@@ -0,0 +1,61 @@
+'''
+Created on 2026-10-18
+
+A benchmark of vertical integrals on pressure levels: cached quadrature weights (pressureIntegral) are compared 
+to the original implementation with padded arrays and simps, including the difference of the results.
+Usage: python pressure_integral.py [nvar]
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')) # the Python folder
+import numpy as np
+from time import time as clock
+from scipy.integrate import simps
+from numexpr import evaluate
+from wrfavg.derived_variables import pressureIntegral, slabcache, dv_float
+
+# settings
+nvar = int(sys.argv[1]) if len(sys.argv) > 1 else 6 # number of integrals per slab (as in plev3d)
+shape = (40,12,60,80) # time steps, pressure levels, south_north, west_east
+np.random.seed(1)
+levels = np.linspace(950e2, 100e2, shape[1]).astype(dv_float) # below the lower boundary (1000 hPa)
+p = np.tile(levels, (shape[0],1))
+T = ( 220. + 70.*np.random.rand(*shape) ).astype(dv_float); T[:,0,:10,:10] = np.NaN # below ground
+variables = [np.random.rand(*shape).astype(dv_float) for i in range(nvar)]
+RMg = np.asarray( 8.3144621 / ( 0.01802 *  9.80616 ), dtype=dv_float)
+
+def paddedIntegral(var, T, p, RMg):
+  ''' original implementation: padded copy, padded axis and simps for every integral '''
+  tmpshape = list(T.shape); tmpshape[1] += 2
+  tmpdata = np.zeros(tmpshape, dtype=dv_float)
+  pax = np.zeros((tmpshape[1],), dtype=dv_float)
+  pax[1:-1] = p[0,:]; pax[0] = 1.e5; pax[-1] = 0.
+  pax = -1 * pax
+  p = p.reshape(p.shape+(1,1))
+  var = np.nan_to_num(var); T = np.nan_to_num(T)
+  tmpdata[:,1:-1,:] = evaluate('RMg * var * T / p')
+  return simps(tmpdata, pax, axis=1, even='first')
+
+def measure(func):
+  ''' return results and run time of one slab '''
+  t0 = clock(); results = [func(var, T, p, RMg) for var in variables]; t1 = clock()
+  slabcache.clear()
+  return results, t1-t0
+
+reference, tpad = measure(paddedIntegral)
+simpson, tfirst = measure(pressureIntegral) # includes computation of weights
+simpson, tweights = measure(pressureIntegral)
+trapezoid, ttrapz = measure(lambda *args: pressureIntegral(*args, rule='trapezoid'))
+# check results (float32 tolerance)
+error = max([np.abs(a-b).max()/np.abs(a).max() for a,b in zip(reference,simpson)])
+assert error < 1.e-5, error
+trerror = max([np.abs(a-b).max()/np.abs(a).max() for a,b in zip(reference,trapezoid)])
+# report
+print('\n   Vertical integrals per slab ({:d} variables of {:s}):'.format(nvar,str(shape)))
+print('   Padded/simps (original): {:6.3f} s'.format(tpad))
+print('   Weights (1st slab):      {:6.3f} s'.format(tfirst))
+print('   Weights (Simpson):       {:6.3f} s   (max. relative difference: {:.1e})'.format(tweights,error))
+print('   Weights (trapezoid):     {:6.3f} s   (max. relative difference: {:.1e})\n'.format(ttrapz,trerror))
@@ -0,0 +1,64 @@
+'''
+Created on 2026-10-18
+
+A regression test and benchmark of the finite-difference stencils in wrfavg.stencil: centredDiff is checked 
+against the original ctrDiff on all axes (equal up to rounding) and vorticity is timed on 4-D plev fields.
+Usage: python stencil_regression.py [nrep]
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')) # the Python folder
+import numpy as np
+from time import time as clock
+from wrfavg.derived_variables import ctrDiff # original implementation
+from wrfavg.stencil import centredDiff, forwardDiff, backwardDiff, stencil_float
+
+# settings
+nrep = int(sys.argv[1]) if len(sys.argv) > 1 else 5 # number of repetitions
+shape = (40,12,100,120) # time steps, pressure levels, south_north, west_east
+np.random.seed(1)
+U = np.random.randn(*shape).astype(stencil_float); V = np.random.randn(*shape).astype(stencil_float)
+DX = DY = np.float32(30.e3)
+mapfac = ( 1. + 0.1*np.random.rand(1,shape[2],shape[3]) ).astype(stencil_float)
+
+# regression test: all axes, with and without grid spacing, small and large values (e.g. geopotential height)
+G = ( 5500. + 30.*np.random.randn(shape[0],shape[1],20,30) ).astype(stencil_float)
+maxerr = 0.
+for data in (U, V[:,:,:7,:9], U[:3,:2,:2,:1], G):
+  for axis in range(data.ndim):
+    for delta in (1, DX):
+      reference = ctrDiff(data, axis=axis, delta=delta); result = centredDiff(data, axis=axis, delta=delta)
+      assert reference.dtype == result.dtype
+      # N.B.: ctrDiff adds the two one-sided differences, so results are only equal up to the rounding of the 
+      #       data, i.e. the error is measured relative to the values (divided by the grid spacing)
+      error = np.abs(reference-result).max() * delta / np.abs(data).max()
+      assert error < 1.e-6, (data.shape, axis, delta, error)
+      maxerr = max(maxerr, error)
+assert np.allclose(forwardDiff(U, axis=2)[:,:,:-1], np.diff(U, axis=2))
+assert np.allclose(backwardDiff(U, axis=3)[:,:,:,1:], np.diff(U, axis=3))
+
+# benchmark: vorticity (without map-scale factors)
+def ctrVorticity(out):
+  return ctrDiff(V, axis=3, delta=DX) - ctrDiff(U, axis=2, delta=DY)
+def stencilVorticity(out, buf):
+  centredDiff(V, axis=3, delta=DX, out=out); centredDiff(U, axis=2, delta=DY, out=buf)
+  return np.subtract(out, buf, out=out)
+out = np.empty(shape, dtype=stencil_float); buf = np.empty(shape, dtype=stencil_float)
+t0 = clock()
+for i in range(nrep): reference = ctrVorticity(out)
+t1 = clock()
+for i in range(nrep): result = stencilVorticity(out, buf)
+t2 = clock()
+assert np.abs(reference-result).max() < 1.e-6*np.abs(reference).max()
+t3 = clock()
+for i in range(nrep): result = stencilVorticity(out, buf); np.multiply(out, mapfac, out=out)
+t4 = clock()
+# report
+print('\n   centredDiff vs. ctrDiff: max. difference {:.1e} (relative to the values)'.format(maxerr))
+print('\n   Vorticity of {:s} fields ({:d} repetitions):'.format(str(shape),nrep))
+print('   ctrDiff (original):      {:6.3f} s'.format(t1-t0))
+print('   Stencils with buffers:   {:6.3f} s'.format(t2-t1))
+print('   ... with map factors:    {:6.3f} s\n'.format(t4-t3))
@@ -0,0 +1,179 @@
+'''
+Created on 2026-10-18
+
+A module providing a persistent catalog (SQLite) of WRF output files and their time coverage, which is 
+updated incrementally, so that only new or growing files have to be opened.
+
+N.B.: this module is also used by netCDFcompressor.py, which runs with Python 3, so it has to be compatible.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, re, sqlite3
+import netCDF4 as nc
+
+# default name of the catalog file (in the WRF output folder)
+catalogname = 'wrfcatalog.sqlite'
+# regular expression to identify WRF output files and extract filetype, domain and date
+filergx = re.compile(r'^wrf(\w+)_d(\d\d)_(\d\d\d\d-\d\d-\d\d_\d\d[_:]\d\d[_:]\d\d)(?:\.nc$|$)')
+# WRF variable and dimension names
+wrftimestamp = 'Times'; wrftime = 'Time'
+# columns of the file table
+columns = ('filename', 'filetype', 'domain', 'filedate', 'firststamp', 'laststamp', 'nrec', 'size', 'mtime')
+
+
+# class for errors with the catalog
+class CatalogError(Exception):
+  ''' Exceptions related to the WRF file catalog. '''
+  pass
+
+
+def readFileInfo(filepath):
+  ''' read first and last time-stamp and number of records from a WRF output file (None, if not readable) '''
+  try:
+    ds = nc.Dataset(filepath, 'r')
+    try:
+      nrec = len(ds.dimensions[wrftime])
+      if nrec > 0 and wrftimestamp in ds.variables:
+        times = ds.variables[wrftimestamp]
+        firststamp = ''.join(c.decode() if isinstance(c,bytes) else c for c in times[0,:])
+        laststamp = ''.join(c.decode() if isinstance(c,bytes) else c for c in times[nrec-1,:]) # no negative indexing
+      else: firststamp = laststamp = None
+    finally: ds.close()
+  except (IOError, RuntimeError, KeyError):
+    nrec = firststamp = laststamp = None # file is incomplete or not a NetCDF file (will be retried)
+  return firststamp, laststamp, nrec
+
+
+class WRFCatalog(object):
+  '''
+    A persistent catalog of WRF output files in a folder, with time coverage of each file.
+    Files are listed in temporal order, based on the date in the filename.
+  '''
+
+  def __init__(self, folder, filename=catalogname, lupdate=True, lcheck=False, ltimes=True):
+    ''' Open (or create) the catalog and update it (lcheck: also check existing files for modifications;
+        ltimes: open new files to read time-stamps). '''
+    self.folder = os.path.abspath(folder)
+    self.filepath = os.path.join(self.folder, filename)
+    self.ltimes = ltimes
+    self.db = None
+    try:
+      try: self._connect()
+      except sqlite3.OperationalError: raise # not writable or locked: don't touch the file
+      except sqlite3.DatabaseError:
+        # the catalog is corrupted, but it is just a cache and can be recreated
+        if self.db is not None: self.db.close()
+        if os.path.exists(self.filepath): os.remove(self.filepath)
+        self._connect()
+      if lupdate: self.update(lcheck=lcheck)
+    except sqlite3.OperationalError as err:
+      # N.B.: the folder is not writable or the catalog is locked by another process (e.g. after the timeout)
+      if self.db is not None: self.db.close()
+      raise CatalogError("Catalog '{:s}' is not accessible: {:s}".format(self.filepath, str(err)))
+
+  def _connect(self):
+    ''' Connect to the database and create tables, if necessary. '''
+    self.db = sqlite3.connect(self.filepath, timeout=60.)
+    # N.B.: a persistent journal is only created once, so that the folder is not modified with every update
+    #       (which would trigger a rescan every time); other journal modes are not safe, if the catalog is
+    #       shared by several processes
+    self.db.execute('PRAGMA journal_mode=PERSIST')
+    self.db.execute('CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, filetype TEXT, domain INTEGER, ' +
+                    'filedate TEXT, firststamp TEXT, laststamp TEXT, nrec INTEGER, size INTEGER, mtime REAL)')
+    self.db.execute('CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value REAL)')
+    self.db.commit()
+
+  def _getInfo(self, key):
+    row = self.db.execute('SELECT value FROM info WHERE key=?', (key,)).fetchone()
+    return None if row is None else row[0]
+
+  def _setInfo(self, key, value):
+    self.db.execute('INSERT OR REPLACE INTO info (key, value) VALUES (?,?)', (key,value))
+
+  def _statFiles(self, filenames, lforce=False):
+    ''' Stat files and (re-)read time-stamps of new or modified files; returns number of updated entries. '''
+    nupdate = 0
+    for filename in filenames:
+      match = filergx.match(filename)
+      if match is None: continue
+      filetype, domain, filedate = match.groups()
+      try: stat = os.stat(os.path.join(self.folder,filename))
+      except OSError:
+        self.db.execute('DELETE FROM files WHERE filename=?', (filename,)); continue # file was removed
+      row = self.db.execute('SELECT size, mtime, nrec FROM files WHERE filename=?', (filename,)).fetchone()
+      # only read file, if it is new, modified or was not readable before
+      if lforce or row is None or row[0] != stat.st_size or row[1] != stat.st_mtime or (self.ltimes and row[2] is None):
+        if self.ltimes: firststamp, laststamp, nrec = readFileInfo(os.path.join(self.folder,filename))
+        else: firststamp = laststamp = nrec = None
+        self.db.execute('INSERT OR REPLACE INTO files ({:s}) VALUES (?,?,?,?,?,?,?,?,?)'.format(','.join(columns)),
+                        (filename, filetype, int(domain), filedate, firststamp, laststamp, nrec, stat.st_size, stat.st_mtime))
+        nupdate += 1
+    return nupdate
+
+  def update(self, lcheck=False):
+    ''' Update the catalog from the folder; the folder is only listed, if it was modified since the last update
+        (lcheck: list folder and check all files for modifications). Returns the number of updated entries. '''
+    # N.B.: record the modification time before listing, so that files added during the update trigger a rescan
+    mtime = os.stat(self.folder).st_mtime
+    nupdate = 0
+    if lcheck or mtime != self._getInfo('folder_mtime'):
+      filenames = set(filename for filename in os.listdir(self.folder) if filergx.match(filename))
+      catalogued = set(row[0] for row in self.db.execute('SELECT filename FROM files'))
+      # remove files that no longer exist and add new files
+      for filename in catalogued - filenames:
+        self.db.execute('DELETE FROM files WHERE filename=?', (filename,)); nupdate += 1
+      nupdate += self._statFiles(sorted(filenames if lcheck else filenames - catalogued))
+    # the latest file of each filetype and domain may still be growing
+    latest = self.db.execute('SELECT MAX(filename) FROM files GROUP BY filetype, domain').fetchall()
+    nupdate += self._statFiles([row[0] for row in latest])
+    self._setInfo('folder_mtime', mtime)
+    self.db.commit()
+    return nupdate
+
+  def updateFiles(self, filenames):
+    ''' Re-read the given files (e.g. after they were modified); returns the number of updated entries. '''
+    nupdate = self._statFiles([os.path.basename(filename) for filename in filenames], lforce=True)
+    self.db.commit()
+    return nupdate
+
+  def _select(self, fields, filetype=None, domain=None, begindate=None, enddate=None):
+    ''' Helper method to query the file table; dates are compared to the date in the filename. '''
+    conditions = []; values = []
+    if filetype is not None: conditions.append('filetype=?'); values.append(filetype)
+    if domain is not None: conditions.append('domain=?'); values.append(int(domain))
+    if begindate is not None: conditions.append('filedate>=?'); values.append(begindate)
+    if enddate is not None: conditions.append('filedate<?'); values.append(enddate)
+    query = 'SELECT {:s} FROM files'.format(fields)
+    if conditions: query += ' WHERE ' + ' AND '.join(conditions)
+    return self.db.execute(query + ' ORDER BY filedate, filename', values).fetchall()
+
+  def listFiles(self, filetype=None, domain=None, begindate=None, enddate=None):
+    ''' Return a list of files in temporal order (begindate is inclusive, enddate is exclusive; dates can be
+        truncated, e.g. '1979' or '1979-01'). '''
+    return [str(row[0]) for row in self._select('filename', filetype=filetype, domain=domain,
+                                                begindate=begindate, enddate=enddate)]
+
+  def getRecord(self, filename):
+    ''' Return the catalog entry of a file as a dictionary (None, if the file is not in the catalog). '''
+    row = self.db.execute('SELECT {:s} FROM files WHERE filename=?'.format(','.join(columns)), (filename,)).fetchone()
+    return None if row is None else dict(zip(columns,row))
+
+  def getTotalSize(self, filelist):
+    ''' Return the total size of the files in the list in bytes (files that are not in the catalog are ignored). '''
+    nbytes = 0
+    for filename in filelist:
+      row = self.db.execute('SELECT size FROM files WHERE filename=?', (filename,)).fetchone()
+      if row is not None and row[0] is not None: nbytes += row[0]
+    return nbytes
+
+  def getTimeRange(self, filelist):
+    ''' Return the first time-stamp of the first file and the last time-stamp of the last file in the list. '''
+    first = self.getRecord(filelist[0]); last = self.getRecord(filelist[-1])
+    if first is None or last is None or first['firststamp'] is None or last['laststamp'] is None:
+      raise CatalogError("Time-stamps of files '{:s}' and '{:s}' are not available.".format(filelist[0],filelist[-1]))
+    return str(first['firststamp']), str(last['laststamp'])
+
+  def close(self):
+    self.db.close()
@@ -13,67 +13,54 @@ points during the averaging process.
 import netCDF4 as nc
 import numpy as np
 from scipy.integrate import simps # Simpson rule for integration
-import calendar
-from datetime import datetime
+from collections import OrderedDict
 from numexpr import evaluate, set_num_threads, set_vml_num_threads
+from numexpr.necompiler import getExprNames
 # numexpr parallelisation: don't parallelize at this point!
 set_num_threads(1); set_vml_num_threads(1)
 # my own netcdf stuff
 from utils.nctools import add_var
+# finite-difference stencils
+from wrfavg.stencil import centredDiff
+from wrfavg.accumulator import ReductionBuffers
+# decoding of time stamps
+from wrfavg.timeaxis import TimeAxis
+# streaming moments
+from wrfavg.moments import slabMoments, mergeMoments, getMoment
+from wrfavg.histogram import binIndex, addCounts, histogramQuantiles, errorBound, count_dtype
 
 # days per month without leap days (duplicate from datasets.common) 
 days_per_month_365 = np.array([31,28,31,30,31,30,31,31,30,31,30,31])
 # N.B.: importing from datasets.common causes problems with GDAL, if it is not installed
 dv_float = np.dtype('float32') # final precision used for derived floating point variables 
 dtype_float = dv_float # general floating point precision used for temporary arrays
+fused_blockbytes = 4*1024**2 # size of the blocks of fused expression evaluations (should fit into the cache)
+runlength_blockbytes = 16*1024**2 # size of the work arrays of batched run-length computations (consecutive extrema)
 # dryday_threshold = 0.2/86400. # precip treshold for a dry day 0.2 mm/day
 
 
-def calcTimeDelta(timestamps, year=None, month=None):
-  ''' function to calculate time deltas and subtract leap-days, if necessary '''
-  # check dates
-  y1, m1, d1 = tuple( int(i) for i in timestamps[0][:10].split('-') )
-  y2, m2, d2 = tuple( int(i) for i in timestamps[-1][:10].split('-') )
-  # the first timestamp has to be of this year and month, last can be one ahead
-  if year is None: year = y1 
-  else: assert year == y1
-  assert ( year == y2 or year+1 == y2 )
-  if month is None: month = m1 
-  else: assert month == m1 
-  assert  ( month == m2 or np.mod(month,12)+1 == m2 )                
-  # determine interval                
-  dt1 = datetime.strptime(timestamps[0], '%Y-%m-%d_%H:%M:%S')
-  dt2 = datetime.strptime(timestamps[-1], '%Y-%m-%d_%H:%M:%S')
-  delta = float( (dt2-dt1).total_seconds() ) # the difference creates a timedelta object
-  n = len(timestamps)
-  # check if leap-day is present
-  if month == 2 and calendar.isleap(year):
-    ld = datetime(year, 2, 29) # datetime of leap day
-    # whether to subtract the leap day                  
-    if ( d1 == 29 or  d2 == 29 ): 
-      lsubld = False  # trivial case; will be handled correctly by datetime
-    elif dt1 < ld < dt2:
-      # a leap day should be there; if not, then subtract it
-      ild = int( ( n - 1 ) * float( ( ld - dt1 ).total_seconds() ) / delta ) # index of leap-day
-      lsubld = True # subtract, unless leap day is found, sicne it should be there
-      # search through timestamps for leap day
-      while lsubld and ild < n:
-        yy, mm, dd = tuple( int(i) for i in timestamps[ild][:10].split('-') )
-        if mm == 3: break
-        assert yy == year and mm == 2
-        # check if a leap day is present (if, then don't subtract)
-        if dd == 29: lsubld = False
-        ild += 1 # increment leap day search
-    else: 
-      lsubld = False # no leap day in itnerval, no need to correct period 
-    if lsubld: delta -= 86400. # subtract leap day from period 
-  # return leap-day-checked period
-  return delta
+def joinTimeStamps(times):
+  ''' helper routine to join the characters of a WRF Times array (time, DateStrLen) into time-stamp strings '''
+  times = np.ascontiguousarray(times, dtype='S1') # also removes masks
+  return times.view('S{:d}'.format(times.shape[-1])).reshape(times.shape[:-1])
+
+
+def calcTimeDelta(timestamps, year=None, month=None, timeaxis=None):
+  ''' function to calculate time deltas and subtract leap-days, if necessary; timestamps can be time-stamp 
+      strings or decoded times (integer minutes on timeaxis, see TimeAxis.minutes) '''
+  # decode time-stamps, if necessary
+  if timeaxis is None: 
+    timeaxis = TimeAxis() # proleptic Gregorian calendar
+    times = timeaxis.minutes(timestamps)
+  else: times = timestamps
+  # return leap-day-checked period (in seconds)
+  return timeaxis.timeDelta(times, year=year, month=month)
               
 
 def ctrDiff(data, axis=0, delta=1):
   ''' helper routine to compute central differences
-      N.B.: due to the roll operation, this function is not fully thread-safe '''
+      N.B.: due to the roll operation, this function is not fully thread-safe; superseded by 
+            stencil.centredDiff (kept as the reference for benchmarks/stencil_regression.py) '''
   if not isinstance(data,np.ndarray): raise TypeError
   if not isinstance(delta,(float,np.inexact,int,np.integer)): raise TypeError
   if not isinstance(axis,(int,np.integer)): raise TypeError
@@ -101,31 +88,121 @@ def ctrDiff(data, axis=0, delta=1):
   return outdata
 
 
-def pressureIntegral(var, T, p, RMg):
+class SlabCache(object):
+  '''
+    A cache for intermediate results that are shared by several derived variables within one slab (e.g. the 
+    mass-weighting of column integrals); entries are keyed by the name of the computation (or expression) and the 
+    identity of the input arrays (scalars by value). The cache has to be cleared after each slab; hit counts are
+    accumulated, so that the savings can be reported.
+  '''
+
+  def __init__(self):
+    self.entries = dict() # results and inputs by key
+    self.hits = dict(); self.misses = dict() # counts by name
+
+  def _key(self, name, inputs):
+    ''' arrays are identified by id, scalars and tuples (e.g. shapes) by value '''
+    key = [name]
+    for arg in inputs:
+      if isinstance(arg,np.ndarray) and arg.ndim > 0: key.append(id(arg))
+      elif isinstance(arg,np.ndarray): key.append(arg.item())
+      else: key.append(arg)
+    return tuple(key)
+
+  def get(self, name, inputs, function):
+    ''' Return the cached result of function(*inputs) or compute and cache it. '''
+    key = self._key(name, inputs)
+    if key in self.entries:
+      self.hits[name] = self.hits.get(name,0) + 1
+      return self.entries[key][0]
+    self.misses[name] = self.misses.get(name,0) + 1
+    result = function(*inputs)
+    # N.B.: references to the inputs are kept, so that their ids can not be reused while the entry is cached
+    self.entries[key] = (result, inputs)
+    return result
+
+  def evaluate(self, expression, **arrays):
+    ''' Evaluate a numexpr expression or return the cached result (arrays are passed by name). '''
+    names = sorted(arrays.keys())
+    return self.get(expression, [arrays[name] for name in names], 
+                    lambda *args: evaluate(expression, local_dict=dict(zip(names,args))))
+
+  def discard(self, array):
+    ''' Remove all entries that depend on array, directly or through other entries (e.g. when it is released). '''
+    arrays = [array]
+    while arrays:
+      array = arrays.pop()
+      for key,(result,inputs) in self.entries.items():
+        if any([arg is array for arg in inputs]):
+          del self.entries[key]; arrays.append(result)
+
+  def clear(self):
+    ''' Remove all entries (after each slab); hit counts are kept. '''
+    self.entries = dict()
+
+  def reset(self):
+    ''' Remove all entries and reset hit counts. '''
+    self.entries = dict(); self.hits = dict(); self.misses = dict()
+
+  def report(self):
+    ''' Return a printable summary of hits and misses (empty, if the cache was not used). '''
+    return '\n'.join(['  {:s}: {:d} hits, {:d} misses'.format(name, self.hits.get(name,0), self.misses[name]) 
+                      for name in sorted(self.misses.keys())])
+
+# the cache used by derived variables in the current process
+slabcache = SlabCache()
+
+
+def pressureAxis(p):
+  ''' helper routine to construct the extended (inverted) pressure axis for vertical integrals '''
+  assert np.all( np.diff(p[0,:]) < 0 ), 'The pressure axis has to decrease monotonically'    
+  pax = np.zeros((p.shape[1]+2,), dtype=dv_float)
+  pax[1:-1] = p[0,:]; pax[0] = 1.e5; pax[-1] = 0. # pad with zero-boundaries
+  pax = -1 * pax # invert, since we are integrating in the wrong direction
+  return pax
+
+
+# quadrature weights for vertical integrals by pressure levels and rule (the levels are fixed for a run)
+quadrature_weights = dict()
+
+def quadratureWeights(levels, rule='simpson'):
+  ''' helper routine to compute (and cache) the weights of the vertical integration on the extended pressure 
+      axis (rule: 'simpson' or 'trapezoid'); since the integration is linear, the weights are the integrals of 
+      the unit vectors; only the weights of the interior levels are returned (the boundary levels are zero) '''
+  key = (tuple(levels), rule)
+  if key not in quadrature_weights:
+    pax = pressureAxis(np.asarray(levels).reshape((1,-1)))
+    unit = np.eye(len(pax), dtype=dv_float)
+    if rule == 'simpson': weights = simps(unit, pax, axis=1, even='first') # even intervals anyway...
+    elif rule == 'trapezoid': weights = np.trapz(unit, pax, axis=1)
+    else: raise DerivedVariableError, "Unknown quadrature rule '{:s}'.".format(rule)
+    quadrature_weights[key] = np.asarray(weights[1:-1], dtype=dv_float)
+  return quadrature_weights[key]
+
+
+def pressureIntegral(var, T, p, RMg, rule='simpson', cache=None):
   ''' helper routine to compute mass-weighted vertical integrals 
-      (currently only works on pressure levels) '''
-  # allocate extended array with boundary points
+      (currently only works on pressure levels); the mass-weighting and the integrals are shared through 
+      the slab cache (all integrals in a slab use the same temperature and pressure) '''
+  cache = slabcache if cache is None else cache
+  return cache.get('pressureIntegral', (var, T, p, RMg, rule), lambda *args: _pressureIntegral(*args, cache=cache))
+
+def _pressureIntegral(var, T, p, RMg, rule='simpson', cache=None):
+  ''' the actual integration (see pressureIntegral) '''
   # make sure dimensions fit (pressure is the second dimension)
   assert T.ndim == 4 and p.ndim == 2 
   assert T.shape[:2] == p.shape # tuple comparison doesn't require all()
-  # make temporary array (first and last plev are just zero: boundary conditions)
-  tmpshape = list(T.shape)
-  tmpshape[1] += 2 # add two levels (integral boundaries)
-  tmpdata = np.zeros(tmpshape, dtype=dv_float)
-  # make extended plev axis
-  assert np.all( np.diff(p[0,:]) < 0 ), 'The pressure axis has to decrease monotonically'    
-  pax = np.zeros((tmpshape[1],), dtype=dv_float)
-  pax[1:-1] = p[0,:]; pax[0] = 1.e5; pax[-1] = 0. # pad with zero-boundaries
-  pax = -1 * pax # invert, since we are integrating in the wrong direction
-  # compute pressure/mass-weighted flux at each (non-boundary) level       
-  p = p.reshape(p.shape+(1,1)) # extend singleton dimensions
-  # fill missing values/NaN with zeros to allow integration
-  var = np.nan_to_num(var); T = np.nan_to_num(T)
-  # compute mass-weighted variable
-  tmpdata[:,1:-1,:] = evaluate('RMg * var * T / p') # first and last are zero
-  # integrate using Simpson rule
-  outdata = simps(tmpdata, pax, axis=1, even='first') # even intervals anyway...
-  # N.B.: outer dimensions (i.e. the first and second) are broadcast automatically, which is what we want here 
+  # N.B.: the boundary levels of the extended plev axis are zero, so only the interior weights are needed
+  weights = quadratureWeights(p[0,:], rule=rule)
+  # compute pressure/mass-weighted flux at each level; missing values/NaN are replaced by zeros, 
+  # to allow integration (without copies of the input)
+  # N.B.: the mass-weighting is the same for all variables (RMg*var*T/p is only equal up to rounding) 
+  p4d = cache.get('reshape', (p,), lambda p: p.reshape(p.shape+(1,1))) # extend singleton dimensions
+  massweight = cache.evaluate('RMg * where(T != T, 0, T) / p', RMg=RMg, T=T, p=p4d)
+  tmpdata = np.empty(T.shape, dtype=dv_float)
+  evaluate('where(var != var, 0, var) * massweight', out=tmpdata, casting='unsafe')
+  # integrate: weighted sum over levels
+  outdata = np.einsum('ijkl,j->ikl', tmpdata, weights)
   return outdata
 
 
@@ -135,8 +212,8 @@ class DerivedVariableError(Exception):
   pass
 
 
-# N.B.: this could have been implemented much more efficiently, without the need for separate classes,
-#       using a numexpr string and the variable dicts to define the computation 
+# N.B.: variables that can be computed from a single numexpr string are also defined declaratively in the
+#       expression registry below (ExpressionVariable); the classes remain for stencil/stateful computations
 
 # derived variable base class
 class DerivedVariable(object):
@@ -159,6 +236,9 @@ class DerivedVariable(object):
     self.checked = False # indicates whether prerequisites were checked
     self.tmpdata = None # handle for temporary storage
     self.carryover = False # carry over temporary storage to next month
+    self.leaddata = None # handle for the state at the beginning of a chunk (only used when processing in chunks)
+    self.bandstate = False # temporary storage is pointwise, so it can be kept separately for each band
+    self.dimsizes = dict() # sizes of dimensions that are not in the input files (e.g. histogram bins)
     # set NetCDF attributes
     self.axes = axes # dimensions of NetCDF variable 
     self.dtype = dtype # data type of NetCDF variable
@@ -243,6 +323,36 @@ class DerivedVariable(object):
     # return aggregated value for further treatment
     return aggdata 
 
+  # N.B.: when months are processed in chunks, the state that is carried over from the end of the previous chunk is 
+  #       not available; variables that carry over a state instead track their state at the beginning of the chunk
+  #       (the lead) and the month in which it ended; both boundary states are saved at the end of the chunk and 
+  #       joined, when the partial files are merged (in time order)
+  def startChunk(self, offset):
+    ''' Prepare processing in chunks; offset is the beginning of the chunk in seconds since the beginning of the 
+        first chunk. Variables that carry over a state to the next month have to overload the boundary methods. '''
+    if self.carryover: 
+      raise DerivedVariableError, "Variable '%s' can not be processed in chunks."%(self.name)
+    
+  def leadComplete(self, tmp):
+    ''' Return a mask of points where the lead has ended (None, if there is no lead). '''
+    return None
+  
+  def boundaryState(self, tmp, month=None):
+    ''' Return a dictionary with the boundary states at the end of the chunk, which are saved to the carry-over 
+        file; month is the month in which the lead ended (None, if it did not end). '''
+    return None
+  
+  @staticmethod
+  def joinBoundary(vardata, irec, prev, state):
+    ''' Join the lead of a chunk (state) with the state at the end of the previous chunk (prev) in record irec
+        of the partial file and return the joined record. '''
+    return vardata
+  
+  @staticmethod
+  def carryBoundary(prev, state):
+    ''' Return the state at the end of a chunk, including the states of previous chunks (prev). '''
+    return state
+
 
 ## regular derived variables
   
@@ -290,8 +400,8 @@ class RainMean(DerivedVariable):
 class TimeOfConvection(DerivedVariable):
   ''' DerivedVariable child implementing computation of total daily precipitation for WRF output. '''
   
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
+  def __init__(self, calendar='proleptic_gregorian'):
+    ''' Initialize with fixed values; the calendar is used to decode time stamps. '''
     super(TimeOfConvection,self).__init__(name='TimeOfConvection', # name of the variable
                               units='s', # units in wrfout are actually minutes
                               prerequisites=['TRAINCVMAX', 'Times'], # it's the sum of these two 
@@ -299,6 +409,7 @@ class TimeOfConvection(DerivedVariable):
                               constants=['XLONG'], # local longitudes
                               dtype=dv_float, atts=None, linear=False, ignoreNaN=True) 
     self.time_offset = 0 # shift clock 6 hours back, to avoid errors from averaging over midnight
+    self.calendar = calendar
     
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute total precipitation as the sum of convective  and non-convective precipitation. '''
@@ -314,13 +425,10 @@ class TimeOfConvection(DerivedVariable):
     else: xlon = const['XLONG_360']
     # save time of simulation start
     if 'TimeOfSimulationStart' not in const: 
-      # this is the first time step
-      toss = datetime.strptime(times[0], '%Y-%m-%d_%H:%M:%S')
+      # this is the first time step; times are counted in minutes since this time step
+      toss = TimeAxis(origin=times[0], calendar=self.calendar)
       # 0-UTC correction, if ToSS is not 0 UTC 
-      if times[0][10:] !='_00:00:00':
-        dtoss = int( (toss - datetime.strptime(times[0][:10], '%Y-%m-%d')).total_seconds() //60 ) # in minutes
-        #raise NotImplementedError, "Simulation has to start at 0 UTC."
-      else: dtoss = 0
+      dtoss = toss.origin % 1440 # in minutes (the origin is counted from 0 UTC)
       # apply time offset
       dtoss += self.time_offset
       # save values for later use
@@ -331,10 +439,10 @@ class TimeOfConvection(DerivedVariable):
       toss = const['TimeOfSimulationStart']
       dtoss = const['DeltaToSS']
     # compute time delta to ToSS
-    deltas = np.asarray([(datetime.strptime(time, '%Y-%m-%d_%H:%M:%S') - toss).total_seconds()//60 for time in times], dtype='int')
-    deltas = deltas.reshape((len(deltas),1,1)) # add singleton spatial dimensions for broadcasting
+    deltas = toss.minutes(times) # vectorized
     if not np.all( np.diff(deltas) == 1440 ):
       raise NotImplementedError, 'TimeOfConvection only works with daily output intervals!'
+    deltas = deltas.reshape((len(deltas),1,1)) # add singleton spatial dimensions for broadcasting
     deltas -= 1440 # go back one day (convection happened during the previous day)
     # isolate time of day and remove days that didn't rain
     tod = tcv - deltas
@@ -521,12 +629,7 @@ class WetDays(DerivedVariable):
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
     ''' Count the number of events above a threshold. '''
     super(WetDays,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # check that delta does not change!
-    if tmp is not None:
-      if 'WETDAYS_DELTA' in tmp: 
-        if delta != tmp['WETDAYS_DELTA']: 
-          raise NotImplementedError, 'Output interval is assumed to be constant for conversion to days. (delta={:f})'.format(delta)
-      else: tmp['WETDAYS_DELTA'] = delta # save and check next time
+    self.checkDelta(delta, tmp)
     # sampling does not have to be daily
     if self.ignoreNaN:
       outdata = np.where(indata[self.rain] > self.threshold, 1,0) # comparisons with NaN always yield False
@@ -536,6 +639,14 @@ class WetDays(DerivedVariable):
     # N.B.: this is actually the fraction of wet days in a month (i.e. not really days)      
     return outdata
 
+  def checkDelta(self, delta, tmp):
+    ''' Check that delta does not change! '''
+    if tmp is not None:
+      if 'WETDAYS_DELTA' in tmp: 
+        if delta != tmp['WETDAYS_DELTA']: 
+          raise NotImplementedError, 'Output interval is assumed to be constant for conversion to days. (delta={:f})'.format(delta)
+      else: tmp['WETDAYS_DELTA'] = delta # save and check next time
+
 
 class WetDayRain(DerivedVariable):
   ''' DerivedVariable child for precipitation amounts exceeding the rainy day threshold. '''
@@ -551,6 +662,7 @@ class WetDayRain(DerivedVariable):
                               prerequisites=[rain,wetdays], # above threshold 
                               axes=('time','south_north','west_east'), # dimensions of NetCDF variable 
                               dtype=dv_float, atts=atts, linear=False, ignoreNaN=ignoreNaN)
+    self.threshold = threshold # only used in batched computations (WetDayGroup)
     self.rain = rain # name of the rain variable
     self.wetdays = wetdays 
     
@@ -563,6 +675,62 @@ class WetDayRain(DerivedVariable):
     return outdata
 
 
+class WetDayGroup(object):
+  '''
+    A group of wet-day variables (WetDays and WetDayRain) of the same rain variable with different thresholds, which 
+    are computed in one pass: the rank of every rain value among the sorted thresholds is determined once, and the 
+    number of wet steps and the conditional rain sums of all thresholds follow from a histogram of ranks for every 
+    grid point (np.bincount) and a cumulative sum over thresholds. The results are time sums with a time axis of
+    length one, which are aggregated like regular time steps; they can not be used as per-step prerequisites.
+  '''
+
+  def __init__(self, variables, blockbytes=None):
+    ''' Initialize with a list of WetDays and WetDayRain variables of the same rain variable. '''
+    if not all([isinstance(devar,(WetDays,WetDayRain)) for devar in variables]): raise TypeError
+    if len(set([devar.rain for devar in variables])) > 1: 
+      raise DerivedVariableError, 'Batched wet-day variables have to depend on the same rain variable.'
+    self.variables = variables
+    self.names = [devar.name for devar in variables]
+    self.rain = variables[0].rain
+    self.thresholds = sorted(set([devar.threshold for devar in variables]))
+    self.blockbytes = fused_blockbytes if blockbytes is None else blockbytes
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Count wet steps and sum rain on wet steps for all thresholds; returns an ordered dictionary of time sums. '''
+    for devar in self.variables:
+      DerivedVariable.computeValues(devar, indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+      if isinstance(devar,WetDays): devar.checkDelta(delta, tmp)
+    rain = indata[self.rain]
+    if aggax != 0: rain = np.rollaxis(rain, axis=aggax, start=0)
+    tlen = rain.shape[0]; xshape = rain.shape[1:]
+    npt = int(np.prod(xshape)); nbin = len(self.thresholds)+1
+    # N.B.: comparisons of arrays with Python scalars use the type of the array
+    thresholds = np.asarray(self.thresholds, dtype=rain.dtype)
+    rain = rain.reshape((tlen,npt))
+    # histograms of ranks (number of exceeded thresholds) and rain sums by rank for every grid point
+    counts = np.zeros((nbin*npt,), dtype=np.int64); sums = np.zeros((nbin*npt,), dtype=np.float64)
+    ptidx = np.arange(npt, dtype=np.intp)
+    nblk = max(1, int(self.blockbytes // max(1,16*npt))) # ranks and masks of blocks of time steps
+    for t0 in xrange(0, tlen, nblk):
+      block = rain[t0:t0+nblk]
+      rank = np.zeros(block.shape, dtype=np.intp); wet = np.empty(block.shape, dtype=np.bool_)
+      for threshold in thresholds:
+        np.greater(block, threshold, out=wet); rank += wet # comparisons with NaN always yield False 
+      rank *= npt; rank += ptidx # flat index of rank and grid point
+      counts += np.bincount(rank.ravel(), minlength=nbin*npt)
+      sums += np.bincount(rank.ravel(), weights=block.ravel(), minlength=nbin*npt)
+    # number of steps above each threshold and the rain sums on those steps (sum over all higher ranks)
+    counts = np.cumsum(counts.reshape((nbin,)+xshape)[::-1], axis=0)[::-1]
+    sums = np.cumsum(sums.reshape((nbin,)+xshape)[::-1], axis=0)[::-1]
+    results = OrderedDict()
+    for devar in self.variables:
+      irank = self.thresholds.index(devar.threshold) + 1 
+      if isinstance(devar,WetDays): outdata = counts[irank]
+      else: outdata = sums[irank].astype(rain.dtype) # same type as the rain sums
+      results[devar.name] = np.expand_dims(outdata, axis=aggax) # a single 'time step' with the time sum
+    return results
+
+
 class WetDayPrecip(DerivedVariable):
   ''' DerivedVariable child for precipitation amounts on rainy days for WRF output. '''
   
@@ -667,13 +835,13 @@ class OrographicIndex(DerivedVariable):
     if 'hgtgrd_sn' not in const:
       if 'HGT' not in const: raise ValueError
       if 'DY' not in const: raise ValueError
-      hgtgrd_sn = ctrDiff(const['HGT'], axis=1, delta=const['DY'])
+      hgtgrd_sn = centredDiff(const['HGT'], axis=1, delta=const['DY'])
       const['hgtgrd_sn'] = hgtgrd_sn
     else: hgtgrd_sn = const['hgtgrd_sn']  
     if 'hgtgrd_we' not in const:
       if 'HGT' not in const: raise ValueError
       if 'DX' not in const: raise ValueError
-      hgtgrd_we = ctrDiff(const['HGT'], axis=2, delta=const['DX'])
+      hgtgrd_we = centredDiff(const['HGT'], axis=2, delta=const['DX'])
       const['hgtgrd_we'] = hgtgrd_we
     else: hgtgrd_we = const['hgtgrd_we']
     U = indata['U10']; V = indata['V10']
@@ -683,25 +851,6 @@ class OrographicIndex(DerivedVariable):
     return outdata
 
 
-class CovOIP(DerivedVariable):
-  ''' DerivedVariable child for computing the correlation of the orographic index with precipitation. '''
-  
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(CovOIP,self).__init__(name='OIPX', # name of the variable
-                              units='', # fraction of days 
-                              prerequisites=['OrographicIndex', 'RAIN'], # it's the sum of these two
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable 
-                              dtype=dv_float, atts=None, linear=False) 
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Covariance of Origraphic Index and Precipitation (needed to calculate correlation coefficient). '''
-    super(CovOIP,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute covariance
-    outdata = evaluate('OrographicIndex * RAIN', local_dict=indata) 
-    return outdata
-
-
 class OrographicIndexPlev(DerivedVariable):
   ''' DerivedVariable child for computing the correlation of (surface) winds with the topographic gradient. '''
   
@@ -721,13 +870,13 @@ class OrographicIndexPlev(DerivedVariable):
     if 'hgtgrd_sn' not in const:
       if 'HGT' not in const: raise ValueError
       if 'DY' not in const: raise ValueError
-      hgtgrd_sn = ctrDiff(const['HGT'], axis=1, delta=const['DY'])
+      hgtgrd_sn = centredDiff(const['HGT'], axis=1, delta=const['DY'])
       const['hgtgrd_sn'] = hgtgrd_sn
     else: hgtgrd_sn = const['hgtgrd_sn']  
     if 'hgtgrd_we' not in const:
       if 'HGT' not in const: raise ValueError
       if 'DX' not in const: raise ValueError
-      hgtgrd_we = ctrDiff(const['HGT'], axis=2, delta=const['DX'])
+      hgtgrd_we = centredDiff(const['HGT'], axis=2, delta=const['DX'])
       const['hgtgrd_we'] = hgtgrd_we
     else: hgtgrd_we = const['hgtgrd_we']
     U = indata['U_PL']; V = indata['V_PL']
@@ -885,7 +1034,7 @@ class ColumnHeat(DerivedVariable):
     super(ColumnHeat,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
     outdata = pressureIntegral(var=indata['T_PL'], T=indata['T_PL'], 
                                p=indata['P_PL'], RMg=self.RMg)
-    outdata *= self.cp # since integration is linear
+    outdata = outdata * self.cp # since integration is linear; N.B.: the integral may be cached
     return outdata
 
 
@@ -981,64 +1130,173 @@ class HeatTransport_V(DerivedVariable):
 class Vorticity(DerivedVariable):
   ''' DerivedVariable child for computing relative vorticity. '''
   
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
+  def __init__(self, lmapfac=False):
+    ''' Initialize with fixed values; if lmapfac, derivatives are multiplied with the map-scale factor. '''
     super(Vorticity,self).__init__(name='Vorticity', # name of the variable
                               units='1/s', 
                               prerequisites=['U_PL','V_PL'],
+                              constants=['DX','DY','MAPFAC_M'] if lmapfac else ['DX','DY'], # grid spacing 
                               axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable 
                               dtype=dv_float, atts=None, linear=False) 
+    self.lmapfac = lmapfac
+    self.buffers = ReductionBuffers() # reusable buffer for du/dy
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Project surface winds onto topographic gradient. '''
+    ''' Compute relative vorticity from winds on pressure levels. '''
     super(Vorticity,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
     # compute relative vorticity on pressure levels
-    # zeta = dv/dx - du/dy
-    outdata = ( ctrDiff(indata['V_PL'], axis=3, delta=const['DX']) # order of dimensions: t,p,y,x
-                -  ctrDiff(indata['U_PL'], axis=2, delta=const['DY']) )
-    # N.B.: metric factors are not computed
+    # zeta = m * ( dv/dx - du/dy ); order of dimensions: t,p,y,x
+    U = indata['U_PL']; V = indata['V_PL']
+    outdata = centredDiff(V, axis=3, delta=const['DX'])
+    dudy = centredDiff(U, axis=2, delta=const['DY'], out=self.buffers.getBuffer('dudy', U.shape, dtype_float))
+    np.subtract(outdata, dudy, out=outdata)
+    # N.B.: the map-scale factor (time, south_north, west_east) is broadcast over pressure levels
+    if self.lmapfac: np.multiply(outdata, const['MAPFAC_M'], out=outdata)
     return outdata
 
 
-class Vorticity_Var(DerivedVariable):
-  ''' DerivedVariable child for computing the variance of relative vorticity. '''
-  
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(Vorticity_Var,self).__init__(name='Vorticity_Var', # name of the variable
-                              units='1/s^2', 
-                              prerequisites=['Vorticity'],
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable 
-                              dtype=dv_float, atts=None, linear=False) 
 
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Project surface winds onto topographic gradient. '''
-    super(Vorticity_Var,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute variance without subtracting the mean
-    outdata = indata['Vorticity']**2
-    # N.B.: to get actual variance, the square of the mean has to be subtracted after the final stage of aggregation
-    return outdata
+## declarative derived variables (numexpr expressions)
 
-
-class GHT_Var(DerivedVariable):
-  ''' DerivedVariable child for computing the variance of geopotential height on pressure levels. '''
+class ExpressionVariable(DerivedVariable):
+  '''
+    DerivedVariable child that is defined by a numexpr expression string; the names in the expression are the
+    prerequisites, constant fields and scalar parameters. Inputs with fewer dimensions than others are extended
+    with trailing singleton dimensions (e.g. P_PL with shape (time,plev) for 4D variables).
+    Consecutive non-linear expression variables are evaluated together by an ExpressionGroup (see planner).
+  '''
   
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(GHT_Var,self).__init__(name='GHT_Var', # name of the variable
-                              units='m^2', 
-                              prerequisites=['GHT_PL'],
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable 
-                              dtype=dv_float, atts=None, linear=False) 
+  def __init__(self, name, units, prerequisites, expression, axes=None, params=None, constants=None, 
+               dtype=dv_float, atts=None, linear=False, ignoreNaN=False, normalize=True):
+    ''' Create an expression variable; params is a dictionary of scalar parameters (N.B.: numexpr treats Python
+        floats as doubles, so use numpy scalars of type dv_float to avoid upcasting). '''
+    super(ExpressionVariable,self).__init__(name=name, units=units, prerequisites=prerequisites, 
+                                            constants=constants, axes=axes, dtype=dtype, atts=atts, 
+                                            linear=linear, ignoreNaN=ignoreNaN, normalize=normalize)
+    self.expression = expression
+    self.params = params or dict()
+    # check that all names in the expression are declared
+    names = set(getExprNames(expression, {})[0])
+    declared = set(prerequisites).union(self.params.iterkeys()).union(constants or [])
+    if not names.issubset(declared):
+      raise DerivedVariableError, "Undeclared names in expression for variable '{:s}': {:s}".format(name, 
+                                                                                     str(list(names - declared)))
+  
+  def getLocals(self, indata, const=None):
+    ''' Assemble the local dictionary for the expression (inputs are extended to the same number of dimensions). '''
+    ldict = {pq:indata[pq] for pq in self.prerequisites}
+    if self.constants: ldict.update({cvar:const[cvar] for cvar in self.constants})
+    ndim = max([array.ndim for array in ldict.itervalues()])
+    for key,array in ldict.iteritems():
+      if array.ndim < ndim: ldict[key] = array.reshape(array.shape + (1,)*(ndim-array.ndim)) # view, if possible
+    ldict.update(self.params)
+    return ldict
+  
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Evaluate the expression. '''
+    super(ExpressionVariable,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    return evaluate(self.expression, local_dict=self.getLocals(indata, const=const))
 
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Project surface winds onto topographic gradient. '''
-    super(GHT_Var,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute variance without subtracting the mean
-    outdata = indata['GHT_PL']**2
-    # N.B.: to get actual variance, the square of the mean has to be subtracted after the final stage of aggregation
-    return outdata
 
+class ExpressionGroup(object):
+  '''
+    A group of non-linear expression variables, which are evaluated together, block by block along the 
+    aggregation axis, so that each block of the inputs only passes through the cache once for all expressions;
+    results can be used by later expressions in the group (while they are still in the cache).
+  '''
+  
+  def __init__(self, variables, blockbytes=None):
+    ''' Variables have to be in order of computation. '''
+    if not all([isinstance(devar,ExpressionVariable) for devar in variables]): raise TypeError
+    self.variables = list(variables)
+    self.names = [devar.name for devar in self.variables]
+    self.blockbytes = fused_blockbytes if blockbytes is None else blockbytes
+    
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Evaluate all expressions and return an ordered dictionary of results. '''
+    if not isinstance(indata,dict): raise TypeError
+    for devar in self.variables:
+      if not devar.checked: raise DerivedVariableError, "Prerequisites for variable '%s' are not satisfied."%(devar.name)
+    data = dict(indata) # results are added, so that they can be used as inputs
+    results = OrderedDict(); ldicts = []
+    # allocate results; shape from broadcasting and type from a single element
+    for devar in self.variables:
+      ldict = devar.getLocals(data, const=const)
+      arrays = [array for array in ldict.itervalues() if isinstance(array,np.ndarray) and array.ndim > 0]
+      probe = {key:array[(slice(0,1),)*array.ndim] if isinstance(array,np.ndarray) and array.ndim > 0 else array 
+               for key,array in ldict.iteritems()}
+      dtype = evaluate(devar.expression, local_dict=probe).dtype
+      results[devar.name] = data[devar.name] = np.empty(np.broadcast(*arrays).shape, dtype=dtype)
+      ldicts.append((devar.expression,ldict,arrays))
+    # N.B.: blocks are only used along the outermost axis, when all arrays have the full length along it,
+    #       so that the output blocks are contiguous
+    nt = results[self.names[0]].shape[0] if results[self.names[0]].ndim > 0 else 0
+    lblock = aggax == 0 and nt > 1 and all([array.ndim > 0 and array.shape[0] == nt 
+                                            for _,_,arrays in ldicts for array in arrays])
+    if lblock:
+      stepbytes = sum([array.nbytes for array in {id(array):array for _,_,arrays in ldicts 
+                                                                  for array in arrays}.itervalues()]) / nt
+      nblk = max(1, int(self.blockbytes // max(1,stepbytes)))
+    else: nblk = nt = 1
+    # evaluate all expressions block by block
+    for t0 in xrange(0, nt, nblk):
+      for name,(expression,ldict,arrays) in zip(self.names,ldicts):
+        if lblock: 
+          blk = slice(t0,t0+nblk)
+          bdict = {key:array[blk] if isinstance(array,np.ndarray) and array.ndim > 0 else array 
+                   for key,array in ldict.iteritems()}
+          evaluate(expression, local_dict=bdict, out=results[name][blk])
+        else: evaluate(expression, local_dict=ldict, out=results[name])
+    return results
+
+
+# registry of declarative definitions: name, units, prerequisites and expression (optional: axes, params, etc.);
+# prerequisites and expression can have format fields, which are filled in by newExpressionVariable
+expression_registry = OrderedDict()
+axes_2d = ('time','south_north','west_east'); axes_3d = ('time','num_press_levels_stag','south_north','west_east')
+
+def registerExpression(name, units, prerequisites, expression, axes=axes_2d, defaults=None, **kwargs):
+  ''' Add a declarative definition of a derived variable to the registry (defaults are used for format fields). '''
+  expression_registry[name] = dict(name=name, units=units, prerequisites=prerequisites, expression=expression, 
+                                   axes=axes, defaults=defaults or dict(), kwargs=kwargs)
+
+def newExpressionVariable(name, **fields):
+  ''' Create an ExpressionVariable from the registry; keyword arguments fill in format fields. '''
+  if name not in expression_registry: raise DerivedVariableError, "No expression registered for variable '{:s}'.".format(name)
+  definition = expression_registry[name]
+  fields = dict(definition['defaults'], **fields)
+  prerequisites = [pq.format(**fields) for pq in definition['prerequisites']]
+  expression = definition['expression'].format(**fields)
+  kwargs = definition['kwargs'].copy()
+  if kwargs.get('params'): kwargs['params'] = kwargs['params'].copy() # don't share between instances
+  return ExpressionVariable(name=definition['name'], units=definition['units'], prerequisites=prerequisites,
+                            expression=expression, axes=definition['axes'], **kwargs)
+
+# precipitation and surface water budget 
+# N.B.: some of these are actually linear, but non-linear computations depend on them
+registerExpression('RAIN', 'kg/m^2/s', ['RAINNC','RAINC'], 'RAINNC + RAINC', linear=True)
+registerExpression('RAINMEAN', 'kg/m^2/s', ['RAINNCVMEAN','RAINCVMEAN'], 'RAINNCVMEAN + RAINCVMEAN', linear=True)
+registerExpression('LiquidPrecip', 'kg/m^2/s', ['RAINNC','RAINC','ACSNOW'], 'RAINNC + RAINC - ACSNOW', linear=True)
+registerExpression('SolidPrecip', 'kg/m^2/s', ['ACSNOW'], 'ACSNOW', linear=True)
+registerExpression('NetPrecip', 'kg/m^2/s', ['RAIN','{sfcevp}'], 'RAIN - {sfcevp}', linear=True, 
+                   defaults=dict(sfcevp='SFCEVP')) # 'SFCEVP' for hydro, 'QFX' for srfc files
+registerExpression('NetWaterFlux', 'kg/m^2/s', ['LiquidPrecip','SFCEVP','ACSNOM'], 'LiquidPrecip - SFCEVP + ACSNOM', 
+                   linear=True)
+registerExpression('Runoff', 'kg/m^2/s', ['SFROFF','UDROFF'], 'SFROFF + UDROFF', linear=True)
+# surface variables
+registerExpression('WaterVapor', 'Pa', ['Q2','PSFC'], 'Mratio * Q2 * PSFC', 
+                   params=dict(Mratio=28.96 / 18.02)) # g/mol, Molecular mass ratio of dry air over water
+# pressure level variables
+# N.B.: it is necessary to enforce the type of scalars, otherwise numexpr casts everything as doubles
+registerExpression('WaterDensity', 'kg/m^3', ['TD_PL','T_PL'], axes=axes_3d, # Magnus formula, hPa and Celsius
+                   expression='MR * 100. * 6.1094 * exp( 17.625 * (TD_PL - 273.15) / (TD_PL - 273.15 + 243.04) ) / T_PL',
+                   params=dict(MR=np.asarray( 0.01802 / 8.3144621, dtype=dv_float))) # Mh2o / R; from AMS Glossary
+registerExpression('WaterFlux_U', 'kg/m^2/s', ['U_PL','WaterDensity'], 'U_PL * WaterDensity', axes=axes_3d)
+registerExpression('WaterFlux_V', 'kg/m^2/s', ['V_PL','WaterDensity'], 'V_PL * WaterDensity', axes=axes_3d)
+registerExpression('HeatFlux_U', 'J/m^2/s', ['U_PL','P_PL'], 'U_PL * P_PL * cpMR', axes=axes_3d, # u * T*cp * rho
+                   params=dict(cpMR=np.asarray( 1005.7 * 0.0289644 / 8.3144621, dtype=dv_float))) # cp * Mair / R
+registerExpression('HeatFlux_V', 'J/m^2/s', ['V_PL','P_PL'], 'V_PL * P_PL * cpMR', axes=axes_3d, 
+                   params=dict(cpMR=np.asarray( 1005.7 * 0.0289644 / 8.3144621, dtype=dv_float))) # cp * Mair / R
 
 
 ## extreme values
@@ -1142,10 +1400,39 @@ class ConsecutiveExtrema(Extrema):
     self.tmpdata = 'COX_'+self.name # don't need temporary storage 
     self.carryover = True # don't stop counting - this is vital    
     
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
-    ''' Count consecutive above/below threshold days '''
-    super(Extrema,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # check that delta does not change!
+  def startChunk(self, offset):
+    ''' Track the length of the leading run (the open run from the previous chunk is not known). '''
+    self.leaddata = 'COL_'+self.name # (-1 while the leading run is still open)
+    
+  def leadComplete(self, tmp):
+    ''' Return a mask of points where the leading run has ended. '''
+    return tmp[self.leaddata] >= 0 if self.leaddata in tmp else None
+  
+  def boundaryState(self, tmp, month=None):
+    ''' Return the open run at the end and the leading run at the beginning of the chunk. '''
+    if self.leaddata not in tmp: return None
+    lead = tmp[self.leaddata]
+    if month is None: month = np.zeros(lead.shape, dtype='int16') - 1 # no month recorded
+    return dict(xcnt=tmp[self.tmpdata], lead=lead, month=month, period=self.period)
+  
+  @staticmethod
+  def joinBoundary(vardata, irec, prev, state):
+    ''' Join the leading run of a chunk with the open run of the previous chunk (if it ended in this month). '''
+    lend = state['month'] == irec
+    joined = ( state['lead'][lend] + np.asarray(prev['xcnt'], dtype='int32')[lend] ) * state['period']
+    vardata[lend] = np.maximum(vardata[lend], joined)
+    return vardata
+  
+  @staticmethod
+  def carryBoundary(prev, state):
+    ''' If the leading run never ended, the open run continues through the entire chunk. '''
+    state = dict(state)
+    state['xcnt'] = np.where(state['month'] < 0, np.asarray(prev['xcnt'], dtype='int32') + state['xcnt'], 
+                             state['xcnt'])
+    return state
+    
+  def checkDelta(self, delta, tmp):
+    ''' Check that the output interval does not change and set the period (conversion to days) '''
     if 'COX_DELTA' in tmp: 
       if delta != tmp['COX_DELTA']: 
         raise NotImplementedError, 'Consecutive extrema currently only work, if the output interval is constant.'
@@ -1153,38 +1440,144 @@ class ConsecutiveExtrema(Extrema):
       tmp['COX_DELTA'] = delta # save and check next time
     if self.period == 0.: 
       self.period = delta / self.lengthofday 
+
+  def getMask(self, data, out=None):
+    ''' Return the exceedance mask of data (above or below threshold) '''
+    # N.B.: comparisons with NaN always yield False, i.e. non-exceedance
+    if self.thresmode == 1: return np.greater(data, self.threshold, out=out) # above
+    elif self.thresmode == 0: return np.less(data, self.threshold, out=out) # below
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Count consecutive above/below threshold days '''
+    # N.B.: a single variable is just a group of one
+    return ConsecutiveExtremaGroup([self]).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp)[self.name]
+
+
+def runLengths(xmask, xcnt, lead=None):
+  ''' helper routine to compute the lengths of runs of True values along the first axis of xmask without a loop over 
+      time steps; xcnt is the length of the open run before the first step and lead the length of the leading run 
+      (-1 while it is still open); both are updated in place. Returns the length of the longest run that ended 
+      within xmask (i.e. that was followed by a False value). '''
+  tlen = xmask.shape[0]
+  tidx = np.arange(1, tlen+1, dtype=np.int32).reshape((tlen,)+(1,)*(xmask.ndim-1)) # one-based step number
+  lreset = np.logical_not(xmask)
+  # step number of the last reset (False) at or before each step (zero, if there was none)
+  last = np.multiply(lreset, tidx)
+  np.maximum.accumulate(last, axis=0, out=last)
+  # length of the run that ends at each reset, i.e. the counter before the step (zero, if the step is not a reset)
+  # N.B.: this does not include the open run from before, which only matters for the first reset (see below)
+  if tlen > 1:
+    ended = np.subtract(tidx[:-1], last[:-1]); ended *= lreset[1:]
+    maxrun = ended.max(axis=0)
+  else: maxrun = np.zeros(xcnt.shape, dtype=np.int32)
+  # the first reset ends the open run (leading run)
+  lfirst = last[-1] > 0 # there was a reset
+  leadrun = np.argmax(lreset, axis=0) + xcnt # zero-based step of the first reset plus open run
+  np.maximum(maxrun, np.where(lfirst, leadrun, 0), out=maxrun)
+  # record length of leading run, when it ends
+  if lead is not None:
+    lend = np.logical_and(lead < 0, lfirst)
+    lead[lend] = leadrun[lend]
+  # carry over current counter
+  xcnt[:] = np.where(lfirst, tlen - last[-1], tlen + xcnt)
+  return maxrun
+
+
+class ConsecutiveExtremaGroup(object):
+  '''
+    A group of consecutive extrema of the same variable (e.g. with different thresholds), which are computed in 
+    one batched pass: the exceedance masks of all variables are stacked and the run lengths are computed for all 
+    time steps at once (runLengths), in chunks of grid points, so that the work arrays fit into the cache; the open 
+    runs are carried over to the next slab or month.
+  '''
+
+  def __init__(self, variables, blockbytes=None):
+    ''' Initialize with a list of ConsecutiveExtrema of the same prerequisite. '''
+    if not all([isinstance(devar,ConsecutiveExtrema) for devar in variables]): raise TypeError
+    if len(set([devar.prerequisites[0] for devar in variables])) > 1: 
+      raise DerivedVariableError, 'Batched consecutive extrema have to depend on the same variable.'
+    self.variables = variables
+    self.names = [devar.name for devar in variables]
+    self.blockbytes = runlength_blockbytes if blockbytes is None else blockbytes
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Count consecutive above/below threshold days of all variables; returns an ordered dictionary of results. '''
+    for devar in self.variables:
+      super(Extrema,devar).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+      devar.checkDelta(delta, tmp)
     # get data
-    data = indata[self.prerequisites[0]]
+    data = indata[self.variables[0].prerequisites[0]]
     # if axis is not 0 (outermost), roll axis until it is
     if aggax != 0: data = np.rollaxis(data, axis=aggax, start=0).copy() # should make a copy
     tlen = data.shape[0] # aggregation axis
     xshape = data.shape[1:] # rest of the map
-    # initialize counter of consecutive exceedances
-    if self.tmpdata in tmp: xcnt = tmp[self.tmpdata] # carry over from previous period 
-    else: xcnt = np.zeros(xshape, dtype='int16')# initialize as zero
-    # initialize output array
-    maxdata = np.zeros(xshape, dtype=np.dtype('int16')) # record of maximum consecutive days in computation period 
-    # march along aggregation axis
-    for t in xrange(tlen):
-      # detect threshold changes
-      if self.thresmode == 1: xmask = ( data[t,:] > self.threshold ) # above
-      elif self.thresmode == 0: xmask = ( data[t,:] < self.threshold ) # below
-      # N.B.: comparisons with NaN always yield False, i.e. non-exceedance
-      # update maxima of exceedances
-      xnew = np.where(xmask,0,xcnt) * self.period # extract periods before reset
-      maxdata = np.maximum(maxdata,xnew) #       
-      # set counter for all non-exceedances to zero
-      xcnt[np.invert(xmask)] = 0
-      # increment exceedance counter
-      xcnt[xmask] += 1      
-    # carry over current counter to next period or month
-    tmp[self.tmpdata] = xcnt
-    # return output for further aggregation
-    if self.ignoreNaN:
-      maxdata = np.ma.masked_where(np.isnan(data).sum(axis=0) > 0, maxdata)
-    return maxdata
+    npt = int(np.prod(xshape)); nvar = len(self.variables)
+    # initialize counters of consecutive exceedances (carry over from previous period) 
+    xcnt = np.zeros((nvar,npt), dtype=np.int32)
+    for i,devar in enumerate(self.variables):
+      if devar.tmpdata in tmp: xcnt[i] = tmp[devar.tmpdata].ravel()
+    # initialize length of leading runs (-1 while the leading run is still open)
+    if any([devar.leaddata is not None for devar in self.variables]):
+      lead = np.zeros((nvar,npt), dtype=np.int32) - 1
+      for i,devar in enumerate(self.variables):
+        if devar.leaddata in tmp: lead[i] = tmp[devar.leaddata].ravel()
+    else: lead = None
+    # compute run lengths for chunks of grid points 
+    # N.B.: the work arrays of runLengths need about 16 bytes per element
+    maxrun = np.zeros((nvar,npt), dtype=np.int32) # record of maximum consecutive steps in computation period 
+    if tlen > 0:
+      data = data.reshape((tlen,npt))
+      nchk = max(1, int(self.blockbytes // (16*tlen*nvar)))
+      xmask = np.empty((tlen,nvar,min(nchk,npt)), dtype=np.bool_)
+      for s0 in xrange(0, npt, nchk):
+        chk = slice(s0, min(s0+nchk,npt)); chkmask = xmask[:,:,:chk.stop-chk.start]
+        for i,devar in enumerate(self.variables): devar.getMask(data[:,chk], out=chkmask[:,i])
+        maxrun[:,chk] = runLengths(chkmask, xcnt[:,chk], lead=None if lead is None else lead[:,chk])
+      data = data.reshape((tlen,)+xshape)
+    if any([devar.ignoreNaN for devar in self.variables]): lnan = np.isnan(data).sum(axis=0) > 0
+    results = OrderedDict()
+    for i,devar in enumerate(self.variables):
+      # carry over current counter to next period or month
+      tmp[devar.tmpdata] = xcnt[i].reshape(xshape).astype('int16')
+      if devar.leaddata is not None: tmp[devar.leaddata] = lead[i].reshape(xshape).astype('int16')
+      # convert to days (as float)
+      if tlen > 0: maxdata = maxrun[i].reshape(xshape) * devar.period 
+      else: maxdata = np.zeros(xshape, dtype=np.dtype('int16'))
+      # return output for further aggregation
+      if devar.ignoreNaN: maxdata = np.ma.masked_where(lnan, maxdata)
+      results[devar.name] = maxdata
+    return results
   
 
+# helper for interval averages (used for interval-averaged extrema and histograms)
+def intervalMeans(data, ilen, psum=None, pcnt=0):
+  ''' helper routine to average consecutive intervals of ilen steps along the first axis of data; psum and pcnt are
+      the running sum and the number of steps of the partial interval from the previous slab, which is completed 
+      first. Returns the interval means (None, if no interval was completed) and the running sum and number of 
+      steps of the new partial interval at the end of data. '''
+  lt = data.shape[0] # available time steps
+  pape = data.shape[1:] # remaining shape (must be preserved)
+  acctype = np.zeros((1,), dtype=data.dtype).mean().dtype # the accumulator type of averages
+  if psum is None: psum = np.zeros(pape, dtype=acctype); pcnt = 0
+  means = [] # interval means
+  # complete the partial interval
+  # N.B.: steps are added one by one, which is the same as averaging the complete interval along an outer axis
+  t0 = min(ilen-pcnt, lt) if pcnt > 0 else 0
+  for t in xrange(t0): psum += data[t]
+  pcnt += t0
+  if pcnt == ilen: 
+    means.append( (psum / ilen).reshape((1,)+pape) ); pcnt = 0 
+  # average complete intervals within the slab
+  nint = int( (lt-t0) / ilen ) # number of intervals
+  t1 = t0 + ilen*nint # usable interval: split data here
+  if nint > 0: means.append( data[t0:t1].reshape((nint,ilen) + pape).mean(axis=1) ) # average over interval dimension
+  # start a new partial interval with the rest
+  if t1 < lt: psum = np.add.reduce(data[t1:], axis=0, dtype=acctype); pcnt = lt - t1
+  elif pcnt == 0: psum = np.zeros(pape, dtype=acctype)
+  if len(means) == 0: return None, psum, pcnt
+  else: return means[0] if len(means) == 1 else np.concatenate(means, axis=0), psum, pcnt
+
+
 # base class for interval-averaged extrema (sort of similar to running mean)
 class MeanExtrema(Extrema):
   ''' Extrema child implementing extrema of interval-averaged values in monthly WRF output. '''
@@ -1198,41 +1591,356 @@ class MeanExtrema(Extrema):
     self.atts['Aggregation'] = 'Averaged ' + self.atts['Aggregation']
     self.atts['AverageInterval'] = '{0:d} days'.format(interval) # interval in days
     self.interval = interval * 24*60*60 # in seconds, sicne delta will be in seconds, too
-    self.tmpdata = 'MEX_'+self.name # handle for temporary storage
+    self.tmpdata = 'MEX_'+self.name # handle for temporary storage (running sum of the partial interval)
     self.carryover = True # don't drop data    
 
+  def startChunk(self, offset):
+    ''' Keep the steps that complete the partial interval from the previous chunk separately (the lead); 
+        intervals are counted from the beginning of the first chunk, as in a single pass. '''
+    self.offset = offset # in seconds
+    self.leaddata = 'MEL_'+self.name # steps of the lead, followed by '_N' (number of steps) and '_L' (interval)
+    
+  def leadComplete(self, tmp):
+    ''' The lead ends at all points, when the partial interval from the previous chunk is complete. '''
+    if self.leaddata not in tmp: return None
+    return np.asarray(tmp[self.leaddata+'_N'] == tmp[self.leaddata].shape[0])
+  
+  def boundaryState(self, tmp, month=None):
+    ''' Return the partial interval at the end and the steps of the lead at the beginning of the chunk. '''
+    if self.leaddata not in tmp: return None
+    lead = tmp[self.leaddata][:tmp[self.leaddata+'_N']]
+    return dict(psum=tmp[self.tmpdata], pcnt=tmp[self.tmpdata+'_N'], lead=lead, ilen=tmp[self.leaddata+'_L'], 
+                month=-1 if month is None else month, mode=self.mode, ignorenan=self.ignoreNaN)
+  
+  @staticmethod
+  def joinBoundary(vardata, irec, prev, state):
+    ''' Complete the partial interval of the previous chunk with the lead of this chunk (in the month in which 
+        the lead ended) and include its mean in the extrema. '''
+    lead = state['lead']; pcnt = int(prev['pcnt']); ilen = int(state['ilen'])
+    if int(state['month']) != irec or ( pcnt == 0 and len(lead) == 0 ): return vardata
+    if pcnt + len(lead) != ilen: 
+      raise DerivedVariableError, 'The partial interval and the lead of the next chunk do not add up to an interval.'
+    # N.B.: steps are added one by one, which is the same as completing the partial interval in a single pass
+    psum = prev['psum'].copy()
+    for t in xrange(len(lead)): psum += lead[t]
+    meandata = psum / ilen
+    if state['mode'] == 1: outdata = np.fmax(vardata,meandata) if state['ignorenan'] else np.maximum(vardata,meandata)
+    else: outdata = np.fmin(vardata,meandata) if state['ignorenan'] else np.minimum(vardata,meandata)
+    return outdata.astype(vardata.dtype)
+  
+  @staticmethod
+  def carryBoundary(prev, state):
+    ''' If the lead never ended, the partial interval continues through the entire chunk. '''
+    if int(state['month']) >= 0: return state
+    psum = prev['psum'].copy()
+    for t in xrange(len(state['lead'])): psum += state['lead'][t]
+    return dict(state, psum=psum, pcnt=int(prev['pcnt'])+len(state['lead']))
+
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
     ''' Compute field of maxima '''
-    #if aggax != 0: raise NotImplementedError, 'Currently, interval averaging only works on the innermost dimension.'
+    # N.B.: a single variable is just a group of one
+    return MeanExtremaGroup([self]).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp)[self.name]
+
+
+class MeanExtremaGroup(object):
+  '''
+    A group of interval-averaged extrema of the same variable and interval (e.g. the maxima and minima of daily 
+    means), which share the computation of the interval means. Intervals are averaged in place (views of the slab);
+    the partial interval at the end of a slab is carried over to the next slab or month as a running sum and a 
+    step count, and completed with the first steps of the next slab (the state is stored for every member).
+    In chunked mode, the steps that complete the partial interval from the previous chunk are set aside (the
+    lead) and the interval is completed, when the chunks are merged (MeanExtrema.joinBoundary).
+  '''
+
+  def __init__(self, variables):
+    ''' Initialize with a list of MeanExtrema of the same prerequisite and interval. '''
+    if not all([isinstance(devar,MeanExtrema) for devar in variables]): raise TypeError
+    if len(set([(devar.prerequisites[0],devar.interval) for devar in variables])) > 1: 
+      raise DerivedVariableError, 'Grouped interval-averaged extrema have to have the same variable and interval.'
+    self.variables = variables
+    self.names = [devar.name for devar in variables]
+    self.interval = variables[0].interval
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Compute interval means once and the extrema of all variables; returns an ordered dictionary of results. '''
     if delta == 0: raise ValueError, 'No interval to average over...'
-    # assemble data
-    data = indata[self.prerequisites[0]]
+    prerequisite = self.variables[0].prerequisites[0]
+    data = indata[prerequisite]
     # if axis is not 0 (outermost), roll axis until it is
-    if aggax != 0: data = np.rollaxis(data, axis=aggax, start=0).copy() # rollaxis just provides a view
-    if self.tmpdata in tmp:
-      data = np.concatenate((tmp[self.tmpdata], data), axis=0)
-    # determine length of interval
-    lt = data.shape[0] # available time steps
-    pape = data.shape[1:] # remaining shape (must be preserved)
-    ilen = int( self.interval / delta )
-    nint = int( lt / ilen ) # number of intervals
-    if nint > 0:
-      # truncate and reshape data
-      ui = ilen*nint # usable interval: split data here
-      data = data[:ui,:] # use this portion
-      rest = data[ui:,:] # save the rest for next iteration
-      data = data.reshape((nint,ilen) + pape)
-      # average interval
-      meandata = data.mean(axis=1) # average over interval dimension
-      datadict = {self.prerequisites[0]:meandata} # next method expects a dictionary...
+    if aggax != 0: data = np.rollaxis(data, axis=aggax, start=0) # rollaxis just provides a view
+    ilen = int( self.interval / delta ) # length of interval
+    if ilen < 1: raise ValueError, 'The output interval is longer than the averaging interval.'
+    # running sum and number of steps of the partial interval from the previous slab
+    key = self.variables[0].tmpdata
+    if key+'_N' in tmp: psum = tmp[key]; pcnt = tmp[key+'_N']
+    else: psum = None; pcnt = 0
+    # in chunked mode, the first steps complete the partial interval from the previous chunk (the lead)
+    leadkey = self.variables[0].leaddata
+    if leadkey is not None:
+      if leadkey in tmp: lead = tmp[leadkey]; nstep = tmp[leadkey+'_N']
+      else: 
+        nlead = ( ilen - int(round(self.variables[0].offset/delta)) % ilen ) % ilen
+        lead = np.zeros((nlead,)+data.shape[1:], dtype=data.dtype); nstep = 0
+      t0 = min(lead.shape[0]-nstep, data.shape[0])
+      lead[nstep:nstep+t0] = data[:t0]; nstep += t0; data = data[t0:]
+    meandata, psum, pcnt = intervalMeans(data, ilen, psum=psum, pcnt=pcnt)
+    # extrema of interval means
+    if meandata is not None: datadict = {prerequisite:meandata} # next method expects a dictionary...
+    results = OrderedDict()
+    for devar in self.variables:
+      # carry over partial interval
+      tmp[devar.tmpdata] = psum; tmp[devar.tmpdata+'_N'] = pcnt
+      if leadkey is not None: tmp[devar.leaddata] = lead; tmp[devar.leaddata+'_N'] = nstep; tmp[devar.leaddata+'_L'] = ilen
       # find extrema as before (but aggregation axis was shifted to 0)
-      outdata = super(MeanExtrema,self).computeValues(datadict, aggax=0, delta=delta, const=const, 
-                                                      tmp=None) # perform some type checks
-    else:
-      rest = data # carry over everything
-      outdata = None # nothing to return (handled in aggregation)
-    # add remaining data to temporary storage
-    tmp[self.tmpdata] = rest
-       
+      if meandata is not None: results[devar.name] = super(MeanExtrema,devar).computeValues(datadict, aggax=0, delta=delta, 
+                                                                                     const=const, tmp=None)
+      else: results[devar.name] = None # nothing to return (handled in aggregation)
     # N.B.: already partially aggregating here, saves memory
-    return outdata
+    return results
+
+
+## histograms and quantiles
+
+class Histogram(DerivedVariable):
+  ''' DerivedVariable child implementing monthly histograms (counts per bin at every grid point) of a variable or
+      of its interval means (e.g. daily means); the histograms are mergeable across months and chunks. '''
+  
+  def __init__(self, var, edges, scale='linear', interval=0, name=None, long_name=None, dimmap=None):
+    ''' Constructor; takes variable object and bin edges as argument and infers meta data; scale is the spacing of 
+        the bins ('linear' or 'log') and interval the averaging interval in days (0: every time step). '''
+    if isinstance(var, DerivedVariable): varname = var.name; axes = var.axes
+    elif isinstance(var, nc.Variable): varname = var._name; axes = var.dimensions
+    else: raise TypeError
+    if isinstance(dimmap,dict): axes = [dimmap[dim] if dim in dimmap else dim for dim in axes]
+    if name is None: name = 'Hist{0:s}'.format(varname[0].upper() + varname[1:])
+    if interval > 0: name = '{0:s}_{1:d}d'.format(name,interval)
+    self.edges = np.asarray(edges, dtype='float64'); self.scale = scale
+    self.bins = name+'_bins' # dimension of bins (including underflow and overflow bins)
+    self.edgename = name+'_edges' # bin edges (coordinate variable)
+    atts = dict(Aggregation='Monthly Histogram', Variable=varname, BinScale=scale, BinEdges=self.edgename,
+                HistogramBins='underflow, {:d} bins, overflow'.format(len(self.edges)-1))
+    if interval > 0: atts['AverageInterval'] = '{0:d} days'.format(interval)
+    if long_name is not None: atts['long_name'] = long_name
+    axes = [axes[0], self.bins] + list(axes[1:]) # time, bins, remaining axes
+    super(Histogram,self).__init__(name=name, units='', prerequisites=[varname], axes=axes, dtype=np.dtype('int16'), 
+                                   atts=atts, linear=False, normalize=False)
+    self.varunits = var.units # units of the binned variable (and the quantiles)
+    self.interval = interval * 24*60*60 # in seconds, since delta will be in seconds, too
+    self.dimsizes[self.bins] = len(self.edges) + 1
+    self.tmpdata = 'HST_'+self.name # handle for temporary storage (counts of the current month)
+    self.partialdata = 'HSI_'+self.name # partial interval (carried over to the next month)
+    self.bandstate = True # the state is pointwise
+
+  def startChunk(self, offset):
+    ''' Interval means do not depend on the previous chunk, if the chunk begins with a new interval. '''
+    if self.interval > 0 and offset % self.interval != 0:
+      raise DerivedVariableError, "Chunks have to begin with an averaging interval of '%s'."%(self.name)
+
+  def createVariable(self, target):
+    ''' Create the dimension of bins and the bin edges, if necessary, and the NetCDF Variable. '''
+    if self.bins not in target.dimensions: 
+      target.createDimension(self.bins, size=self.dimsizes[self.bins])
+      target.createDimension(self.edgename, size=len(self.edges))
+      add_var(target, name=self.edgename, dims=(self.edgename,), data=self.edges, 
+              atts=dict(units=self.varunits, BinScale=self.scale), dtype=np.dtype('float64'))
+    return super(Histogram,self).createVariable(target)
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Add the values (or interval means) of the slab to the histograms and return the counts of the current 
+        month (the state). '''
+    super(Histogram,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    data = indata[self.prerequisites[0]]
+    if aggax != 0: data = np.rollaxis(data, axis=aggax, start=0) # rollaxis just provides a view
+    pape = data.shape[1:] # shape without time axis
+    if self.interval > 0:
+      ilen = int( self.interval / delta ) # length of interval
+      if ilen < 1: raise ValueError, 'The output interval is longer than the averaging interval.'
+      key = self.partialdata
+      if key+'_N' in tmp: psum = tmp[key]; pcnt = tmp[key+'_N']
+      else: psum = None; pcnt = 0
+      data, tmp[key], tmp[key+'_N'] = intervalMeans(data, ilen, psum=psum, pcnt=pcnt)
+    if self.tmpdata in tmp: counts = tmp[self.tmpdata]
+    else: counts = tmp[self.tmpdata] = np.zeros((len(self.edges)+1,)+pape, dtype=count_dtype)
+    if data is not None: addCounts(counts, binIndex(data, self.edges))
+    return counts
+
+  def aggregateValues(self, comdata, aggdata=None, aggax=0):
+    ''' The counts of the current month replace the previous value (the state is aggregated in computeValues). '''
+    if not isinstance(comdata,np.ndarray) and comdata is not None: raise TypeError # newly computed values
+    return aggdata if comdata is None else comdata
+
+
+class Quantile(DerivedVariable):
+  ''' DerivedVariable child implementing quantiles (percentiles), which are estimated from monthly histograms;
+      the error bound depends on the bins (see histogram.errorBound). '''
+  
+  def __init__(self, hist, quantile, underflow=None, name=None, long_name=None):
+    ''' Constructor; takes a Histogram variable and the quantile (0 < quantile <= 1) as argument; quantiles in the 
+        underflow bin are set to underflow (default: the first bin edge). '''
+    if not isinstance(hist, Histogram): raise TypeError
+    varname = hist.atts['Variable']
+    if name is None: 
+      name = 'P{0:02d}{1:s}'.format(int(round(100*quantile)),varname[0].upper() + varname[1:])
+      if hist.interval > 0: name = '{0:s}_{1:d}d'.format(name, int(hist.interval/86400))
+    atts = dict(Aggregation='Monthly Percentile', Quantile=quantile, HistogramVariable=hist.name, 
+                ErrorBound=errorBound(hist.edges, hist.scale))
+    if 'AverageInterval' in hist.atts: atts['AverageInterval'] = hist.atts['AverageInterval']
+    if underflow is not None: atts['UnderflowValue'] = underflow
+    if long_name is not None: atts['long_name'] = long_name
+    axes = [ax for ax in hist.axes if ax != hist.bins]
+    super(Quantile,self).__init__(name=name, units=hist.varunits, prerequisites=[hist.name], axes=axes, 
+                                  dtype=dv_float, atts=atts, linear=False, normalize=False)
+    self.quantile = quantile; self.underflow = underflow
+    self.edges = hist.edges; self.scale = hist.scale
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Estimate the quantile of the current month from the histograms (bins along the first axis). '''
+    super(Quantile,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    values = histogramQuantiles(indata[self.prerequisites[0]], self.edges, self.quantile, scale=self.scale, 
+                                underflow=self.underflow)
+    return values.astype(self.dtype)
+
+  def aggregateValues(self, comdata, aggdata=None, aggax=0):
+    ''' The quantile of the current month replaces the previous value. '''
+    if not isinstance(comdata,np.ndarray) and comdata is not None: raise TypeError # newly computed values
+    return aggdata if comdata is None else comdata
+
+
+## diurnal cycle
+
+class Diurnal(DerivedVariable):
+  ''' DerivedVariable child implementing monthly mean diurnal cycles (composites of the mean by time of day) of a
+      variable; the time of day is UTC or local solar time (shifted by 4 minutes per degree longitude). '''
+  
+  def __init__(self, var, nbin=24, lsolar=False, calendar='proleptic_gregorian', name=None, long_name=None, 
+               dimmap=None):
+    ''' Constructor; takes variable object as argument and infers meta data; nbin is the number of time-of-day 
+        bins (hours, by default) and lsolar selects local solar time instead of UTC. '''
+    if isinstance(var, DerivedVariable): varname = var.name; axes = var.axes
+    elif isinstance(var, nc.Variable): varname = var._name; axes = var.dimensions
+    else: raise TypeError
+    if isinstance(dimmap,dict): axes = [dimmap[dim] if dim in dimmap else dim for dim in axes]
+    if name is None: name = '{0:s}_Diurnal'.format(varname)
+    self.nbin = nbin; self.lsolar = lsolar; self.calendar = calendar
+    self.tod = 'hour' # dimension of time-of-day bins
+    clock = 'local solar time' if lsolar else 'UTC'
+    atts = dict(Aggregation='Monthly Diurnal Cycle', Variable=varname, TimeOfDay=clock)
+    if long_name is not None: atts['long_name'] = long_name
+    axes = [axes[0], self.tod] + list(axes[1:]) # time, time of day, remaining axes
+    super(Diurnal,self).__init__(name=name, units=var.units, prerequisites=[varname, 'Times'], axes=axes, 
+                                 constants=['XLONG'] if lsolar else None, dtype=dv_float, atts=atts, 
+                                 linear=False, normalize=False)
+    self.dimsizes[self.tod] = nbin
+    self.timeaxis = TimeAxis(calendar=calendar) # only used to decode time stamps
+    self.tmpdata = 'DCS_'+self.name # handle for temporary storage (sums and counts of the current month)
+    self.bandstate = True # the state is pointwise
+
+  def createVariable(self, target):
+    ''' Create the time-of-day dimension and coordinate, if necessary, and the NetCDF Variable. '''
+    if self.tod not in target.dimensions: 
+      target.createDimension(self.tod, size=self.nbin)
+      clock = 'local solar time' if self.lsolar else 'UTC'
+      add_var(target, name=self.tod, dims=(self.tod,), data=np.arange(self.nbin)*24./self.nbin, 
+              atts=dict(units='hours', long_name='Beginning of Time-of-Day Bin ({:s})'.format(clock)), dtype=dv_float)
+    return super(Diurnal,self).createVariable(target)
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Add the values of the slab to the sums and counts of their time-of-day bins and return the mean diurnal 
+        cycle of the current month. '''
+    super(Diurnal,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    data = indata[self.prerequisites[0]]
+    if aggax != 0: data = np.rollaxis(data, axis=aggax, start=0) # rollaxis just provides a view
+    nt = data.shape[0]; pape = data.shape[1:] # shape without time axis
+    # time of day in minutes (vectorized)
+    tod = self.timeaxis.absoluteMinutes(np.asarray(indata['Times'])[:nt]) % 1440
+    tod = tod.reshape((nt,)+(1,)*len(pape)) # add singleton dimensions for broadcasting
+    if self.lsolar: # XLONG (with or without singleton time dimension) is broadcast from the right
+      xlon = const['XLONG']; tod = np.mod(tod + 4.*xlon.reshape(xlon.shape[-2:]), 1440)
+    idx = np.broadcast_to(( tod * self.nbin // 1440 ).astype(np.intp), data.shape).copy()
+    idx[np.isnan(data)] = -1 # skip missing values
+    # sums and counts are kept in one array, so that they are reset together
+    if self.tmpdata in tmp: state = tmp[self.tmpdata]
+    else: state = tmp[self.tmpdata] = np.zeros((2,self.nbin)+pape, dtype='float64')
+    addCounts(state[0], idx, weights=data) # sums
+    addCounts(state[1], idx) # counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+      return np.asarray(state[0] / state[1], dtype=self.dtype) # NaN for bins without samples
+
+  def aggregateValues(self, comdata, aggdata=None, aggax=0):
+    ''' The diurnal cycle of the current month replaces the previous value (it is aggregated in computeValues). '''
+    if not isinstance(comdata,np.ndarray) and comdata is not None: raise TypeError # newly computed values
+    return aggdata if comdata is None else comdata
+
+
+## statistical moments
+
+class Moment(DerivedVariable):
+  ''' DerivedVariable child implementing streaming moments (mean, variance, standard deviation or covariance). '''
+  
+  def __init__(self, var, moment, var2=None, name=None, long_name=None, dimmap=None):
+    ''' Constructor; takes variable object(s) as argument and infers meta data (var2 is only used for 'cov'). '''
+    variables = (var,) if var2 is None else (var,var2)
+    varnames = []; unitlist = []
+    for v in variables:
+      if isinstance(v, DerivedVariable): varnames.append(v.name); unitlist.append(v.units)
+      elif isinstance(v, nc.Variable): varnames.append(v._name); unitlist.append(v.units)
+      else: raise TypeError
+    axes = var.axes if isinstance(var, DerivedVariable) else var.dimensions # same for both variables
+    if ( moment == 'cov' ) != ( var2 is not None ): raise ValueError, 'Only covariances require two variables.'
+    # infer units and attributes
+    if moment in ('mean','std'): units = unitlist[0]
+    elif moment == 'var': units = unitlist[0]+'^2' if unitlist[0].isalpha() else '({:s})^2'.format(unitlist[0])
+    elif moment == 'cov': units = ' '.join([u for u in unitlist if u])
+    else: raise ValueError, "Unknown moment '{:s}'.".format(moment)
+    atts = dict(Aggregation={'mean':'Monthly Mean', 'var':'Monthly Variance', 'std':'Monthly Standard Deviation',
+                             'cov':'Monthly Covariance'}[moment])
+    if moment != 'mean': 
+      atts['ddof'] = 0 # population (co-)variance, i.e. the sum of squares divided by N
+      atts['MomentVariables'] = ' '.join(varnames) # means that are needed to merge moments of several months
+    if long_name is not None: atts['long_name'] = long_name
+    if isinstance(dimmap,dict): axes = [dimmap[dim] if dim in dimmap else dim for dim in axes]
+    if name is None: name = '{0:s}_{1:s}'.format('_'.join(varnames), moment.title())
+    super(Moment,self).__init__(name=name, units=units, prerequisites=varnames, axes=axes, dtype=dv_float, 
+                                atts=atts, linear=False, normalize=False)
+    self.moment = moment
+    self.tmpdata = 'MOM_'+self.name # handle for temporary storage (state of the current month)
+    self.bandstate = True # the state is pointwise
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Update the moment state and return the moment of the current month '''
+    # N.B.: a single variable is just a group of one
+    return MomentGroup([self]).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp)[self.name]
+
+  def aggregateValues(self, comdata, aggdata=None, aggax=0):
+    ''' The moment of the current month replaces the previous value (the state is aggregated in computeValues). '''
+    if not isinstance(comdata,np.ndarray) and comdata is not None: raise TypeError # newly computed values
+    return aggdata if comdata is None else comdata
+
+
+class MomentGroup(object):
+  '''
+    A group of moments of the same variable(s) (e.g. mean, variance and standard deviation), which share one
+    moment state; the moments of every slab are merged into the state of the month (the state is stored for 
+    every member, but it is the same array).
+  '''
+
+  def __init__(self, variables):
+    ''' Initialize with a list of Moment variables of the same prerequisite(s). '''
+    if not all([isinstance(devar,Moment) for devar in variables]): raise TypeError
+    if len(set([tuple(devar.prerequisites) for devar in variables])) > 1: 
+      raise DerivedVariableError, 'Grouped moments have to have the same variables.'
+    self.variables = variables
+    self.names = [devar.name for devar in variables]
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Compute the moments of the slab once, merge them into the state and return an ordered dictionary of the
+        moments of the current month. '''
+    prerequisites = self.variables[0].prerequisites
+    slab = slabMoments(*[indata[pq] for pq in prerequisites], axis=aggax)
+    key = self.variables[0].tmpdata
+    state = mergeMoments(tmp[key] if key in tmp else None, slab)
+    results = OrderedDict()
+    for devar in self.variables:
+      tmp[devar.tmpdata] = state
+      results[devar.name] = np.asarray(getMoment(state, devar.moment), dtype=devar.dtype)
+    return results
@@ -0,0 +1,94 @@
+'''
+Created on 2026-10-18
+
+A module providing per-gridpoint histograms with fixed bins for wrfout_average; histograms are mergeable sketches
+of the distribution at every grid point, from which quantiles (e.g. the 90th percentile) can be estimated.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+
+# data type of histogram counts (in memory; output files can use a smaller type)
+count_dtype = np.dtype('int32')
+
+
+# class for errors with histograms
+class HistogramError(Exception):
+  ''' Exceptions related to histograms and quantile estimation. '''
+  pass
+
+
+def linearBins(vmin, vmax, nbin):
+  ''' Return nbin+1 equally spaced bin edges between vmin and vmax. '''
+  if not vmax > vmin or nbin < 1: raise HistogramError, 'Invalid bin range or number of bins.'
+  return np.linspace(vmin, vmax, nbin+1)
+
+def logBins(vmin, vmax, nbin):
+  ''' Return nbin+1 logarithmically spaced bin edges between vmin and vmax (both positive), i.e. the ratio of the
+      edges of every bin is the same: ( vmax / vmin )**( 1. / nbin ). '''
+  if not vmax > vmin > 0 or nbin < 1: raise HistogramError, 'Invalid bin range or number of bins.'
+  return np.logspace(np.log10(vmin), np.log10(vmax), nbin+1)
+
+def errorBound(edges, scale):
+  ''' Return a description of the maximum error of quantile estimates from a histogram: the estimate is in the
+      same bin as the exact quantile, so the error is less than the largest bin width (linear bins) or, relative
+      to the estimate, the bin ratio minus one (log bins); values outside the edges are clipped. '''
+  if scale == 'log': return 'relative error < {:.3f}'.format(np.max(edges[1:]/edges[:-1]) - 1.)
+  elif scale == 'linear': return 'absolute error < {:.3g}'.format(np.max(np.diff(edges)))
+  else: raise HistogramError, "Unknown bin scale '{:s}'.".format(scale)
+
+def binIndex(data, edges):
+  ''' Return the bin indices of data: 0 is the underflow bin (below the first edge), len(edges) the overflow bin
+      (at or above the last edge), and -1 indicates missing values (NaN). '''
+  idx = np.searchsorted(edges, data, side='right').astype(np.intp)
+  idx[np.isnan(data)] = -1 # N.B.: NaN is sorted to the end, so it would end up in the overflow bin
+  return idx
+
+def addCounts(counts, idx, weights=None):
+  ''' Add the samples with bin indices idx (time steps along the first axis, followed by the same point axes as
+      counts) to the histograms counts (bins along the first axis), in place; missing values (-1) are skipped.
+      With weights (same shape as idx), the weights are summed instead of counting samples (binned sums).
+      Large samples are counted with one np.bincount over all points, small samples with np.add.at (which
+      avoids the temporary array of the size of all histograms). '''
+  nbin = counts.shape[0]; npts = counts[0].size
+  if idx.shape[1:] != counts.shape[1:]: raise HistogramError, 'Sample and histogram shapes are incompatible.'
+  if not counts.flags.c_contiguous: raise HistogramError, 'Histograms have to be contiguous (updated in place).'
+  idx = idx.reshape((-1,npts)); valid = idx >= 0; lvalid = valid.all()
+  flat = idx * npts + np.arange(npts, dtype=np.intp) # index into the flattened histograms
+  flat = flat.ravel() if lvalid else flat[valid]
+  if weights is not None:
+    if weights.size != idx.size: raise HistogramError, 'Weights and samples have to have the same size.'
+    weights = weights.ravel() if lvalid else weights.reshape(idx.shape)[valid]
+  if flat.size * 4 >= counts.size:
+    counts += np.bincount(flat, weights=weights, minlength=counts.size).reshape(counts.shape).astype(counts.dtype)
+  else: np.add.at(counts.reshape((nbin*npts,)), flat, 1 if weights is None else weights) # counts is contiguous
+  return counts
+
+def histogramQuantiles(counts, edges, quantile, scale='linear', underflow=None):
+  ''' Estimate a quantile (0 < quantile <= 1) from histograms (bins along the first axis): the bin that contains
+      the nearest-rank sample is found for every point and the value is interpolated within the bin, assuming
+      that samples are spread evenly (in log space for log bins). Quantiles in the underflow bin are set to
+      underflow (default: the first edge) and in the overflow bin to the last edge; points without samples are
+      NaN. Returns an array with the shape of a single histogram. '''
+  if not 0 < quantile <= 1: raise HistogramError, 'Quantiles have to be in (0,1].'
+  nbin = counts.shape[0]
+  if nbin != len(edges)+1: raise HistogramError, 'The number of bins does not match the bin edges.'
+  shape = counts.shape[1:]; counts = counts.reshape((nbin,-1))
+  cumsum = np.cumsum(counts, axis=0, dtype='int64'); total = cumsum[-1]
+  rank = np.maximum(np.ceil(quantile*total), 1) # nearest rank (1-based)
+  ibin = np.minimum(( cumsum < rank ).sum(axis=0), nbin-1) # first bin where the cumulative count reaches the rank
+  points = np.arange(counts.shape[1])
+  below = np.where(ibin > 0, cumsum[ibin-1,points], 0); inbin = counts[ibin,points]
+  with np.errstate(invalid='ignore', divide='ignore'):
+    frac = ( rank - below - 0.5 ) / inbin # position of the sample within the bin
+  i0 = np.clip(ibin-1, 0, len(edges)-2) # regular bins: ibin-1 is the index of the left edge
+  lo = edges[i0]; hi = edges[i0+1]
+  if scale == 'log': values = lo * ( hi / lo )**frac
+  elif scale == 'linear': values = lo + ( hi - lo ) * frac
+  else: raise HistogramError, "Unknown bin scale '{:s}'.".format(scale)
+  values[ibin == 0] = edges[0] if underflow is None else underflow
+  values[ibin == nbin-1] = edges[-1]
+  values[total == 0] = np.NaN
+  return values.reshape(shape)
@@ -0,0 +1,82 @@
+'''
+Created on 2026-10-18
+
+A module providing streaming statistical moments (mean, variance, covariance) for wrfout_average; 
+the moment states of slabs, files or months can be merged in any order (pairwise update of Chan et al.).
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+
+# precision of moment states
+moment_float = np.dtype('float64')
+
+
+# class for errors with moments
+class MomentError(Exception):
+  ''' Exceptions related to statistical moments. '''
+  pass
+
+
+def slabMoments(x, y=None, axis=0):
+  ''' Return the moment state of a slab along axis: a stacked array of the sample count, the mean and the sum of
+      squared deviations (n, mean, M2), or, if y is given, the sample count, both means and the co-moment
+      (n, mean_x, mean_y, C); missing values (NaN) propagate, as in regular averages. '''
+  if axis != 0: # roll time axis to the front (views)
+    x = np.rollaxis(x, axis=axis, start=0)
+    if y is not None: y = np.rollaxis(y, axis=axis, start=0)
+  if y is not None and y.shape != x.shape: raise MomentError, 'Arrays of co-moments have to have the same shape.'
+  n = x.shape[0]
+  if n == 0: return None
+  variables = (x,) if y is None else (x,y)
+  state = np.empty((len(variables)+2,)+x.shape[1:], dtype=moment_float)
+  state[0] = n
+  # first pass: means
+  for i,var in enumerate(variables):
+    np.add.reduce(var, axis=0, dtype=moment_float, out=state[i+1])
+    state[i+1] /= n
+  # second pass: (co-)variance, one time step at a time (no temporary copy of the slab in double precision)
+  dx = np.empty(x.shape[1:], dtype=moment_float); dy = np.empty_like(dx) if y is not None else dx
+  M = state[-1]; M.fill(0)
+  for t in xrange(n):
+    np.subtract(x[t], state[1], out=dx)
+    if y is not None: np.subtract(y[t], state[2], out=dy)
+    np.multiply(dx, dy, out=dx); M += dx
+  return state
+
+def mergeMoments(a, b):
+  ''' Merge two moment states (see slabMoments) with the pairwise update of Chan et al.; either state can be None
+      (empty). Returns a new state. '''
+  if a is None: return b
+  if b is None: return a
+  if a.shape != b.shape: raise MomentError, 'Only moment states of the same shape can be merged.'
+  na = a[0]; nb = b[0]; n = na + nb
+  with np.errstate(invalid='ignore', divide='ignore'): fb = nb / n # weight of the second state (NaN, if empty)
+  state = np.empty_like(a); state[0] = n
+  deltas = [b[i]-a[i] for i in xrange(1,a.shape[0]-1)] # difference of the means
+  for i,delta in enumerate(deltas): state[i+1] = a[i+1] + delta*fb
+  state[-1] = a[-1] + b[-1] + deltas[0]*deltas[-1]*na*fb
+  return state
+
+def stateFromMoments(n, mean, var, mean_y=None):
+  ''' Construct a moment state from a sample count, mean(s) and the (population) variance or covariance (e.g. the
+      monthly output of moment variables), so that it can be merged with other states. '''
+  means = (mean,) if mean_y is None else (mean,mean_y)
+  state = np.empty((len(means)+2,)+np.shape(var), dtype=moment_float)
+  state[0] = n
+  for i,mean in enumerate(means): state[i+1] = mean
+  np.multiply(var, n, out=state[-1])
+  return state
+
+def getMoment(state, moment):
+  ''' Return a moment from a state: 'mean', 'var' (population variance), 'std' (standard deviation) or 'cov'
+      (population covariance; only for states of two variables). '''
+  if moment == 'mean': return state[1].copy()
+  elif moment in ('var','std','cov'):
+    if ( moment == 'cov' ) != ( state.shape[0] == 4 ):
+      raise MomentError, "Moment '{:s}' is not available from this state.".format(moment)
+    with np.errstate(invalid='ignore', divide='ignore'): var = state[-1] / state[0]
+    return np.sqrt(var) if moment == 'std' else var
+  else: raise MomentError, "Unknown moment '{:s}'.".format(moment)
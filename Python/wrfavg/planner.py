@@ -0,0 +1,174 @@
+'''
+Created on 2026-10-18
+
+A module providing a dependency-graph planner for derived variables in wrfout_average; it determines
+the order of computation, fuses or batches related variables and releases prerequisites after their last use.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import heapq
+from collections import OrderedDict
+from wrfavg.derived_variables import ExpressionVariable, ExpressionGroup, ConsecutiveExtrema, ConsecutiveExtremaGroup
+from wrfavg.derived_variables import WetDays, WetDayRain, WetDayGroup, MeanExtrema, MeanExtremaGroup
+from wrfavg.derived_variables import Moment, MomentGroup
+
+
+# class for errors with the plan
+class PlanError(Exception):
+  ''' Exceptions related to the dependency graph of derived variables. '''
+  pass
+
+
+def findCycle(deps, names):
+  ''' Return a list of names that form a cycle in the dependency graph (restricted to names). '''
+  name = names[0]; path = []
+  while name not in path:
+    path.append(name)
+    name = [dep for dep in deps[name] if dep in names][0] # every remaining variable depends on a remaining one
+  return path[path.index(name):] + [name]
+
+
+def fusionKey(devar):
+  ''' Return a key that identifies variables that can be computed together in one step (None, if not). '''
+  if isinstance(devar,ExpressionVariable): return ('expression',)
+  elif isinstance(devar,ConsecutiveExtrema): return ('consecutive',devar.prerequisites[0])
+  elif isinstance(devar,(WetDays,WetDayRain)): return ('wetdays',devar.rain)
+  elif isinstance(devar,MeanExtrema): return ('meanextrema',devar.prerequisites[0],devar.interval)
+  elif isinstance(devar,Moment): return ('moments',)+tuple(devar.prerequisites)
+  else: return None
+
+def makeGroup(variables):
+  ''' Return a group object for a list of variables with the same fusion key. '''
+  kind = fusionKey(variables[0])[0]
+  if kind == 'expression': return ExpressionGroup(variables)
+  elif kind == 'consecutive': return ConsecutiveExtremaGroup(variables)
+  elif kind == 'wetdays': return WetDayGroup(variables)
+  elif kind == 'meanextrema': return MeanExtremaGroup(variables)
+  elif kind == 'moments': return MomentGroup(variables)
+
+
+def sortVariables(devars):
+  ''' Sort an ordered dictionary of derived variables topologically (prerequisites first); the original order is
+      preserved, where possible. Raises PlanError, if there are cyclic dependencies. '''
+  position = {name:i for i,name in enumerate(devars.iterkeys())}
+  deps = {name:[pq for pq in devar.prerequisites if pq in devars] for name,devar in devars.iteritems()}
+  consumers = {name:[] for name in devars.iterkeys()}
+  for name,pqs in deps.iteritems():
+    for pq in pqs: consumers[pq].append(name)
+  # Kahn's algorithm, with the original position as priority
+  ndeps = {name:len(pqs) for name,pqs in deps.iteritems()}
+  ready = [(position[name],name) for name,n in ndeps.iteritems() if n == 0]
+  heapq.heapify(ready)
+  order = []
+  while ready:
+    pos, name = heapq.heappop(ready)
+    order.append(name)
+    for consumer in consumers[name]:
+      ndeps[consumer] -= 1
+      if ndeps[consumer] == 0: heapq.heappush(ready, (position[consumer],consumer))
+  if len(order) < len(devars):
+    remaining = [name for name in devars.iterkeys() if name not in set(order)]
+    raise PlanError, 'Cyclic dependency between derived variables: {:s}'.format(' -> '.join(findCycle(deps, remaining)))
+  return OrderedDict([(name,devars[name]) for name in order])
+
+
+def propagateNonlinearity(devars):
+  ''' Prerequisites of non-linear variables have to be computed for every slab, so they are treated as non-linear,
+      too; devars has to be sorted topologically (consumers are visited before their prerequisites). '''
+  for devar in reversed(devars.values()):
+    if not devar.linear:
+      for pq in devar.prerequisites:
+        if pq in devars: devars[pq].linear = False
+
+
+class ExecutionPlan(object):
+  '''
+    The sequence of steps to compute the non-linear derived variables for one slab; a step is either a single
+    derived variable or a group of fused expressions (ExpressionGroup). After each step, the prerequisites that
+    are not needed by any later step can be released.
+  '''
+
+  def __init__(self, devars, pqset=None, sizes=None, lfuse=True):
+    ''' Create a plan from a topologically sorted dictionary of derived variables; sizes are the sizes of the 
+        arrays of variables (e.g. bytes per time step), which are used to schedule variables that release 
+        memory first (otherwise the original order is used). If lfuse, consecutive expression variables are 
+        evaluated as a group. '''
+    sizes = sizes or dict()
+    self.pqset = set(pqset) if pqset is not None else set().union(*[devar.prerequisites for devar in devars.itervalues()
+                                                                   if not devar.linear])
+    # only non-linear variables are computed for every slab
+    nodes = [name for name,devar in devars.iteritems() if not devar.linear]
+    position = {name:i for i,name in enumerate(nodes)}
+    keys = {name:fusionKey(devars[name]) if lfuse else None for name in nodes}
+    # N.B.: wet-day groups return time sums, which can only be used by members of the same group
+    for name in nodes:
+      for pq in devars[name].prerequisites:
+        if keys.get(pq) is not None and keys[pq][0] == 'wetdays' and keys[pq] != keys[name]: keys[pq] = None
+    remaining = dict() # number of consumers that were not computed yet
+    for name in nodes:
+      for pq in set(devars[name].prerequisites): remaining[pq] = remaining.get(pq,0) + 1
+    # greedy list scheduling: among the variables whose prerequisites are available, pick the one that releases 
+    # the most memory; prefer variables that can be fused with the previous one and the original order
+    def score(name):
+      added = sizes.get(name,0) if name in self.pqset else 0 # results that are not prerequisites are transient
+      freed = sum([sizes.get(pq,0) for pq in set(devars[name].prerequisites) if remaining[pq] == 1])
+      lfused = bool(order) and keys[name] is not None and keys[name] == keys[order[-1]]
+      return (freed - added, lfused, -position[name])
+    order = []; done = set()
+    while len(order) < len(nodes):
+      ready = [name for name in nodes if name not in done and 
+               all([pq in done for pq in devars[name].prerequisites if pq in position])]
+      if not ready: raise PlanError, 'Cyclic dependency between derived variables: {:s}'.format(', '.join(set(nodes)-done))
+      name = max(ready, key=score)
+      order.append(name); done.add(name)
+      for pq in set(devars[name].prerequisites): remaining[pq] -= 1
+    # assemble steps; consecutive variables with the same fusion key form a group
+    self.steps = [] # tuples of group (None for single variables) and names of computed variables
+    for name in order:
+      key = keys[name]
+      if key is not None:
+        if self.steps and self.steps[-1][0] == key: self.steps[-1][1].append(name)
+        else: self.steps.append( (key,[name]) ) # group is created below
+      else: self.steps.append( (None,[name]) )
+    self.steps = [(makeGroup([devars[name] for name in names]) if key is not None else None, names) 
+                  for key,names in self.steps]
+    # inputs of each step and last consumer of each prerequisite
+    self.inputs = [sorted(set().union(*[devars[name].prerequisites for name in names])) for group,names in self.steps]
+    lastuse = dict()
+    for istep,inputs in enumerate(self.inputs):
+      for pq in inputs: lastuse[pq] = istep
+    self.release = [sorted([pq for pq in inputs if lastuse[pq] == istep]) for istep,inputs in enumerate(self.inputs)]
+
+  def estimatePeak(self, sizes, lrelease=True):
+    ''' Estimate the peak memory of one slab, given the sizes of all arrays (e.g. bytes per time step); all
+        prerequisites that are read from file are live at the beginning, results of a step are live during the
+        step and prerequisites are kept until their last consumer (lrelease) or until the end. '''
+    computed = set([name for group,names in self.steps for name in names])
+    live = set([pq for pq in self.pqset if pq not in computed])
+    current = sum([sizes.get(name,0) for name in live]); peak = current
+    for (group,names),release in zip(self.steps,self.release):
+      outputs = sum([sizes.get(name,0) for name in names])
+      peak = max(peak, current + outputs)
+      # results that are not prerequisites are only aggregated
+      for name in names:
+        if name in self.pqset: live.add(name); current += sizes.get(name,0)
+      if lrelease:
+        for name in release:
+          if name in live: live.remove(name); current -= sizes.get(name,0)
+    return peak
+
+  def describe(self, sizes=None, scale=1., units='MB'):
+    ''' Return a printable description of the plan, with memory estimates, if sizes are given. '''
+    lines = []
+    for istep,((group,names),release) in enumerate(zip(self.steps,self.release)):
+      if group is None: kind = 'class'
+      else: kind = 'fused' if isinstance(group,ExpressionGroup) else 'batch'
+      line = '  {:2d} ({:s}): {:s}'.format(istep, kind, ', '.join(names))
+      if release: line += '  [release: {:s}]'.format(', '.join(release))
+      lines.append(line)
+    if sizes is not None:
+      lines.append('  Estimated peak memory: {:.1f} {:s} (without early release: {:.1f} {:s})'.format(
+                   self.estimatePeak(sizes)*scale, units, self.estimatePeak(sizes, lrelease=False)*scale, units))
+    return '\n'.join(lines)
@@ -0,0 +1,178 @@
+'''
+Created on 2026-10-18
+
+A module providing a background reader, which loads the next wrfout file(s) into memory, while the 
+current file is being averaged by wrfout_average.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+import threading, Queue
+from collections import OrderedDict
+import netCDF4 as nc
+
+# lock to serialize calls to the NetCDF/HDF5 library between threads (HDF5 is usually not thread-safe)
+nclock = threading.RLock()
+# size of the blocks that are read into recycled buffers (the temporary array of a read)
+prefetch_blockbytes = 32*1024**2
+
+
+# class for errors with prefetching
+class PrefetchError(Exception):
+  ''' Exceptions related to prefetching of input files. '''
+  pass
+
+
+class PrefetchedDimension(object):
+  ''' Stand-in for a netCDF4 Dimension; only provides the length. '''
+
+  def __init__(self, name, size):
+    self.name = name; self.size = size
+
+  def __len__(self):
+    return self.size
+
+
+class PrefetchedVariable(object):
+  ''' Stand-in for a netCDF4 Variable with all data loaded into memory (read-only). '''
+
+  def __init__(self, name, data, dimensions, atts=None):
+    self._name = name
+    self.data = data # the entire array
+    self.dimensions = tuple(dimensions)
+    self.atts = atts or dict()
+
+  shape = property(lambda self: self.data.shape)
+  ndim = property(lambda self: self.data.ndim)
+  dtype = property(lambda self: self.data.dtype)
+
+  def __getitem__(self, key):
+    ''' Return a copy of the selected data, just like a read from file. '''
+    if isinstance(key,list): key = tuple(key) # netCDF4 also accepts lists of slices
+    return np.array(self.data[key]) # copy, so that in-place operations don't change the buffer
+
+  def ncattrs(self):
+    return self.atts.keys()
+
+  def getncattr(self, att):
+    return self.atts[att]
+
+  def __getattr__(self, att):
+    ''' Access NetCDF attributes like netCDF4 Variables do. '''
+    if att != 'atts' and att in self.atts: return self.atts[att]
+    else: raise AttributeError, att
+
+
+def readInto(var, buf, blockbytes=None):
+  ''' Read a NetCDF variable into an existing array (of the same shape and type) in blocks along the first axis,
+      so that the temporary arrays of netCDF4 are small; returns False, if the variable has masked values. '''
+  blockbytes = prefetch_blockbytes if blockbytes is None else blockbytes
+  nrec = max(1, int(blockbytes // max(1,buf[0].nbytes))) if buf.ndim > 0 else 1
+  for i in xrange(0, buf.shape[0] if buf.ndim > 0 else 1, nrec):
+    # N.B.: release the lock between blocks, so that other threads can access the library
+    with nclock: 
+      block = var[i:i+nrec] if buf.ndim > 0 else var[:]
+    if np.ma.is_masked(block): return False # can not be stored in a plain array
+    if buf.ndim > 0: buf[i:i+nrec] = block
+    else: buf[()] = block
+  return True
+
+
+class PrefetchedDataset(object):
+  ''' Stand-in for a netCDF4 Dataset with the selected variables loaded into memory (read-only). '''
+
+  def __init__(self, filepath, varlist=None, buffers=None, pool=None):
+    ''' Open a NetCDF file, load variables and attributes into memory, and close it again; buffers is a 
+        dictionary of arrays of a closed dataset, which are reused, if shape and type match, and the arrays are 
+        returned to pool (a Queue), when the dataset is closed. '''
+    self.filepath = filepath; self.pool = pool
+    if buffers is None: buffers = dict()
+    with nclock: ds = nc.Dataset(filepath, 'r', format='NETCDF4')
+    try:
+      with nclock:
+        self.dimensions = OrderedDict([(dim,PrefetchedDimension(dim,len(ds.dimensions[dim]))) for dim in ds.dimensions])
+        self.atts = OrderedDict([(att,ds.getncattr(att)) for att in ds.ncattrs()])
+      self.variables = OrderedDict()
+      if varlist is None: varlist = ds.variables.keys()
+      for varname in varlist:
+        if varname not in ds.variables: continue # missing variables are handled by the caller
+        # N.B.: release the lock between variables, so that other threads can access the library
+        with nclock:
+          var = ds.variables[varname]
+          atts = dict([(att,var.getncattr(att)) for att in var.ncattrs()])
+        buf = buffers.get(varname)
+        if not ( isinstance(buf,np.ndarray) and buf.shape == var.shape and buf.dtype == var.dtype 
+                 and readInto(var, buf) ): 
+          with nclock: buf = var[:] # new array
+        self.variables[varname] = PrefetchedVariable(varname, buf, var.dimensions, atts=atts)
+    finally:
+      with nclock: ds.close()
+
+  def ncattrs(self):
+    return self.atts.keys()
+
+  def getncattr(self, att):
+    return self.atts[att]
+
+  def __getattr__(self, att):
+    ''' Access global NetCDF attributes like netCDF4 Datasets do. '''
+    if att != 'atts' and att in self.atts: return self.atts[att]
+    else: raise AttributeError, att
+
+  def close(self):
+    ''' Release memory or return the arrays to the pool for reuse. '''
+    # N.B.: views of the arrays (see PrefetchedVariable) must not be used after the dataset was closed
+    if self.pool is not None and self.variables:
+      self.pool.put(dict([(varname,var.data) for varname,var in self.variables.iteritems()]))
+    self.variables = OrderedDict()
+
+
+class FilePrefetcher(object):
+  '''
+    A background thread that loads a list of files in order, up to 'depth' files ahead of the consumer.
+    The consumer has to request the files in the same order, using nextFile(); the arrays of closed files
+    are reused for the next files, so that at most depth+1 files are held in memory and no new arrays have to
+    be allocated, if the files have the same shape.
+  '''
+
+  def __init__(self, filelist, folder='', varlist=None, depth=1):
+    ''' Start the reader thread; varlist is the list of variables to load (default: all). '''
+    if depth < 1: raise PrefetchError, 'The prefetch depth has to be at least 1.'
+    self.filelist = list(filelist); self.folder = folder
+    self.varlist = varlist; self.depth = depth
+    self.slots = threading.Semaphore(depth) # limits the number of files that are read ahead
+    self.queue = Queue.Queue()
+    self.pool = Queue.Queue() # arrays of closed files
+    self.lstop = False
+    self.thread = threading.Thread(target=self._readFiles, name='FilePrefetcher')
+    self.thread.daemon = True # don't keep the process alive
+    self.thread.start()
+
+  def _readFiles(self):
+    ''' Worker function executed by the reader thread. '''
+    for filename in self.filelist:
+      self.slots.acquire() # wait until the consumer catches up
+      if self.lstop: break
+      try: buffers = self.pool.get_nowait() # reuse the arrays of a closed file
+      except Queue.Empty: buffers = None
+      try: dataset = PrefetchedDataset(self.folder+filename, varlist=self.varlist, buffers=buffers, pool=self.pool)
+      except Exception as err: dataset = err # pass on to consumer
+      self.queue.put( (filename, dataset) )
+
+  def nextFile(self, filename):
+    ''' Return the next file (has to be requested in order); blocks until it is loaded. '''
+    prefetched, dataset = self.queue.get()
+    self.slots.release() # allow the next file to be read
+    if prefetched != filename:
+      raise PrefetchError, "Files have to be requested in order: expected '{:s}', got '{:s}'.".format(prefetched,filename)
+    if isinstance(dataset, Exception): raise dataset # reraise error in consumer thread
+    return dataset
+
+  def close(self):
+    ''' Stop the reader thread after the current file and discard prefetched files. '''
+    self.lstop = True
+    self.slots.release() # in case the reader is waiting for a slot
+    while not self.queue.empty(): self.queue.get()
+    while not self.pool.empty(): self.pool.get()
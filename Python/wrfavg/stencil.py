@@ -0,0 +1,80 @@
+'''
+Created on 2026-10-18
+
+A module providing finite-difference stencils along any axis for derived variables in wrfout_average, 
+including WRF map-scale factors.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+
+# default precision of derivatives (same as derived variables)
+stencil_float = np.dtype('float32')
+
+
+# class for errors with stencils
+class StencilError(Exception):
+  ''' Exceptions related to finite-difference stencils. '''
+  pass
+
+
+def axisSlice(ndim, axis, index):
+  ''' Return an index tuple that applies index (a slice or an integer) along axis. '''
+  return (slice(None),)*axis + (index,) + (slice(None),)*(ndim-axis-1)
+
+def checkArgs(data, axis, out, dtype):
+  ''' Check arguments and allocate output array, if necessary. '''
+  if not isinstance(data,np.ndarray): raise TypeError
+  if not isinstance(axis,(int,np.integer)): raise TypeError
+  if axis < 0: axis += data.ndim
+  if not 0 <= axis < data.ndim: raise StencilError, 'Axis {:d} is out of range.'.format(axis)
+  if out is None: out = np.empty(data.shape, dtype=dtype)
+  elif out.shape != data.shape: raise StencilError, 'Output array has the wrong shape: {:s}'.format(str(out.shape))
+  return axis, out
+
+def scale(out, delta=1, mapfac=None):
+  ''' Divide by grid spacing and multiply with map-scale factor (in place). '''
+  if delta != 1: np.divide(out, delta, out=out)
+  if mapfac is not None: np.multiply(out, mapfac, out=out) # broadcast over outer dimensions
+  return out
+
+
+def forwardDiff(data, axis=0, delta=1, out=None, mapfac=None, dtype=stencil_float):
+  ''' Compute forward differences along axis (backward difference at the last point) and write them into out
+      (allocated, if None); differences are divided by delta and multiplied with mapfac, if given. '''
+  axis, out = checkArgs(data, axis, out, dtype)
+  n = data.shape[axis]; nd = data.ndim
+  if n < 2: out.fill(0); return out
+  np.subtract(data[axisSlice(nd,axis,slice(1,None))], data[axisSlice(nd,axis,slice(None,-1))],
+              out=out[axisSlice(nd,axis,slice(None,-1))])
+  out[axisSlice(nd,axis,-1)] = out[axisSlice(nd,axis,-2)] # last point: backward difference
+  return scale(out, delta=delta, mapfac=mapfac)
+
+def backwardDiff(data, axis=0, delta=1, out=None, mapfac=None, dtype=stencil_float):
+  ''' Compute backward differences along axis (forward difference at the first point) and write them into out
+      (allocated, if None); differences are divided by delta and multiplied with mapfac, if given. '''
+  axis, out = checkArgs(data, axis, out, dtype)
+  n = data.shape[axis]; nd = data.ndim
+  if n < 2: out.fill(0); return out
+  np.subtract(data[axisSlice(nd,axis,slice(1,None))], data[axisSlice(nd,axis,slice(None,-1))],
+              out=out[axisSlice(nd,axis,slice(1,None))])
+  out[axisSlice(nd,axis,0)] = out[axisSlice(nd,axis,1)] # first point: forward difference
+  return scale(out, delta=delta, mapfac=mapfac)
+
+def centredDiff(data, axis=0, delta=1, out=None, mapfac=None, dtype=stencil_float):
+  ''' Compute centred differences along axis (one-sided differences at the boundaries) and write them into out
+      (allocated, if None); differences are divided by 2*delta (delta at the boundaries) and multiplied with
+      mapfac, if given. The same stencil as ctrDiff, but without rolling axes or temporary arrays. '''
+  axis, out = checkArgs(data, axis, out, dtype)
+  n = data.shape[axis]; nd = data.ndim
+  if n < 2: out.fill(0); return out
+  # interior points
+  inner = out[axisSlice(nd,axis,slice(1,-1))]
+  np.subtract(data[axisSlice(nd,axis,slice(2,None))], data[axisSlice(nd,axis,slice(None,-2))], out=inner)
+  np.divide(inner, 2, out=inner) # normalize, except boundaries
+  # one-sided differences at the boundaries
+  np.subtract(data[axisSlice(nd,axis,1)], data[axisSlice(nd,axis,0)], out=out[axisSlice(nd,axis,0)])
+  np.subtract(data[axisSlice(nd,axis,-1)], data[axisSlice(nd,axis,-2)], out=out[axisSlice(nd,axis,-1)])
+  return scale(out, delta=delta, mapfac=mapfac)
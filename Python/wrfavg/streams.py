@@ -0,0 +1,470 @@
+'''
+Created on 2026-10-18
+
+A module providing daily, seasonal and annual output streams for wrfout_average; daily means are accumulated
+from the same slabs as the monthly means, seasonal and annual means are aggregated from the monthly records, and
+climatologies of user-declared periods are updated incrementally, whenever monthly records are added.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+import os, shutil
+from collections import OrderedDict
+import netCDF4 as nc
+# my own netcdf stuff
+from utils.nctools import add_coord, add_var, copy_dims, copy_ncatts, copy_vars
+from wrfavg.timeaxis import TimeAxis
+from wrfavg.moments import stateFromMoments, mergeMoments, getMoment
+from wrfavg.histogram import histogramQuantiles
+
+# output streams (monthly means are always computed, because the other streams depend on them)
+stream_names = ('daily','monthly','seasonal','annual','histogram','diurnal')
+monthly_streams = ('histogram','diurnal') # monthly records of derived variables that are written to separate files
+period_months = dict(seasonal=3, annual=12) # number of months per period
+period_titles = dict(seasonal='Seasonal', annual='Annual') # replaces 'Monthly' in aggregation attributes
+season_names = ('DJF','MAM','JJA','SON') # N.B.: DJF starts in December of the previous year
+month_names = ('January  ', 'February ', 'March    ', 'April    ', 'May      ', 'June     ', # climatologies
+               'July     ', 'August   ', 'September', 'October  ', 'November ', 'December ')
+time = 'time' # time dimension in output files
+timestamp = 'Times' # time stamp of the first time step of a record
+stream_float = np.dtype('float64') # precision of daily sums and period aggregation
+
+
+# class for errors with output streams
+class StreamError(Exception):
+  ''' Exceptions related to output streams. '''
+  pass
+
+
+def periodIndex(year, month, period):
+  ''' Return an absolute index of the season or year that contains a month (vectorized); seasons are counted
+      four per year, starting with DJF, which includes December of the previous year. '''
+  year = np.asarray(year); month = np.asarray(month)
+  if period == 'seasonal': return ( year*12 + month ) // 3
+  elif period == 'annual': return year
+  else: raise StreamError, "Unknown period '{:s}'.".format(period)
+
+def readMonths(var, i0, i1):
+  ''' Read records i0 to i1 of a monthly variable in double precision; missing values become NaN. '''
+  data = var[i0:i1]
+  if np.ma.isMA(data): data = np.ma.filled(data.astype(stream_float), np.NaN)
+  return np.asarray(data, dtype=stream_float)
+
+def writeRecord(ncvar, idx, data):
+  ''' Write a record to a NetCDF variable; NaN is replaced by the missing value flag (if any) and integer
+      variables are rounded. '''
+  if np.issubdtype(ncvar.dtype, np.integer): data = np.round(data)
+  elif 'missing_value' in ncvar.ncattrs(): data = np.where(np.isnan(data), ncvar.missing_value, data)
+  if ncvar.ndim > 1: ncvar[idx,:] = data # here time is always the outermost index
+  else: ncvar[idx] = data
+
+
+def monthlyQuantiles(monthly, ncvar, counts):
+  ''' Estimate the quantile of a quantile variable (ncvar) in a monthly file from aggregated histogram counts, 
+      with the bin edges and settings of the monthly file. '''
+  hist = monthly.variables[ncvar.HistogramVariable]
+  edges = monthly.variables[hist.BinEdges][:]
+  underflow = ncvar.UnderflowValue if 'UnderflowValue' in ncvar.ncattrs() else None
+  return histogramQuantiles(np.nan_to_num(counts), edges, float(ncvar.Quantile), scale=hist.BinScale, underflow=underflow)
+
+
+def openStreamFile(filepath, tmpfilepath, template, varlist, units, begindate, description,
+                   loverwrite=False, lrecover=False):
+  ''' Open an output stream as a temporary copy of an existing file, or create a new file with the dimensions,
+      time-less variables and attributes of a monthly file (template); variables in varlist that are missing in
+      an existing file are added. The time axis is in units since begindate. Returns the (temporary) dataset. '''
+  if os.path.exists(filepath) and loverwrite: os.remove(filepath)
+  if os.path.exists(tmpfilepath) and not lrecover: os.remove(tmpfilepath) # remove old temp files
+  if os.path.exists(filepath) or os.path.exists(tmpfilepath):
+    # make a temporary copy of the file to work on (except, if we are recovering a broken temp file)
+    if not ( lrecover and os.path.exists(tmpfilepath) ): shutil.copy(filepath,tmpfilepath)
+    dataset = nc.Dataset(tmpfilepath, mode='a', format='NETCDF4') # open to append data (mode='a')
+    newvars = [varname for varname in varlist if varname not in dataset.variables]
+  else:
+    dataset = nc.Dataset(tmpfilepath, mode='w', format='NETCDF4') # open to start a new file (mode='w')
+    dataset.createDimension(time, size=None) # make time dimension unlimited
+    add_coord(dataset, time, data=None, dtype='i4', atts=dict(units=units+' since '+begindate))
+    # copy remaining dimensions, time-less variables and global attributes from the monthly file
+    copy_dims(dataset, template, dimlist=[dim for dim in template.dimensions.iterkeys() if dim != time], copy_coords=False)
+    timeless = [varname for varname,var in template.variables.iteritems() if time not in var.dimensions]
+    copy_vars(dataset, template, varlist=timeless, copy_data=True)
+    copy_ncatts(dataset, template, prefix='')
+    dataset.begin_date = begindate
+    newvars = list(varlist)
+  # create time-dependent variables (data are written later)
+  copy_vars(dataset, template, varlist=newvars, copy_data=False)
+  dataset.description = description
+  dataset.sync()
+  return dataset
+
+
+class DailyStream(object):
+  '''
+    Daily means, which are accumulated from the same slabs as the monthly means: the time steps of every day in
+    a slab are summed with one reduction (np.add.reduceat), the sums of a day that continues in the next slab are
+    carried over, and completed days are submitted to a writer. Accumulated variables are differenced between the
+    first time steps of consecutive days (the same way as monthly means between the first time steps of months).
+  '''
+
+  def __init__(self, timeaxis, variables, begindate, accumulated=None, linear=None, writer=None):
+    ''' Initialize with the time axis of the input files and an ordered dictionary of variable names and shapes
+        (without time axis); accumulated is a list of accumulated variables and linear a list of linear derived
+        variables, which are computed from the daily means. Records are submitted to writer (MonthlyWriter) at
+        the index of the day since begindate (YYYY-MM-DD). '''
+    self.timeaxis = timeaxis; self.writer = writer
+    self.variables = OrderedDict(variables)
+    self.accumulated = [varname for varname in self.variables.iterkeys() if varname in set(accumulated or [])]
+    self.linear = list(linear or [])
+    year, month, day = [int(tmp) for tmp in begindate.split('-')]
+    self.firstday = int(timeaxis.daysSinceEpoch(year, month, day)) # first day in the output file
+    # sums of the current day and values of accumulated variables at the first time step of the current day
+    self.sums = OrderedDict([(varname,np.zeros(shape, dtype=stream_float)) for varname,shape in self.variables.iteritems()
+                             if varname not in self.accumulated])
+    self.accstart = OrderedDict([(varname,np.zeros(self.variables[varname], dtype=stream_float))
+                                 for varname in self.accumulated])
+    self.reset()
+    self.starts = []; self.marks = []; self.slabdata = dict() # current slab
+    self.nwritten = 0 # number of records submitted
+
+  def nbytes(self, ndays=1):
+    ''' Estimate the memory of the state and of the sums of a slab with ndays days. '''
+    return sum([stream_float.itemsize*np.prod(shape) for shape in self.variables.itervalues()])*(1+ndays)
+
+  def reset(self):
+    ''' Discard the current day (e.g. at the beginning of a month). '''
+    self.day = None; self.count = 0; self.stamp = None
+    self.accday = None; self.acctime = None
+    self.pending = dict() # daily means of accumulated variables of days that are not complete otherwise
+
+  def beginSlab(self, times, stamps, nexttime=None):
+    ''' Prepare the reduction of a slab: times are the time steps of the slab (minutes since the origin of the
+        time axis), stamps the time stamps (character arrays) and nexttime the first time step of the next month,
+        if the month ends with this slab. Returns the indices (relative to the slab) of the time steps that are
+        needed from accumulated variables (the first time steps of days). '''
+    times = np.asarray(times, dtype='int64'); n = len(times)
+    days = ( times + self.timeaxis.origin ) // 1440 # absolute days
+    self.starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1]))) if n > 0 else np.zeros((0,), dtype=np.intp)
+    self.counts = np.diff(np.append(self.starts, n))
+    self.days = days[self.starts]; self.stamps = stamps[self.starts]
+    # N.B.: a day that started in the previous slab has no mark; the first step of the next month closes the last day
+    self.marks = [(i,int(times[i]),int(days[i])) for i in self.starts if i > 0 or days[i] != self.accday]
+    if nexttime is not None: self.marks.append( (n,int(nexttime),None) )
+    self.slabdata = dict()
+    return [i for i,t,day in self.marks]
+
+  def addSlab(self, varname, data, axis=0, idx=None, missing_value=None):
+    ''' Add the data of a variable of the current slab, or of a band of the slab (idx is the index of the band in
+        the entire domain, without time axis); data of accumulated variables are the values at the time steps
+        returned by beginSlab, other variables all time steps of the slab (missing values become NaN). '''
+    if varname in self.accumulated:
+      if data.shape[axis] != len(self.marks): raise StreamError, "Wrong number of time steps for '{:s}'.".format(varname)
+      if len(self.marks) == 0: return
+      values = np.rollaxis(data, axis, 0)
+    else:
+      if data.shape[axis] != self.counts.sum(): raise StreamError, "Wrong number of time steps for '{:s}'.".format(varname)
+      if len(self.starts) == 0: return
+      if missing_value is not None: data = np.where(data == missing_value, np.NaN, data)
+      values = np.rollaxis(np.add.reduceat(data, self.starts, axis=axis, dtype=stream_float), axis, 0)
+    if varname not in self.slabdata:
+      self.slabdata[varname] = np.zeros((values.shape[0],)+self.variables[varname], dtype=stream_float)
+    self.slabdata[varname][(slice(None),)+(idx if isinstance(idx,tuple) else ())] = values
+
+  def endSlab(self):
+    ''' Merge the sums of the current slab into the current day and submit completed days. '''
+    # differences of accumulated variables between the first time steps of consecutive days
+    for k,(i,t,day) in enumerate(self.marks):
+      if self.accday is not None:
+        seconds = ( t - self.acctime ) * 60.
+        self.pending[self.accday] = OrderedDict([(varname,(self.slabdata[varname][k] - start) / seconds
+                                                  if varname in self.slabdata else start*np.NaN)
+                                                 for varname,start in self.accstart.iteritems()])
+      self.accday = day; self.acctime = t
+      for varname,start in self.accstart.iteritems():
+        if varname in self.slabdata: start[:] = self.slabdata[varname][k]
+    # sums of instantaneous variables
+    for g,day in enumerate(self.days):
+      if day != self.day:
+        self.flush() # the previous day is complete
+        self.day = int(day); self.stamp = self.stamps[g]
+        for sums in self.sums.itervalues(): sums.fill(0)
+      self.count += self.counts[g]
+      for varname,sums in self.sums.iteritems():
+        if varname in self.slabdata: sums += self.slabdata[varname][g]
+        else: sums.fill(np.NaN) # variable missing in input file
+    self.slabdata = dict()
+
+  def flush(self):
+    ''' Submit the current day (e.g. at the end of a month). '''
+    if self.day is None: return
+    results = dict()
+    for varname,sums in self.sums.iteritems(): results[varname] = sums / self.count
+    if self.accumulated:
+      if self.day not in self.pending: raise StreamError, 'Accumulated variables are incomplete for day {:d}.'.format(self.day)
+      results.update(self.pending.pop(self.day))
+    # linear derived variables are computed from the daily means
+    for devar in self.linear: results[devar.name] = devar.computeValues(results)
+    record = [(varname,results[varname]) for varname in self.variables.iterkeys()]
+    record += [(devar.name,results[devar.name]) for devar in self.linear]
+    record.append( (timestamp,self.stamp) )
+    idx = self.day - self.firstday
+    if idx < 0: raise StreamError, 'Day {:s} is before the beginning of the daily file.'.format(str().join(self.stamp[:10]))
+    self.writer.put(idx, idx+1, record, atts=dict(end_date=str().join(self.stamp[:10])))
+    self.nwritten += 1
+    self.day = None; self.count = 0
+
+  def getState(self):
+    ''' Return the state of the current day as a dictionary of arrays (for checkpoints). '''
+    if self.pending: raise StreamError, 'Days with pending accumulated variables can not be saved.'
+    state = dict(day=-1 if self.day is None else self.day, count=self.count,
+                 accday=-1 if self.accday is None else self.accday, acctime=-1 if self.acctime is None else self.acctime)
+    if self.stamp is not None: state['stamp'] = self.stamp
+    for varname,sums in self.sums.iteritems(): state['sum_'+varname] = sums
+    for varname,start in self.accstart.iteritems(): state['acc_'+varname] = start
+    return state
+
+  def setState(self, state):
+    ''' Restore the state of the current day from a dictionary (see getState). '''
+    self.reset()
+    if int(state['day']) >= 0: self.day = int(state['day']); self.count = int(state['count']); self.stamp = state['stamp']
+    if int(state['accday']) >= 0: self.accday = int(state['accday']); self.acctime = int(state['acctime'])
+    for varname,sums in self.sums.iteritems(): sums[:] = state['sum_'+varname]
+    for varname,start in self.accstart.iteritems(): start[:] = state['acc_'+varname]
+
+
+def appendRecords(target, source, offset=0):
+  ''' Copy all records of source to target, starting at index offset (time values are shifted accordingly);
+      raises StreamError, if source has incomplete records. Returns the number of records. '''
+  varlist = [varname for varname,var in source.variables.iteritems() if var.dimensions[0] == time and varname != time]
+  times = source.variables[time][:]
+  for i in xrange(len(times)):
+    if times[i] == -1: raise StreamError, 'Incomplete record {:d} in stream file.'.format(i)
+    target.variables[time][offset+i] = -1 # mark record in progress
+    for varname in varlist:
+      ncvar = target.variables[varname]
+      if ncvar.ndim > 1: ncvar[offset+i,:] = source.variables[varname][i,:]
+      else: ncvar[offset+i] = source.variables[varname][i]
+    target.variables[time][offset+i] = times[i] + offset # update time axis (last action)
+  if 'end_date' in source.ncattrs(): target.end_date = source.end_date
+  return len(times)
+
+
+def aggregatePeriods(monthlyfile, filepath, tmpfilepath, period, calendar='proleptic_gregorian', linear=None):
+  ''' Aggregate the monthly records in monthlyfile to seasonal or annual means (period) and write them to filepath
+      (through a temporary file); only complete periods are written. Means are weighted with the length of the
+      months, extrema are the extrema of the monthly extrema, (co-)variances are merged from the monthly moments
+      (and means), histograms are summed, percentiles are estimated from the summed histograms and linear derived
+      variables are recomputed from the aggregated means. Returns the number of periods. '''
+  if period not in period_months: raise StreamError, "Unknown period '{:s}'.".format(period)
+  if os.path.exists(tmpfilepath): os.remove(tmpfilepath)
+  monthly = nc.Dataset(monthlyfile, mode='r', format='NETCDF4')
+  try:
+    times = monthly.variables[time][:]
+    beginyear, beginmonth = [int(tmp) for tmp in monthly.begin_date.split('-')[:2]]
+    years, months = divmod(np.arange(len(times)) + beginmonth-1, 12); years += beginyear; months += 1
+    weights = TimeAxis(calendar=calendar).daysInMonth(years, months).astype(stream_float) # length of months
+    # complete periods: first and last record
+    pidx = periodIndex(years, months, period)
+    periods = [(i0,i0+period_months[period]) for i0 in np.flatnonzero(np.diff(np.concatenate(([-1],pidx))) != 0)
+               if np.sum(pidx == pidx[i0]) == period_months[period]]
+    periods = [(i0,i1) for i0,i1 in periods if np.all(times[i0:i1] != -1)]
+    # decide how to aggregate variables
+    varlist = [varname for varname,var in monthly.variables.iteritems()
+               if time in var.dimensions and varname not in (time,timestamp)]
+    linear = OrderedDict([(devar.name,devar) for devar in linear or []
+                          if devar.name in varlist and devar.checkPrerequisites(monthly)])
+    modes = OrderedDict()
+    for varname in varlist:
+      if varname in linear: continue # computed later
+      var = monthly.variables[varname]
+      aggregation = var.getncattr('Aggregation') if 'Aggregation' in var.ncattrs() else ''
+      if aggregation.endswith(('Variance','Standard Deviation','Covariance')):
+        if 'MomentVariables' not in var.ncattrs(): continue # can't be merged
+        mode = {'Variance':'var','Deviation':'std','Covariance':'cov'}[aggregation.split()[-1]]
+        modes[varname] = (mode, var.getncattr('MomentVariables').split())
+      elif 'Maximum' in aggregation: modes[varname] = ('max',None)
+      elif 'Minimum' in aggregation: modes[varname] = ('min',None)
+      elif aggregation.endswith('Histogram'): modes[varname] = ('sum',None)
+      elif aggregation.endswith('Percentile'): modes[varname] = ('quantile',var.getncattr('HistogramVariable'))
+      else: modes[varname] = ('mean',None) # also means of moments
+    # N.B.: quantiles are estimated from the aggregated histograms, so they are computed last
+    modes = OrderedDict(sorted(modes.iteritems(), key=lambda item: item[1][0] == 'quantile'))
+    pqset = set().union(*[devar.prerequisites for devar in linear.itervalues()])
+    pqset.update([hist for mode,hist in modes.itervalues() if mode == 'quantile'])
+    # create output file
+    dataset = nc.Dataset(tmpfilepath, mode='w', format='NETCDF4')
+    dataset.createDimension(time, size=None) # make time dimension unlimited
+    add_coord(dataset, time, data=None, dtype='i4', atts=dict(units=monthly.variables[time].units)) # end of periods
+    copy_dims(dataset, monthly, dimlist=[dim for dim in monthly.dimensions.iterkeys() if dim != time], copy_coords=False)
+    timeless = [varname for varname,var in monthly.variables.iteritems() if time not in var.dimensions]
+    copy_vars(dataset, monthly, varlist=timeless, copy_data=True)
+    copy_vars(dataset, monthly, varlist=list(modes.iterkeys())+list(linear.iterkeys()), copy_data=False)
+    if timestamp in monthly.variables: copy_vars(dataset, monthly, varlist=[timestamp], copy_data=False)
+    copy_ncatts(dataset, monthly, prefix='')
+    dataset.description = monthly.description.replace('monthly', period_titles[period].lower())
+    if period == 'seasonal': dataset.seasons = ', '.join(season_names)
+    for varname in modes.iterkeys():
+      var = dataset.variables[varname]
+      if 'Aggregation' in var.ncattrs(): var.Aggregation = var.Aggregation.replace('Monthly', period_titles[period])
+    # aggregate periods
+    for ip,(i0,i1) in enumerate(periods):
+      dataset.variables[time][ip] = -1 # mark record in progress
+      w = weights[i0:i1]; results = dict()
+      for varname,(mode,moments) in modes.iteritems():
+        if mode != 'quantile': data = readMonths(monthly.variables[varname], i0, i1)
+        if mode == 'mean': values = np.tensordot(w, data, axes=1) / w.sum()
+        elif mode == 'max': values = data.max(axis=0)
+        elif mode == 'min': values = data.min(axis=0)
+        elif mode == 'sum': values = data.sum(axis=0)
+        elif mode == 'quantile': values = monthlyQuantiles(monthly, monthly.variables[varname], results[moments])
+        else:
+          # merge monthly moment states, weighted with the length of the months
+          means = [readMonths(monthly.variables[pq], i0, i1) for pq in moments]
+          if mode == 'std': data **= 2
+          state = None
+          for i in xrange(i1-i0):
+            mean_y = means[1][i] if len(means) > 1 else None # covariances
+            state = mergeMoments(state, stateFromMoments(w[i], means[0][i], data[i], mean_y=mean_y))
+          values = getMoment(state, mode)
+        if varname in pqset: results[varname] = values
+        writeRecord(dataset.variables[varname], ip, values)
+      for dename,devar in linear.iteritems():
+        results[dename] = values = devar.computeValues(results)
+        writeRecord(dataset.variables[dename], ip, values)
+      if timestamp in monthly.variables:
+        dataset.variables[timestamp][ip,:] = monthly.variables[timestamp][i0,:] # first month of the period
+        dataset.end_date = str().join(monthly.variables[timestamp][i1-1,:10]) # beginning of the last month
+      dataset.variables[time][ip] = times[i1-1] # end of the period (same convention as monthly records)
+    dataset.sync(); dataset.close()
+  finally: monthly.close()
+  os.rename(tmpfilepath,filepath)
+  return len(periods)
+
+
+## climatologies of user-declared periods, which are updated incrementally from the monthly records
+
+def climPeriod(period):
+  ''' Parse a climatology period of the form 'YYYY-YYYY' (first and last year, inclusive); returns the first and
+      last year. '''
+  years = period.split('-')
+  if len(years) != 2 or not all([len(year) == 4 and year.isdigit() for year in years]):
+    raise StreamError, "Invalid climatology period '{:s}' (expected 'YYYY-YYYY').".format(period)
+  y0, y1 = [int(year) for year in years]
+  if y1 < y0: raise StreamError, "Invalid climatology period '{:s}' (last year before first year).".format(period)
+  return y0, y1
+
+def updateClimatology(monthlyfile, filepath, tmpfilepath, statefile, tmpstatefile, period, lstd=False, lreset=False):
+  ''' Update the climatology of a period (see climPeriod) with the monthly records in monthlyfile that were added
+      since the last update, and write the climatology (means for every calendar month and, if lstd, the inter-
+      annual standard deviation) to filepath. The running sums, counts (and sums of squared deviations) are kept
+      in statefile (in double precision), so that only new months (and new variables) are read; with lreset the
+      state is discarded (e.g. if existing months were recomputed). Histograms are summed over all years and
+      percentiles are estimated from the summed histograms. Returns the number of months in the average. '''
+  y0, y1 = climPeriod(period)
+  for tmpfile in (tmpfilepath, tmpstatefile):
+    if os.path.exists(tmpfile): os.remove(tmpfile)
+  if lreset and os.path.exists(statefile): os.remove(statefile)
+  monthly = nc.Dataset(monthlyfile, mode='r', format='NETCDF4')
+  try:
+    # complete monthly records in the period (absolute month index: 12*year + month - 1)
+    times = monthly.variables[time][:]
+    beginyear, beginmonth = [int(tmp) for tmp in monthly.begin_date.split('-')[:2]]
+    first = beginyear*12 + beginmonth - 1
+    absmonths = np.arange(len(times)) + first
+    absmonths = absmonths[( times != -1 ) & ( absmonths >= y0*12 ) & ( absmonths < (y1+1)*12 )]
+    varlist = [varname for varname,var in monthly.variables.iteritems() if time in var.dimensions
+               and varname not in (time,timestamp) and var.dtype.kind != 'S']
+    aggregation = lambda varname: getattr(monthly.variables[varname], 'Aggregation', '')
+    histograms = [varname for varname in varlist if aggregation(varname).endswith('Histogram')]
+    # N.B.: percentiles are estimated from the summed histograms, so they are not kept in the state
+    percentiles = [varname for varname in varlist if aggregation(varname).endswith('Percentile')]
+    statelist = [varname for varname in varlist if varname not in percentiles]
+    # open state or create a new state with the dimensions of the monthly file
+    if os.path.exists(statefile):
+      shutil.copy(statefile,tmpstatefile)
+      state = nc.Dataset(tmpstatefile, mode='a', format='NETCDF4')
+      oldmonths = state.variables['months'][:] if len(state.dimensions['record']) > 0 else np.zeros((0,), dtype='i4')
+    else:
+      state = nc.Dataset(tmpstatefile, mode='w', format='NETCDF4')
+      add_coord(state, time, data=np.arange(1,13), dtype='i4', atts=dict(units='month of the year'))
+      state.createDimension('record', size=None)
+      add_var(state, name='months', dims=('record',), data=None, atts=dict(units='12*year + month - 1'), dtype='i4')
+      copy_dims(state, monthly, dimlist=[dim for dim in monthly.dimensions.iterkeys() if dim != time], copy_coords=False)
+      state.period = period; state.begin_date = monthly.begin_date
+      oldmonths = np.zeros((0,), dtype='i4')
+    newmonths = np.setdiff1d(absmonths, oldmonths)
+    allmonths = np.union1d(oldmonths, newmonths)
+    oldcounts = np.bincount(oldmonths % 12, minlength=12)
+    # update the sums of every variable with the new months (all months for new variables)
+    for varname in statelist:
+      var = monthly.variables[varname]; lvar = lstd and varname not in histograms
+      lnew = varname not in state.variables or ( lvar and varname+'_M2' not in state.variables )
+      if varname not in state.variables:
+        add_var(state, name=varname, dims=var.dimensions, data=None, atts=None, dtype='f8')
+      if lvar and varname+'_M2' not in state.variables:
+        add_var(state, name=varname+'_M2', dims=var.dimensions, data=None, atts=None, dtype='f8')
+      lm2 = varname+'_M2' in state.variables # N.B.: once created, squared deviations are always kept up to date
+      if lnew: sums = np.zeros((12,)+var.shape[1:], dtype=stream_float); counts = np.zeros((12,), dtype='i4')
+      else: sums = np.asarray(state.variables[varname][:], dtype=stream_float); counts = oldcounts.copy()
+      if lm2: M2 = np.zeros_like(sums) if lnew else np.asarray(state.variables[varname+'_M2'][:], dtype=stream_float)
+      for absmonth in ( allmonths if lnew else newmonths ):
+        m = absmonth % 12; x = readMonths(var, absmonth-first, absmonth-first+1)[0]
+        if lm2 and counts[m] > 0: M2[m] += ( x - sums[m]/counts[m] ) * ( x - (sums[m]+x)/(counts[m]+1) ) # Welford
+        sums[m] += x; counts[m] += 1
+      state.variables[varname][:] = sums
+      if lm2: state.variables[varname+'_M2'][:] = M2
+    state.variables['months'][0:len(allmonths)] = allmonths
+    state.end_date = monthly.end_date if 'end_date' in monthly.ncattrs() else ''
+    # write the climatology from the state
+    counts = np.bincount(allmonths % 12, minlength=12)
+    clim = nc.Dataset(tmpfilepath, mode='w', format='NETCDF4')
+    add_coord(clim, time, data=np.arange(1,13), dtype='i4', atts=dict(units='month of the year'))
+    copy_dims(clim, monthly, dimlist=[dim for dim in monthly.dimensions.iterkeys() if dim != time], copy_coords=False)
+    # variable with proper names of the months
+    clim.createDimension('tstrlen', size=9)
+    coord = clim.createVariable('month','S1',(time,'tstrlen'))
+    for m,name in enumerate(month_names): coord[m,:] = np.array(list(name), dtype='S1')
+    add_var(clim, name='n_years', dims=(time,), data=counts, atts=dict(units='', long_name='Number of Years'), dtype='i4')
+    timeless = [varname for varname,var in monthly.variables.iteritems() if time not in var.dimensions]
+    copy_vars(clim, monthly, varlist=timeless, copy_data=True)
+    copy_vars(clim, monthly, varlist=[varname for varname in varlist if varname not in histograms], copy_data=False)
+    for varname in histograms: # counts of many years may not fit into the type of the monthly counts
+      var = monthly.variables[varname]
+      atts = dict([(att,var.getncattr(att)) for att in var.ncattrs()])
+      atts['Aggregation'] = atts['Aggregation'].replace('Monthly', 'Climatological')
+      add_var(clim, name=varname, dims=var.dimensions, data=None, atts=atts, dtype='i4')
+    copy_ncatts(clim, monthly, prefix='')
+    clim.description = 'climatology ({:s}) of {:s}'.format(period, monthly.description)
+    clim.period = period
+    if len(allmonths) > 0:
+      clim.begin_date = '{:04d}-{:02d}'.format(allmonths[0]//12, allmonths[0]%12+1)
+      clim.end_date = '{:04d}-{:02d}'.format(allmonths[-1]//12, allmonths[-1]%12+1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+      for varname in statelist:
+        ncvar = clim.variables[varname]
+        sums = np.asarray(state.variables[varname][:], dtype=stream_float)
+        if varname in histograms:
+          for m in xrange(12): writeRecord(ncvar, m, sums[m]) # histograms of all years of a calendar month
+          continue
+        means = sums / counts.reshape((12,)+(1,)*(sums.ndim-1)) # NaN for calendar months without data
+        for m in xrange(12): writeRecord(ncvar, m, means[m])
+        if lstd:
+          atts = dict(units=ncvar.units if 'units' in ncvar.ncattrs() else '', ddof=0,
+                      long_name='Interannual Standard Deviation of '+varname)
+          if 'missing_value' in ncvar.ncattrs(): atts['missing_value'] = ncvar.missing_value
+          stdvar = add_var(clim, name=varname+'_ClimStd', dims=ncvar.dimensions, data=None, atts=atts, dtype='f4')
+          M2 = np.asarray(state.variables[varname+'_M2'][:], dtype=stream_float)
+          std = np.sqrt(M2 / counts.reshape((12,)+(1,)*(M2.ndim-1)))
+          for m in xrange(12): writeRecord(stdvar, m, std[m])
+      for varname in percentiles:
+        ncvar = clim.variables[varname]
+        hists = np.asarray(state.variables[ncvar.HistogramVariable][:], dtype=stream_float)
+        for m in xrange(12): writeRecord(ncvar, m, monthlyQuantiles(monthly, ncvar, hists[m]))
+    clim.sync(); clim.close()
+    state.sync(); state.close()
+  finally: monthly.close()
+  # N.B.: the climatology is always rewritten from the state, so it is consistent, even if it is not renamed
+  os.rename(tmpstatefile,statefile)
+  os.rename(tmpfilepath,filepath)
+  return len(allmonths)
@@ -0,0 +1,160 @@
+'''
+Created on 2026-10-18
+
+A module providing a simple task queue on a shared file system with renewable leases, so that several 
+invocations of wrfout_average (e.g. batch jobs on different nodes) can cooperate on the same experiment.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, json, socket, shutil, threading
+from time import time as clock, sleep
+
+
+# class for errors with the task queue
+class TaskQueueError(Exception):
+  ''' Exceptions related to the task queue. '''
+  pass
+
+
+class LeaseRenewer(object):
+  ''' A background thread that renews a lease file periodically (by updating its modification time). '''
+
+  def __init__(self, leasefile, interval):
+    self.leasefile = leasefile; self.interval = interval
+    self.stop = threading.Event()
+    self.thread = threading.Thread(target=self._renew, name='LeaseRenewer')
+    self.thread.daemon = True # don't keep the process alive
+    self.thread.start()
+
+  def _renew(self):
+    while not self.stop.wait(self.interval):
+      try: os.utime(self.leasefile, None)
+      except OSError: break # lease was broken or released
+
+  def close(self):
+    self.stop.set(); self.thread.join()
+
+
+class TaskQueue(object):
+  '''
+    A task queue in a folder on a shared file system; tasks are claimed in alphabetical order of their IDs,
+    and a task can only be claimed, when all its dependencies are done.
+    Files in the queue folder: <task>.task (JSON), <task>.lease, <task>.done and <task>.failed (and one
+    clock.<worker>.tmp per worker, which is used to read the time of the file server).
+  '''
+
+  def __init__(self, folder, leasetimeout=900.):
+    ''' Open a queue; leasetimeout is the time after which a lease that was not renewed is considered stale. '''
+    self.folder = folder if folder[-1] == '/' else folder+'/'
+    self.leasetimeout = leasetimeout
+    self.owner = '{:s}:{:d}'.format(socket.gethostname(), os.getpid()) # identifies the worker
+    self.renewer = None
+
+  def _path(self, taskid, ext):
+    return '{:s}{:s}.{:s}'.format(self.folder, taskid, ext)
+
+  def _touch(self, filepath, content=''):
+    ''' Atomically create a file; returns False, if it already exists. '''
+    try: fd = os.open(filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError: return False
+    os.write(fd, content); os.close(fd)
+    return True
+
+  def initialize(self, tasks, waittime=None):
+    ''' Create the queue from a list of (taskid, task) tuples, where task is a JSON-serializable dictionary,
+        optionally with a list of dependencies under 'deps'; if the queue already exists (created by another
+        worker), wait until it is ready. Returns True, if the queue was created by this worker. '''
+    waittime = self.leasetimeout if waittime is None else waittime
+    try: os.mkdir(self.folder) # atomic: only one worker can create the queue
+    except OSError:
+      # wait for the queue to become ready
+      t0 = clock()
+      while not os.path.exists(self.folder+'ready'):
+        if not os.path.exists(self.folder): return self.initialize(tasks, waittime=waittime) # was removed
+        if clock() - t0 > waittime: raise TaskQueueError, "Task queue '{:s}' did not become ready.".format(self.folder)
+        sleep(1.)
+      return False
+    # write task files (first to temporary files, so that they are not read incomplete)
+    for taskid,task in tasks:
+      tmpfile = self._path(taskid,'tmp')
+      with open(tmpfile, 'w') as f: json.dump(task, f)
+      os.rename(tmpfile, self._path(taskid,'task'))
+    self._touch(self.folder+'ready', self.owner)
+    return True
+
+  def _listTasks(self):
+    ''' Return a sorted list of task IDs and a set of all files in the queue folder (None, if it was removed). '''
+    try: files = set(os.listdir(self.folder))
+    except OSError: return None, None # queue was removed, because all tasks were finished
+    taskids = sorted([filename[:-5] for filename in files if filename[-5:] == '.task'])
+    return taskids, files
+
+  def _serverTime(self):
+    ''' Return the current time of the file server, i.e. the modification time of a file that was just touched. '''
+    clockfile = self._path('clock.'+self.owner.replace(':','_'),'tmp') # only used by this worker
+    with open(clockfile, 'a'): os.utime(clockfile, None)
+    return os.path.getmtime(clockfile)
+
+  def _breakStaleLease(self, taskid):
+    ''' Remove a lease that was not renewed within the lease timeout; returns True, if the lease was removed. '''
+    leasefile = self._path(taskid,'lease')
+    # N.B.: lease renewals are time-stamped by the file server, so the local clock can not be used (clock skew)
+    try: age = self._serverTime() - os.path.getmtime(leasefile)
+    except (IOError, OSError): return True # lease was already released (or the queue was removed)
+    if age < self.leasetimeout: return False
+    # N.B.: renaming is atomic, so only one worker can break the lease
+    stalefile = self._path(taskid,'stale.'+self.owner.replace(':','_'))
+    try: os.rename(leasefile, stalefile)
+    except OSError: return False # another worker was faster
+    os.remove(stalefile)
+    return True
+
+  def claim(self):
+    ''' Claim the next available task; returns (taskid, task), or None, if no task is currently available. '''
+    taskids, files = self._listTasks()
+    if taskids is None: return None
+    for taskid in taskids:
+      if taskid+'.done' in files or taskid+'.failed' in files: continue
+      with open(self._path(taskid,'task'), 'r') as f: task = json.load(f)
+      # check dependencies
+      deps = task.get('deps',[])
+      if any([dep+'.failed' in files for dep in deps]):
+        self._touch(self._path(taskid,'failed'), 'dependency failed'); continue # can never run
+      if not all([dep+'.done' in files for dep in deps]): continue # has to wait
+      # claim task (or take over a stale lease)
+      if taskid+'.lease' in files and not self._breakStaleLease(taskid): continue
+      if self._touch(self._path(taskid,'lease'), self.owner):
+        # keep the lease alive while the task is running
+        self.renewer = LeaseRenewer(self._path(taskid,'lease'), interval=self.leasetimeout/4.)
+        return taskid, task
+    return None
+
+  def complete(self, taskid, lsuccess=True):
+    ''' Mark a claimed task as done (or failed) and release the lease. '''
+    if self.renewer is not None: self.renewer.close(); self.renewer = None
+    self._touch(self._path(taskid, 'done' if lsuccess else 'failed'), self.owner)
+    # only remove our own lease (if it was broken, another worker may hold it now)
+    try:
+      with open(self._path(taskid,'lease'), 'r') as f: lown = f.read() == self.owner
+      if lown: os.remove(self._path(taskid,'lease'))
+    except (IOError, OSError): pass # lease was broken (should not happen, unless the task took too long)
+
+  def status(self):
+    ''' Return lists of finished, failed and remaining task IDs (None, if the queue was removed). '''
+    taskids, files = self._listTasks()
+    if taskids is None: return None
+    done = [taskid for taskid in taskids if taskid+'.done' in files]
+    failed = [taskid for taskid in taskids if taskid+'.failed' in files]
+    remaining = [taskid for taskid in taskids if taskid+'.done' not in files and taskid+'.failed' not in files]
+    return done, failed, remaining
+
+  def remove(self):
+    ''' Remove the queue folder (once all tasks are finished); returns False, if it was already removed. '''
+    # N.B.: renaming is atomic, so only one worker removes the queue
+    trash = self.folder[:-1]+'_removed_'+self.owner.replace(':','_')
+    try: os.rename(self.folder[:-1], trash)
+    except OSError: return False
+    shutil.rmtree(trash)
+    return True
@@ -0,0 +1,160 @@
+'''
+Created on 2026-10-18
+
+A module providing a time axis for WRF output in wrfout_average; WRF time stamps are converted to 
+integer minutes in one vectorized step, with explicit handling of the calendar.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+
+# supported calendars (CF names and aliases)
+# N.B.: WRF uses the proleptic Gregorian calendar, unless it was compiled without leap days
+calendars = {'proleptic_gregorian':'proleptic_gregorian', 'standard':'proleptic_gregorian',
+             'gregorian':'proleptic_gregorian', 'noleap':'noleap', '365_day':'noleap'}
+days_per_month_365 = np.array([31,28,31,30,31,30,31,31,30,31,30,31])
+cumdays_365 = np.concatenate(([0],np.cumsum(days_per_month_365))) # days before the first of each month
+timestamp_length = 19 # length of WRF time stamps
+digit_positions = [0,1,2,3, 5,6, 8,9, 11,12, 14,15, 17,18] # positions of digits in a time stamp
+separators = {4:'-', 7:'-', 10:'_', 13:':', 16:':'} # positions of separators in a time stamp
+
+
+# class for errors with time stamps and calendars
+class TimeAxisError(Exception):
+  ''' Exceptions related to time stamps and calendars. '''
+  pass
+
+
+def parseTimeStamps(timestamps):
+  ''' Split WRF time stamps (strings or character arrays with DateStrLen as the last dimension) into integer
+      arrays of year, month, day, hour, minute and second (vectorized); raises TimeAxisError, if time stamps are
+      malformed. '''
+  timestamps = np.asarray(timestamps)
+  if timestamps.dtype == np.dtype('S1'):
+    shape = timestamps.shape[:-1]; chars = np.ascontiguousarray(timestamps) # also removes masks
+    if timestamps.shape[-1] != timestamp_length:
+      raise TimeAxisError, 'Time stamps have to have {:d} characters.'.format(timestamp_length)
+  elif timestamps.dtype.kind in ('S','U'):
+    shape = timestamps.shape
+    if timestamps.dtype.itemsize != (timestamp_length if timestamps.dtype.kind == 'S' else 4*timestamp_length):
+      raise TimeAxisError, 'Time stamps have to have {:d} characters.'.format(timestamp_length)
+    chars = np.ascontiguousarray(timestamps, dtype='S{:d}'.format(timestamp_length))
+  else: raise TypeError, timestamps.dtype
+  chars = chars.view('uint8').reshape((-1,timestamp_length))
+  # check format
+  digits = chars[:,digit_positions].astype('int32') - ord('0')
+  lvalid = np.all( (digits >= 0) & (digits <= 9), axis=1 )
+  for i,sep in separators.iteritems(): lvalid &= chars[:,i] == ord(sep)
+  if not np.all(lvalid):
+    raise TimeAxisError, "Invalid time stamp: '{:s}'".format(chars[np.argmin(lvalid)].tostring())
+  # assemble fields
+  year = digits[:,0]*1000 + digits[:,1]*100 + digits[:,2]*10 + digits[:,3]
+  fields = [year] + [digits[:,i]*10 + digits[:,i+1] for i in range(4,14,2)]
+  return tuple([field.reshape(shape) for field in fields])
+
+
+class TimeAxis(object):
+  '''
+    A time axis in integer minutes since a reference time (origin) in a given calendar; absolute times are
+    counted from 1970-01-01_00:00:00 (in the same calendar).
+  '''
+
+  def __init__(self, origin=None, calendar='proleptic_gregorian'):
+    ''' Create a time axis with the given calendar; origin is a time stamp (default: 1970-01-01_00:00:00). '''
+    if calendar not in calendars: raise TimeAxisError, "Unknown calendar: '{:s}'".format(calendar)
+    self.calendar = calendars[calendar]
+    self.origin = 0 # needed for the conversion of the origin itself
+    if origin is not None: self.origin = int(self.absoluteMinutes([origin])[0])
+
+  def isLeapYear(self, year):
+    ''' Return True for leap years (vectorized). '''
+    year = np.asarray(year)
+    if self.calendar == 'noleap': return np.zeros(year.shape, dtype=np.bool_)
+    else: return (year % 4 == 0) & ( (year % 100 != 0) | (year % 400 == 0) )
+
+  def daysInMonth(self, year, month):
+    ''' Return the number of days in a month (vectorized). '''
+    return days_per_month_365[np.asarray(month)-1] + ( self.isLeapYear(year) & (np.asarray(month) == 2) )
+
+  def daysSinceEpoch(self, year, month, day):
+    ''' Return the number of days since 1970-01-01 (vectorized). '''
+    year = np.asarray(year, dtype='int64'); month = np.asarray(month, dtype='int64'); day = np.asarray(day, dtype='int64')
+    if self.calendar == 'noleap':
+      return (year-1970)*365 + cumdays_365[month-1] + day - 1
+    else:
+      # N.B.: years start in March, so that leap days are at the end of a year (400-year eras, as in ISO 8601)
+      year = year - (month <= 2)
+      era = year // 400; yoe = year - era*400 # year of era
+      doy = ( 153*np.where(month > 2, month-3, month+9) + 2 )//5 + day - 1 # day of year (starting in March)
+      doe = yoe*365 + yoe//4 - yoe//100 + doy # day of era
+      return era*146097 + doe - 719468 # 719468 days from 0000-03-01 to 1970-01-01
+
+  def dateFromDays(self, days):
+    ''' Return year, month and day of days since 1970-01-01 (inverse of daysSinceEpoch; vectorized). '''
+    days = np.asarray(days, dtype='int64')
+    if self.calendar == 'noleap':
+      year, doy = divmod(days, 365)
+      month = np.searchsorted(cumdays_365, doy, side='right')
+      return year+1970, month, doy - cumdays_365[month-1] + 1
+    else:
+      days = days + 719468
+      era = days // 146097; doe = days - era*146097 # day of era
+      yoe = ( doe - doe//1460 + doe//36524 - doe//146096 ) // 365 # year of era
+      doy = doe - (365*yoe + yoe//4 - yoe//100) # day of year (starting in March)
+      mp = (5*doy + 2)//153 # month, starting in March
+      day = doy - (153*mp + 2)//5 + 1; month = np.where(mp < 10, mp+3, mp-9)
+      return era*400 + yoe + (month <= 2), month, day
+
+  def absoluteMinutes(self, timestamps):
+    ''' Convert time stamps to minutes since 1970-01-01 (int64; vectorized). '''
+    year, month, day, hour, minute, second = parseTimeStamps(timestamps)
+    # check dates in this calendar
+    lvalid = (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60)
+    lvalid &= (day >= 1) & (day <= self.daysInMonth(year, np.where(lvalid, month, 1)))
+    if not np.all(lvalid):
+      raise TimeAxisError, "Invalid date in '{:s}' calendar: {:04d}-{:02d}-{:02d}_{:02d}:{:02d}".format(self.calendar,
+                                    *[int(field.ravel()[np.argmin(lvalid.ravel())]) for field in (year,month,day,hour,minute)])
+    # N.B.: WRF output intervals are multiples of minutes
+    if np.any(second != 0): raise TimeAxisError, 'Time stamps with seconds are not supported.'
+    return self.daysSinceEpoch(year, month, day)*1440 + hour*60 + minute
+
+  def minutes(self, timestamps):
+    ''' Convert time stamps (strings or character arrays) to integer minutes since the origin (vectorized). '''
+    return self.absoluteMinutes(timestamps) - self.origin
+
+  def monthStart(self, year, month):
+    ''' Return the first minute of a month (since the origin); months outside 1-12 roll over into other years. '''
+    year, month = divmod(year*12 + month-1, 12)
+    return int(self.daysSinceEpoch(year, month+1, 1))*1440 - self.origin
+
+  def date(self, minutes):
+    ''' Return year, month, day, hour and minute of minutes since the origin (vectorized). '''
+    days, minutes = divmod(np.asarray(minutes, dtype='int64') + self.origin, 1440)
+    year, month, day = self.dateFromDays(days)
+    return year, month, day, minutes // 60, minutes % 60
+
+  def timeDelta(self, times, year=None, month=None):
+    ''' Return the period covered by times (minutes since the origin) in seconds; the first time step has to be in
+        the given month (if given) and the last one in the same or in the next month. In the proleptic Gregorian
+        calendar, a leap day without time steps is subtracted (i.e. output from a model run without leap days). '''
+    y1, m1 = [int(field) for field in self.date(times[0])[:2]]
+    y2, m2 = [int(field) for field in self.date(times[-1])[:2]]
+    # the first timestamp has to be of this year and month, last can be one ahead
+    if year is None: year = y1
+    else: assert year == y1
+    assert ( year == y2 or year+1 == y2 )
+    if month is None: month = m1
+    else: assert month == m1
+    assert  ( month == m2 or np.mod(month,12)+1 == m2 )
+    # determine interval
+    delta = float( times[-1] - times[0] ) * 60. # in seconds
+    # check if leap-day is present
+    if month == 2 and self.isLeapYear(year):
+      ld = self.monthStart(year, 2) + 28*1440 # beginning of the leap day
+      # a leap day should be there; if there is no time step on the leap day, then subtract it
+      if times[0] < ld < times[-1] and not np.any( (np.asarray(times) - ld)//1440 == 0 ):
+        delta -= 86400. # subtract leap day from period
+    # return leap-day-checked period
+    return delta
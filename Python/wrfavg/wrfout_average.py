@@ -4,14 +4,21 @@ Created on 2013-09-28, revised 2014-06-17
 A script to average WRF output; the default settings are meant for my 'fineIO' output configuration and 
 process the smaller diagnostic files.
 The script can run in parallel mode, with each process averaging one filetype and domain, producing 
-exactly one output file.  
+exactly one output file. Long records can also be split into chunks of months, which are averaged in
+separate processes and merged into one output file afterwards (PYAVG_CHUNKS).  
+Several invocations of the script (e.g. batch jobs on different nodes) can share the work of one experiment
+through a task queue in the output folder (PYAVG_QUEUE). If the input files are too large for the available 
+memory, the domain can be processed in bands along the south_north axis (PYAVG_MEMLIMIT).
+Besides monthly means, daily, seasonal and annual means, monthly histograms and mean diurnal cycles can be 
+written to separate files, without reading the WRF output again (PYAVG_STREAMS, PYAVG_HISTOGRAMS, 
+PYAVG_DIURNAL). Climatologies of user-declared periods (e.g. 1979-1994) are updated with every new month, 
+from running sums that are stored next to the monthly means (PYAVG_CLIM).
 
 @author: Andre R. Erler, GPL v3
 '''
 
 #TODO: add time-dependent auxiliary files to file processing (use prerequisites from other files)
 #TODO: add option to discard prerequisit variables
-#TODO: add base variables for correlation and standard deviation (and (co-)variance).
 #TODO: more variables: tropopause height, baroclinicity, PV, water flux (require full 3D fields)
 #TODO: add shape-averaged output stream (shapes based on a template file)
 
@@ -20,13 +27,26 @@ exactly one output file.
 import numpy as np
 from collections import OrderedDict
 #import numpy.ma as ma
-import os, re, sys, shutil, gc
+import os, re, sys, shutil, gc, multiprocessing
 import netCDF4 as nc
 # my own netcdf stuff
 from utils.nctools import add_coord, copy_dims, copy_ncatts, copy_vars
 from processing.multiprocess import asyncPoolEC
 # import module providing derived variable classes
 import wrfavg.derived_variables as dv
+from wrfavg.prefetch import FilePrefetcher, PrefetchedVariable, nclock
+from wrfavg.accumulator import ReductionBuffers, getAccumulatorDtype
+from wrfavg.stencil import centredDiff
+from wrfavg.timeaxis import TimeAxis
+from wrfavg.catalog import WRFCatalog, CatalogError
+from wrfavg.writer import MonthlyWriter
+from wrfavg.streams import DailyStream, openStreamFile, appendRecords, aggregatePeriods, stream_names, period_months
+from wrfavg.streams import monthly_streams
+from wrfavg.streams import updateClimatology, climPeriod, StreamError
+from wrfavg.histogram import linearBins, logBins, HistogramError
+from wrfavg.taskqueue import TaskQueue
+from wrfavg.planner import ExecutionPlan, sortVariables, propagateNonlinearity
+from time import time as clock, sleep
 # aliases
 days_per_month_365 = dv.days_per_month_365
 dtype_float = dv.dtype_float 
@@ -45,26 +65,126 @@ class ArgumentError(Exception):
   pass
 
 def getDateRegX(period):
-  ''' function to define averaging period based on argument '''
-  # use '\d' for any number and [1-3,45] for ranges; '\d\d\d\d'
-  if period == '1979-1980': prdrgx = '19(79|80)' # 2 year historical period
-  elif period == '1979-1981': prdrgx = '19(79|8[0-1])' # 3 year historical period
-  elif period == '1979-1983': prdrgx = '19(79|8[0-3])' # 5 year historical period
-  elif period == '1979-1988': prdrgx = '19(79|8[0-8])' # 10 year historical period
-  elif period == '1980-1994': prdrgx = '19(8[0-9]|9[04])' # 15 year historical period
-  elif period == '2045-2047': prdrgx = '204[5-7]' # 3 year future period
-  elif period == '2045-2049': prdrgx = '204[5-9]' # 5 year future period
-  elif period == '2045-2054': prdrgx = '20(4[5-9]|5[0-4])' # 10 year future period
-  elif period == '2045-2059': prdrgx = '20(4[5-9]|5[0-9])' # 15 year future period
-  elif period == '2085-2087': prdrgx = '208[5-7]' # 3 year future period
-  elif period == '2085-2089': prdrgx = '208[5-9]' # 5 year future period
-  elif period == '2085-2094': prdrgx = '20(8[5-9]|9[0-4])' # 10 year future period
-  elif period == '2085-2099': prdrgx = '20(8[5-9]|9[0-9])' # 15 year future period  
-  elif period == '2090-2094': prdrgx = '209[0-4]' # 5 year future period
-  else: prdrgx = None
+  ''' function to define averaging period based on argument (first and last year, inclusive) '''
+  try: firstyear, lastyear = climPeriod(period)
+  except StreamError: prdrgx = None
+  else: prdrgx = '({:s})'.format('|'.join(['{:04d}'.format(year) for year in xrange(firstyear,lastyear+1)]))
   print("\n  Loading regular expression for date string: '{:s}'\n".format(prdrgx))
   return prdrgx 
 
+def getMonthRange(firststamp, laststamp):
+  ''' function to determine the first and last complete month from the first and last time-stamp of a file list '''
+  begindate = firststamp[:7] + '-01'
+  # always need to begin on the first of a month (discard incomplete data of first month)
+  if firststamp[8:10] != '01': begindate = shiftMonth(begindate, 1) # move on to next month
+  # the last timestamp should be the next month (i.e. that month is not included)
+  enddate = shiftMonth(laststamp[:7] + '-01', -1)
+  # N.B.: both dates are always the first of the month
+  return begindate, enddate
+
+def shiftMonth(date, shift=1):
+  ''' function to shift a date string ('YYYY-MM-01') by a number of months '''
+  year, month = [int(tmp) for tmp in date[:7].split('-')]
+  year, month = divmod(year*12 + month-1 + shift, 12)
+  return '{0:04d}-{1:02d}-01'.format(year, month+1)
+
+def countMonths(begindate, enddate):
+  ''' function to count the months in a range of months (including begin and end) '''
+  beginyear, beginmonth = [int(tmp) for tmp in begindate[:7].split('-')]
+  endyear, endmonth = [int(tmp) for tmp in enddate[:7].split('-')]
+  return (endyear-beginyear)*12 + endmonth-beginmonth + 1
+
+def splitMonthRange(begindate, enddate, nchunk):
+  ''' function to split a range of months into (at most) nchunk contiguous chunks of similar length '''
+  nmonth = countMonths(begindate, enddate)
+  nchunk = max(1,min(nchunk,nmonth)) # at least one month per chunk
+  chunks = []; m0 = 0
+  for ichunk in xrange(nchunk):
+    m1 = m0 + nmonth//nchunk + (1 if ichunk < nmonth%nchunk else 0) # distribute remainder on first chunks
+    chunks.append( (shiftMonth(begindate, m0), shiftMonth(begindate, m1-1)) )
+    m0 = m1
+  return chunks
+
+def selectChunkFiles(filelist, begindate, enddate):
+  ''' function to select the files that are necessary to process a chunk of months (based on file names) '''
+  firststamp = begindate[:10] + '_00' # first time-stamp of chunk
+  laststamp = shiftMonth(enddate)[:10] + '_00' # first time-stamp of the month following the chunk
+  stamps = [stamprgx.search(filename).group()[:13] for filename in filelist] # sorted like filelist
+  i0 = 0; i1 = len(filelist)
+  for i,stamp in enumerate(stamps):
+    if stamp <= firststamp: i0 = i # last file that begins before or at the beginning of the chunk
+    if stamp <= laststamp: i1 = i+1 # last file that contains the end of the chunk
+  return filelist[i0:i1]
+
+def getTimeRange(filelist, catalog=None):
+  ''' function to get the first and last time-stamp of a sorted file list (from the catalog or the files) '''
+  if catalog is not None: return catalog.getTimeRange(filelist) 
+  firstout = nc.Dataset(infolder+filelist[0], 'r', format='NETCDF4')
+  firststamp = str().join(firstout.variables[wrftimestamp][0,:]); firstout.close()
+  lastout = nc.Dataset(infolder+filelist[-1], 'r', format='NETCDF4')
+  lstidx = lastout.variables[wrftimestamp].shape[0]-1 # netcdf library has problems with negative indexing
+  laststamp = str().join(lastout.variables[wrftimestamp][lstidx,:]); lastout.close()
+  return firststamp, laststamp
+
+def estimateCost(filetype, nbytes, derivedcost=0.05):
+  ''' function to estimate the (relative) cost of averaging a file list from the size of the input and the number 
+      of non-linear derived variables and extrema of the filetype (derivedcost is the cost relative to reading) '''
+  nderived = len([devar for devar in derived_variables[filetype] if not devar.linear])
+  nderived += len(consecutive_variables[filetype] or [])
+  for exvars in (maximum_variables, minimum_variables, daymax_variables, daymin_variables, 
+                 weekmax_variables, weekmin_variables):
+    nderived += len(exvars[filetype])
+  return float(nbytes) * ( 1. + derivedcost*nderived )
+
+def splitBands(ny, nrow, halo=1):
+  ''' function to split the south_north axis into bands of (at most) nrow rows, with halo rows on either side 
+      (except at the domain boundary); returns a list of (first, last+1) of the band and the rows to be read '''
+  nband = int(np.ceil(float(ny)/max(1,nrow)))
+  bands = []; j0 = 0
+  for iband in xrange(nband):
+    j1 = j0 + ny//nband + (1 if iband < ny%nband else 0) # distribute remainder on first bands
+    bands.append( (j0, j1, max(0,j0-halo), min(ny,j1+halo)) )
+    j0 = j1
+  return bands
+
+def readBand(var, slices, band, lcopy=True):
+  ''' function to read a variable, restricted to a south_north band (including halo), if it has this axis;
+      if lcopy is False, prefetched variables return a read-only view of the buffer instead of a copy '''
+  if band is not None and wrfyax in var.dimensions:
+    slices = list(slices); slices[var.dimensions.index(wrfyax)] = slice(band[2],band[3])
+  if not lcopy and isinstance(var, PrefetchedVariable): return var.data[tuple(slices)]
+  return var.__getitem__(slices)
+
+def cropBand(data, yax, band):
+  ''' function to remove the halo from an array that was computed on a band (yax is the south_north axis) '''
+  if band is None or yax is None or ( band[0] == band[2] and band[1] == band[3] ): return data
+  slices = [slice(None)]*data.ndim; slices[yax] = slice(band[0]-band[2],band[1]-band[2])
+  return data[tuple(slices)]
+
+def bandIndex(data, yax, band):
+  ''' function to construct an index for the rows of a band in an array for the entire domain '''
+  slices = [slice(None)]*data.ndim
+  if band is not None and yax is not None: slices[yax] = slice(band[0],band[1])
+  return tuple(slices) if slices else Ellipsis # N.B.: an empty tuple would return a scalar, not a view
+
+class BandStorage(object):
+  ''' temporary storage of derived variables for one band: keys are qualified with the band index, so that the
+      (pointwise) state of each band is kept separately in the shared storage (and in checkpoints) '''
+  def __init__(self, storage, iband):
+    self.storage = storage; self.suffix = '@{:d}'.format(iband)
+  def __contains__(self, key): return key+self.suffix in self.storage
+  def __getitem__(self, key): return self.storage[key+self.suffix]
+  def __setitem__(self, key, value): self.storage[key+self.suffix] = value
+  def __delitem__(self, key): del self.storage[key+self.suffix]
+  def get(self, key, default=None): return self.storage.get(key+self.suffix, default)
+
+def setBand(data, idx, values):
+  ''' function to assign values to the rows of a band in an array for the entire domain; the array is upcast, 
+      if necessary, so that the precision is the same as without bands (where the array is simply replaced) '''
+  if values.dtype != data.dtype: data = data.astype(np.promote_types(data.dtype, values.dtype))
+  data[idx] = values
+  return data
+
 
 ## read arguments
 # number of processes NP 
@@ -122,10 +242,71 @@ if os.environ.has_key('PYAVG_DEBUG'):
   ldebug =  os.environ['PYAVG_DEBUG'] == 'DEBUG'
   lderivedonly = ldebug or lderivedonly # usually this is what we are debugging, anyway...
 else: ldebug = False # operational mode
+# split months of each filetype/domain into chunks that are processed by separate processes
+# N.B.: with AUTO, only jobs that are more expensive than their fair share (of all processes) are split
+lautochunk = os.environ.has_key('PYAVG_CHUNKS') and os.environ['PYAVG_CHUNKS'] == 'AUTO'
+if os.environ.has_key('PYAVG_CHUNKS') and os.environ['PYAVG_CHUNKS'] and not lautochunk: 
+  nchunks = int(os.environ['PYAVG_CHUNKS'])
+else: nchunks = 1 # one process per filetype and domain
+# number of input files to read ahead in a background thread (0: no prefetching)
+if os.environ.has_key('PYAVG_PREFETCH') and os.environ['PYAVG_PREFETCH']: 
+  nprefetch = int(os.environ['PYAVG_PREFETCH'])
+else: nprefetch = 0 # read files when they are needed
+# interval between checkpoints of the accumulator state in seconds (0: no checkpoints; used with PYAVG_RECOVER)
+if os.environ.has_key('PYAVG_CHECKPOINT') and os.environ['PYAVG_CHECKPOINT']: 
+  ckinterval = float(os.environ['PYAVG_CHECKPOINT'])
+else: ckinterval = 0. # no checkpoints
+# minimum interval between syncs of the output file in seconds (0: sync after every month)
+if os.environ.has_key('PYAVG_SYNC') and os.environ['PYAVG_SYNC']: 
+  syncinterval = float(os.environ['PYAVG_SYNC'])
+else: syncinterval = 0. # safest option
+# use persistent catalog of input files, instead of listing the input folder (CHECK: also check existing files)
+if os.environ.has_key('PYAVG_CATALOG'): 
+  lcatalog = os.environ['PYAVG_CATALOG'] != 'NOCATALOG'
+  lcheckcatalog = os.environ['PYAVG_CATALOG'] == 'CHECK'
+else: lcatalog = True; lcheckcatalog = False # only update catalog
+# share work with other invocations through a task queue on the file system (value: lease timeout in seconds)
+lqueue = os.environ.has_key('PYAVG_QUEUE') and bool(os.environ['PYAVG_QUEUE'])
+if lqueue and os.environ['PYAVG_QUEUE'] != 'QUEUE': leasetimeout = float(os.environ['PYAVG_QUEUE'])
+else: leasetimeout = 900. # a task is taken over by another worker, if its lease was not renewed for 15 minutes
+# memory limit per process in GB; if a file is too large, the domain is processed in south_north bands (0: no limit)
+if os.environ.has_key('PYAVG_MEMLIMIT') and os.environ['PYAVG_MEMLIMIT']: 
+  memlimit = float(os.environ['PYAVG_MEMLIMIT'])*1024.**3 # in bytes
+else: memlimit = 0. # process entire domain at once
 # wipe temporary storage after every month (no carry-over)
 if os.environ.has_key('PYAVG_CARRYOVER'): 
   lcarryover =  os.environ['PYAVG_CARRYOVER'] == 'CARRYOVER'
 else: lcarryover = True # operational mode
+# apply map-scale factors (MAPFAC_M from the constants file) to horizontal derivatives (e.g. vorticity)
+if os.environ.has_key('PYAVG_MAPFAC'): 
+  lmapfac =  os.environ['PYAVG_MAPFAC'] == 'MAPFAC'
+else: lmapfac = False # backwards compatible
+# calendar of the time stamps in WRF output (proleptic_gregorian or noleap/365_day)
+if os.environ.has_key('PYAVG_CALENDAR') and os.environ['PYAVG_CALENDAR']: 
+  calendar = os.environ['PYAVG_CALENDAR']
+else: calendar = 'proleptic_gregorian' # WRF default (missing leap days are also detected)
+# additional output streams: daily, seasonal and/or annual means (monthly means are always computed)
+if os.environ.has_key('PYAVG_STREAMS'):
+  streams = os.environ['PYAVG_STREAMS'].split() # space separated list (other characters cause problems...)
+  for stream in streams:
+    if stream not in stream_names: raise ArgumentError, "Unknown output stream '{:s}'.".format(stream)
+else: streams = [] # only monthly means
+# climatology periods (first and last year, inclusive), which are updated whenever new months are added
+if os.environ.has_key('PYAVG_CLIM'):
+  climperiods = os.environ['PYAVG_CLIM'].split() # space separated list, e.g. '1979-1994 2045-2059'
+  for climperiod in climperiods:
+    try: climPeriod(climperiod)
+    except StreamError: raise ArgumentError, "Invalid climatology period '{:s}'.".format(climperiod)
+else: climperiods = [] # no climatologies
+# also compute the interannual standard deviation of climatologies
+if os.environ.has_key('PYAVG_CLIMSTD'): 
+  lclimstd =  os.environ['PYAVG_CLIMSTD'] == 'CLIMSTD'
+else: lclimstd = False # only means
+# time of day of diurnal cycles: UTC or local solar time (SOLAR; requires XLONG in the constants file)
+if os.environ.has_key('PYAVG_DIURNAL') and os.environ['PYAVG_DIURNAL']: 
+  if os.environ['PYAVG_DIURNAL'] not in ('UTC','SOLAR'): raise ArgumentError, "PYAVG_DIURNAL has to be 'UTC' or 'SOLAR'."
+  lsolar = os.environ['PYAVG_DIURNAL'] == 'SOLAR'
+else: lsolar = False # UTC
 
 # working directories
 exproot = os.getcwd()
@@ -179,12 +360,26 @@ inputpattern = '^wrf{0:s}_d{1:s}_{2:s}_\d\d[_:]\d\d[_:]\d\d(?:\.nc$|$)' # expand
 constpattern = 'wrfconst_d{0:02d}' # expanded with format(domain), also WRF output
 # N.B.: file extension is added automatically for constpattern and handled by regex for inputpattern 
 outputpattern = 'wrf{0:s}_d{1:02d}_monthly.nc' # expanded with format(type,domain)
+partialpattern = 'tmp_wrfavg_chunk{2:02d}_wrf{0:s}_d{1:02d}_monthly.nc' # expanded with format(type,domain,chunk)
+carrypattern = 'tmp_wrfavg_chunk{2:02d}_wrf{0:s}_d{1:02d}_carryover.npz' # carry-over state at the end of a chunk
+streampattern = 'wrf{0:s}_d{1:02d}_{2:s}.nc' # expanded with format(type,domain,stream), e.g. daily (PYAVG_STREAMS)
+partialdailypattern = 'tmp_wrfavg_chunk{2:02d}_wrf{0:s}_d{1:02d}_daily.nc' # expanded with format(type,domain,chunk)
+partialstreampattern = 'tmp_wrfavg_chunk{2:02d}_wrf{0:s}_d{1:02d}_{3:s}.nc' # expanded with format(type,domain,chunk,stream)
+climpattern = 'wrf{0:s}_d{1:02d}_clim_{2:s}.nc' # expanded with format(type,domain,period) (PYAVG_CLIM)
+climstatepattern = 'wrf{0:s}_d{1:02d}_climstate_{2:s}.nc' # running sums of a climatology; expanded like climpattern
+checkpointpattern = 'tmp_wrfavg_{0:s}_checkpoint.npz' # expanded with format(output filename without extension)
+queuefolder = 'tmp_wrfavg_queue/' # task queue shared by several invocations (in output folder)
+stamprgx = re.compile('\d\d\d\d-\d\d-\d\d_\d\d[_:]\d\d[_:]\d\d') # time-stamp in file names
 # variable attributes
 wrftime = 'Time' # time dim in wrfout files
 wrfxtime = 'XTIME' # time in minutes since WRF simulation start
+wrfyax = 'south_north' # axis along which the domain is split into bands (PYAVG_MEMLIMIT)
+tilehalo = 1 # halo rows for bands (the centredDiff stencils only use the neighbouring rows)
+tilefactor = 2. # safety factor for the memory estimate of bands (temporary arrays during computation)
 wrfaxes = dict(Time='tax', west_east='xax', south_north='yax', num_press_levels_stag='pax')
 wrftimestamp = 'Times' # time-stamp variable in WRF
 time = 'time' # time dim in monthly mean files
+timingatt = 'wrfavg_seconds_per_month' # processing time of the last run, used for scheduling
 dimlist = ['x','y'] # dimensions we just copy
 dimmap = {time:wrftime} #{time:wrftime, 'x':'west_east','y':'south_north'}
 midmap = dict(zip(dimmap.values(),dimmap.keys())) # reverse dimmap
@@ -198,21 +393,23 @@ bktpfx = 'I_' # prefix for bucket variables; these are processed together with t
 
 # derived variables
 derived_variables = {filetype:[] for filetype in filetypes} # derived variable lists by file type
-derived_variables['srfc']   = [dv.Rain(), dv.LiquidPrecipSR(), dv.SolidPrecipSR(), dv.NetPrecip(sfcevp='QFX'),  
-                               dv.WaterVapor(), dv.OrographicIndex(), dv.CovOIP(),
+# N.B.: variables that are defined by a single expression are created from the expression registry (dvx); 
+#       non-linear expressions are evaluated together (fused), the classes are used for all other variables
+dvx = dv.newExpressionVariable
+derived_variables['srfc']   = [dvx('RAIN'), dv.LiquidPrecipSR(), dv.SolidPrecipSR(), dvx('NetPrecip', sfcevp='QFX'),  
+                               dvx('WaterVapor'), dv.OrographicIndex(),
                                dv.SummerDays(threshold=25., temp='T2'), dv.FrostDays(threshold=0., temp='T2')]
                               # N.B.: measures the fraction of 6-hourly samples above/below the threshold (day and night)
-derived_variables['xtrm']   = [dv.RainMean(), dv.TimeOfConvection(),
+derived_variables['xtrm']   = [dvx('RAINMEAN'), dv.TimeOfConvection(calendar=calendar),
                                dv.SummerDays(threshold=25., temp='T2MAX'), dv.FrostDays(threshold=0., temp='T2MIN')]
-derived_variables['hydro']  = [dv.Rain(), dv.LiquidPrecip(), dv.SolidPrecip(), 
-                               dv.NetPrecip(sfcevp='SFCEVP'), dv.NetWaterFlux()]
-derived_variables['lsm']    = [dv.RunOff()]
-derived_variables['plev3d'] = [dv.OrographicIndexPlev(), dv.Vorticity(), dv.WaterDensity(),
-                               dv.WaterFlux_U(), dv.WaterFlux_V(), dv.ColumnWater(), 
+derived_variables['hydro']  = [dvx('RAIN'), dvx('LiquidPrecip'), dvx('SolidPrecip'), 
+                               dvx('NetPrecip', sfcevp='SFCEVP'), dvx('NetWaterFlux')]
+derived_variables['lsm']    = [dvx('Runoff')]
+derived_variables['plev3d'] = [dv.OrographicIndexPlev(), dv.Vorticity(lmapfac=lmapfac), dvx('WaterDensity'),
+                               dvx('WaterFlux_U'), dvx('WaterFlux_V'), dv.ColumnWater(), 
                                dv.WaterTransport_U(), dv.WaterTransport_V(),
-                               dv.HeatFlux_U(), dv.HeatFlux_V(), dv.ColumnHeat(), 
-                               dv.HeatTransport_U(),dv.HeatTransport_V(),
-                               dv.GHT_Var(), dv.Vorticity_Var()]
+                               dvx('HeatFlux_U'), dvx('HeatFlux_V'), dv.ColumnHeat(), 
+                               dv.HeatTransport_U(),dv.HeatTransport_V()]
 # add wet-day variables for different thresholds
 wetday_variables = [dv.WetDays, dv.WetDayRain, dv.WetDayPrecip] 
 for threshold in precip_thresholds:
@@ -273,6 +470,40 @@ weekmin_variables  = {filetype:[] for filetype in filetypes} # mininma variable
 weekmin_variables['xtrm']   = ['T2MEAN', 'T2MIN', 'SPDUV10MEAN']
 weekmin_variables['hydro']  = ['RAIN', 'NetPrecip', 'NetWaterFlux']
 weekmin_variables['lsm']    = ['SFROFF','UDROFF','Runoff']
+# streaming moments: variance and standard deviation (just list base variables with a name prefix)
+moment_variables = {filetype:dict() for filetype in filetypes} # moment variables by file type
+moment_variables['plev3d'] = {'GHT':'GHT_PL', 'Vorticity':'Vorticity'} # GHT_Var, GHT_Std, etc.
+# covariances of pairs of variables (name prefix and pair of base variables)
+covariance_variables = {filetype:dict() for filetype in filetypes} # covariance variables by file type
+covariance_variables['srfc'] = {'OIP':('OrographicIndex','RAIN')} # OIP_Cov (for correlation coefficient)
+# quantiles (percentiles) of daily means, which are estimated from monthly histograms (bin edges, bin scale and 
+# value of quantiles in the underflow bin); the histograms are also written, so that they can be merged later
+quantile_levels = (0.90, 0.95, 0.99) # P90, P95 and P99
+quantile_variables = {filetype:dict() for filetype in filetypes} # histogram bins by file type
+quantile_variables['srfc'] = {'RAIN':(logBins(0.1/86400., 1000./86400., 80), 'log', 0.), # 0.1 - 1000 mm/day (dry: 0)
+                              'T2':(linearBins(200., 330., 130), 'linear', None)} # 1 K bins
+# histograms of every time step, which are written to a separate file (histogram stream; bin edges and bin scale)
+histogram_variables = {filetype:dict() for filetype in filetypes} # histogram bins by file type
+histogram_variables['srfc'] = {'RAIN':(logBins(0.1/86400., 1000./86400., 40), 'log'), # 0.1 - 1000 mm/day
+                               'T2':(linearBins(200., 330., 130), 'linear')} # 1 K bins
+# the bins can also be set in an environment variable (space separated list of var:scale:min:max:nbin)
+if os.environ.has_key('PYAVG_HISTOGRAMS') and os.environ['PYAVG_HISTOGRAMS']:
+  histspecs = dict()
+  for histspec in os.environ['PYAVG_HISTOGRAMS'].split():
+    try:
+      varname, scale, vmin, vmax, nbin = histspec.split(':')
+      if scale == 'log': histspecs[varname] = (logBins(float(vmin), float(vmax), int(nbin)), scale)
+      elif scale == 'linear': histspecs[varname] = (linearBins(float(vmin), float(vmax), int(nbin)), scale)
+      else: raise ValueError
+    except (ValueError, HistogramError): 
+      raise ArgumentError, "Invalid histogram specification '{:s}' (var:scale:min:max:nbin).".format(histspec)
+  # N.B.: variables that are not available in a file type are ignored
+  histogram_variables = {filetype:histspecs for filetype in filetypes}
+# mean diurnal cycles by time of day, which are written to a separate file (diurnal stream)
+# N.B.: rates of accumulated variables (e.g. RAIN) are averages over the output interval before the time stamp
+diurnal_bins = 24 # number of time-of-day bins (hours)
+diurnal_variables = {filetype:[] for filetype in filetypes} # variables by file type (missing ones are ignored)
+diurnal_variables['srfc'] = ['T2', 'Q2', 'RAIN', 'U10', 'V10', 'QFX', 'HFX', 'LH'] # temperature, precip, winds, fluxes
 # N.B.: it is important that the derived variables are listed in order of dependency! 
 # set of pre-requisites
 prereq_vars = {key:set() for key in derived_variables.iterkeys()} # pre-requisite variable set by file type
@@ -282,10 +513,15 @@ for key in prereq_vars.iterkeys():
 
 ## main work function
 # N.B.: the loop iterations should be entirely independent, so that they can be run in parallel
-def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger=None, ldebug=False):
-  ''' This function is doing the main work, and is supposed to be run in a multiprocessing environment. '''  
+def processFileList(filelist, filetype, ndom, chunk=None, lparallel=False, pidstr='', logger=None, ldebug=False):
+  ''' This function is doing the main work, and is supposed to be run in a multiprocessing environment. 
+      In chunked mode, chunk = (ichunk, nchunk, begindate, enddate, origin) and only the months of the chunk are 
+      processed and written to a partial file, along with the carry-over state at the end of the chunk; origin 
+      is the begin date of the first chunk. '''  
   
   ## setup files and folders
+  tstart = clock() # processing time per month is recorded in the output file (for scheduling)
+  dv.slabcache.reset() # cache for intermediates that are shared between derived variables (hit counts per file list)
 
   # load first file to copy some meta data
   wrfoutfile = infolder+filelist[0]
@@ -338,6 +574,25 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   addExtrema(daymin_variables, 'min', interval=1)  
   addExtrema(weekmax_variables, 'max', interval=5) # 5 days is the preferred interval, according to
   addExtrema(weekmin_variables, 'min', interval=5) # ETCCDI Climate Change Indices
+  # create derived variables for moments and covariances
+  def getVariable(varname):
+    return derived_vars[varname] if varname in derived_vars else wrfout.variables[varname]
+  for prefix,varname in moment_variables[filetype].iteritems():
+    for moment in ('var','std'): # N.B.: the mean is the same as the monthly mean of the variable
+      devar = dv.Moment(getVariable(varname), moment, name='{:s}_{:s}'.format(prefix,moment.title()), dimmap=midmap)
+      derived_vars[devar.name] = devar
+  for prefix,(varname,varname2) in covariance_variables[filetype].iteritems():
+    devar = dv.Moment(getVariable(varname), 'cov', var2=getVariable(varname2), name=prefix+'_Cov', dimmap=midmap)
+    derived_vars[devar.name] = devar
+  # create derived variables for histograms of daily means and quantiles
+  for varname,(edges,scale,underflow) in quantile_variables[filetype].iteritems():
+    hist = dv.Histogram(getVariable(varname), edges, scale=scale, interval=1, dimmap=midmap)
+    derived_vars[hist.name] = hist
+    for quantile in quantile_levels:
+      devar = dv.Quantile(hist, quantile, underflow=underflow)
+      derived_vars[devar.name] = devar
+  # sort derived variables by dependencies (raises PlanError, if there are cyclic dependencies)
+  derived_vars = sortVariables(derived_vars)
 
   # if we are only computing derived variables, remove all non-prerequisites
   prepq = set().union(*[devar.prerequisites for devar in derived_vars.itervalues()])
@@ -345,32 +600,30 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
 
     
   # get some meta info and construct title string (printed after file creation)
-  begindate = str().join(wrfout.variables[wrftimestamp][0,:10]) # first timestamp in first file
-  beginyear, beginmonth, beginday = [int(tmp) for tmp in begindate.split('-')]
-  # always need to begin on the first of a month (discard incomplete data of first month)
-  if beginday != 1:
-    beginmonth += 1 # move on to next month
-    beginday = 1 # and start at the first (always...)
-    begindate = '{0:04d}-{1:02d}-{2:02d}'.format(beginyear, beginmonth, beginday) # rewrite begin date
+  firstdate = str().join(wrfout.variables[wrftimestamp][0,:10]) # first timestamp in first file
   # open last file and get last date
   lastoutfile = infolder+filelist[-1]
   logger.debug("{0:s} Opening last input file '{1:s}'.".format(pidstr,lastoutfile))
   lastout = nc.Dataset(lastoutfile, 'r', format='NETCDF4')
   lstidx = lastout.variables[wrftimestamp].shape[0]-1 # netcdf library has problems with negative indexing
-  enddate = str().join(lastout.variables[wrftimestamp][lstidx,:10]) # last timestamp in last file
-  endyear, endmonth, endday = [int(tmp) for tmp in enddate.split('-')]; del endday # make warning go away...
-  # the last timestamp should be the next month (i.e. that month is not included)
-  if endmonth == 1: 
-    endmonth = 12; endyear -= 1 # previous year 
-  else: endmonth -= 1 
-  endday = 1 # first day of last month (always 1st..)
-  assert 1 <= endday <= 31 and 1 <= endmonth <= 12 # this is kinda trivial...  
-  enddate = '{0:04d}-{1:02d}-{2:02d}'.format(endyear, endmonth, endday) # rewrite begin date
+  lastdate = str().join(lastout.variables[wrftimestamp][lstidx,:10]) # last timestamp in last file
+  lastout.close()
+  # always begin on the first of a month and end with the last complete month
+  begindate, enddate = getMonthRange(firstdate, lastdate)
+  # in chunked mode only a part of the months is processed
+  if chunk is not None:
+    ichunk, nchunk, begindate, enddate, origin = chunk
+    lsimstart = ichunk == 0 # only the first chunk includes the simulation start
+  else: lsimstart = True
+  beginyear, beginmonth = [int(tmp) for tmp in begindate[:7].split('-')]
+  endyear, endmonth = [int(tmp) for tmp in enddate[:7].split('-')]
       
   # open/create monthly mean output file
   filename = outputpattern.format(filetype,ndom)  
   if lparallel: tmppfx = 'tmp_wrfavg_{:s}_'.format(pidstr[1:-1])
   else: tmppfx = 'tmp_wrfavg_'.format(pidstr[1:-1])
+  # N.B.: in chunked mode, the output is a partial file, which is merged later (mergeChunks)
+  if chunk is not None: filename = partialpattern.format(filetype,ndom,ichunk)
   tmpfilename = tmppfx + filename 
   meanfile = outfolder+filename
   tmpmeanfile = outfolder+tmpfilename
@@ -505,30 +758,74 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
 #     mean.dryday_threshold = dv.dryday_threshold # threshold for dry days used in statistical computations
   # sync with file
   mean.sync()     
+  # daily means are written to a separate file (PYAVG_STREAMS), but only along with all other variables
+  lday = 'daily' in streams and not ( laddnew or lrecalc )
+  if 'daily' in streams and not lday:
+    logger.warning("\n{0:s} Daily means can not be added to existing daily files (ADDNEW/RECALC) - skipping daily stream.\n".format(pidstr))
+  # histograms and diurnal cycles are written to separate files (PYAVG_STREAMS) and are not subject to the checks 
+  # of the monthly file
+  sidevars = OrderedDict() # names of derived variables in separate files of monthly records, by stream
+  for stream in monthly_streams:
+    if stream in streams and ( laddnew or lrecalc ):
+      logger.warning("\n{0:s} Monthly {1:s} records can not be added to existing files (ADDNEW/RECALC) - skipping {1:s} stream.\n".format(pidstr,stream))
+  def getSource(varname):
+    if varname in derived_vars: return derived_vars[varname]
+    elif varname in varlist: return wrfout.variables[varname]
+    else: return None # not available in this file type
+  if 'histogram' in streams and not ( laddnew or lrecalc ):
+    for varname,(edges,scale) in histogram_variables[filetype].iteritems():
+      if getSource(varname) is None: continue
+      devar = dv.Histogram(getSource(varname), edges, scale=scale, dimmap=midmap)
+      derived_vars[devar.name] = devar # prerequisites are already listed before
+      sidevars.setdefault('histogram',[]).append(devar.name)
+  if 'diurnal' in streams and not ( laddnew or lrecalc ):
+    for varname in diurnal_variables[filetype]:
+      if getSource(varname) is None: continue
+      devar = dv.Diurnal(getSource(varname), nbin=diurnal_bins, lsolar=lsolar, calendar=calendar, dimmap=midmap)
+      derived_vars[devar.name] = devar # prerequisites are already listed before
+      sidevars.setdefault('diurnal',[]).append(devar.name)
+  sidestream = {dename:stream for stream,names in sidevars.iteritems() for dename in names}
 
 
   ## construct dependencies
   # update linearity: dependencies of non-linear variables have to be treated as non-linear themselves
-  lagain = True
-  # parse through dependencies until nothing changes anymore
-  while lagain:
-    lagain = False
-    for devar in derived_vars.itervalues():
-      if not devar.linear:
-        # make sure all dependencies are also treated as non-linear
-        for pq in devar.prerequisites:
-          if pq in derived_vars and derived_vars[pq].linear:
-            lagain = True # indicate modification
-            derived_vars[pq].linear = False
+  propagateNonlinearity(derived_vars)
   # construct dependency set (should include extrema now)
   pqset = set().union(*[devar.prerequisites for devar in derived_vars.itervalues() if not devar.linear])
   cset = set().union(*[devar.constants for devar in derived_vars.itervalues() if devar.constants is not None])
+  # function to compute the size of a variable per time step (and per row, if lrow) from its dimensions
+  def varbytes(shape, dims, itemsize, lrow=False):
+    if lrow and wrfyax not in dims: return 0
+    return itemsize*np.prod([n for n,dim in zip(shape,dims) if dim not in (wrftime,time) and not (lrow and dim == wrfyax)])
+  def plansizes(lrow=False):
+    sizes = {var:varbytes(wrfout.variables[var].shape, wrfout.variables[var].dimensions, wrfout.variables[var].dtype.itemsize, 
+                          lrow=lrow) for var in pqset if var in wrfout.variables}
+    sizes.update({dename:varbytes([len(wrfout.dimensions[ax]) if ax in wrfout.dimensions else devar.dimsizes.get(ax,1) 
+                                   for ax in devar.axes], devar.axes, (devar.dtype or dtype_float).itemsize, lrow=lrow) 
+                  for dename,devar in derived_vars.iteritems()})
+    return sizes
+  # plan the computation of derived variables: variables that release memory are computed first, consecutive 
+  # expression variables are evaluated together (fused), and prerequisites are released after their last consumer
+  plan = ExecutionPlan(derived_vars, pqset, sizes=plansizes())
+  if ldebug:
+    nt = len(wrfout.dimensions[wrftime]) # time steps in the first file
+    logger.debug('\n{0:s} Derived variable plan (memory for {1:d} time steps):\n{2:s}\n'.format(pidstr, nt, 
+                 plan.describe(plansizes(), scale=nt/1024.**2)))
   
   # initialize dictionary for temporary storage
   tmpdata = dict() # not allocated - use sparingly
+  # in chunked mode, variables that carry over a state track their state at the beginning of the chunk (lead),
+  # so that it can be joined with the state at the end of the previous chunk, when the chunks are merged
+  if chunk is not None and lcarryover:
+    chunkaxis = TimeAxis(origin=origin[:10]+'_00:00:00', calendar=calendar)
+    offset = 60. * int(chunkaxis.minutes([begindate[:10]+'_00:00:00'])[0]) # in seconds, like delta
+    for devar in derived_vars.itervalues(): devar.startChunk(offset)
+    leadvars = [devar for devar in derived_vars.itervalues() if devar.leaddata is not None]
+  else: leadvars = []
+  leadmonth = dict() # month in which the lead ended
   
   # load constants, if necessary
-  const = dict()
+  const = dict(); constdims = dict() # dimensions are needed to split constant fields into bands
   lconst = len(cset) > 0
   if lconst:
     constfile = infolder+constpattern.format(ndom)
@@ -538,7 +835,8 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
     wrfconst = nc.Dataset(constfile, 'r', format='NETCDF4')
     # constant variables
     for cvar in cset:
-      if cvar in wrfconst.variables: const[cvar] = wrfconst.variables[cvar][:]
+      if cvar in wrfconst.variables: 
+        const[cvar] = wrfconst.variables[cvar][:]; constdims[cvar] = wrfconst.variables[cvar].dimensions
       elif cvar in wrfconst.ncattrs(): const[cvar] = wrfconst.getncattr(cvar)
       else: raise ValueError, "Constant variable/attribute '{:s}' not found in constants file '{:s}'.".format(cvar,constfile)             
   else: const = None
@@ -547,7 +845,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   for devar in derived_vars.itervalues():
     for pq in devar.prerequisites:
       # get dimensions of prerequisite
-      if pq in varlist: pqax = wrfout.variables[pq].dimensions
+      if pq in varlist or pq == wrftimestamp: pqax = wrfout.variables[pq].dimensions
       elif lconst and pq in wrfconst.variables: pqax = wrfconst.variables[pq].dimensions
       elif lconst and pq in const: pqax = () # a scalar value, i.e. no axes
       elif pq in derived_vars: pqax = derived_vars[pq].axes
@@ -566,6 +864,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   for devar in derived_vars.itervalues(): devarstr += '%s, '%devar.name
   titlestr = '\n\n{0:s}    ***   Processing wrf{1:s} files for domain {2:d}.   ***'.format(pidstr,filetype,ndom)
   titlestr += '\n          (monthly means from {0:s} to {1:s}, incl.)'.format(begindate,enddate)
+  if streams: titlestr += '\n          (additional output streams: {0:s})'.format(', '.join(streams))
   if varstr: titlestr += '\n Variable list: {0:s}'.format(str(varstr),)
   else: titlestr += '\n Variable list: None'
   if devarstr: titlestr += '\n Derived variables: {0:s}'.format(str(devarstr),)
@@ -580,7 +879,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   if wrfxtime in wrfout.variables: 
     lxtime = True # simply compute differences from XTIME (assuming minutes)
     assert wrfout.variables[wrfxtime].description == "minutes since simulation start"
-    if t0 == 1 and not wrfout.variables[wrfxtime][0] == 0:
+    if t0 == 1 and lsimstart and not wrfout.variables[wrfxtime][0] == 0:
       raise ValueError, ( 'XTIME in first input file does not start with 0!\n'+
                           '(this can happen, when the first input file is missing)' )
   elif wrftimestamp in wrfout.variables: 
@@ -599,7 +898,10 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
     tmpshape = list(wrfout.variables[var].shape)
     del tmpshape[wrfout.variables[var].dimensions.index(wrftime)] # allocated arrays have no time dimension
     assert len(tmpshape) ==  len(wrfout.variables[var].shape) -1
-    data[var] = np.zeros(tmpshape, dtype=dtype_float) # allocate
+    # N.B.: the accumulators are reused for every month, so they need the type that the sums will have
+    dtype = getAccumulatorDtype(wrfout.variables[var].dtype, dtype_float, missing_value=missing_value, 
+                                laccumulated=var in acclist)
+    data[var] = np.zeros(tmpshape, dtype=dtype) # allocate
     #if missing_value is not None:
     #  data[var] += missing_value # initialize with missing value
   # allocate derived data arrays (for non-linear variables)   
@@ -609,14 +911,147 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   # N.B.: linear derived variables are computed directly from the monthly averages 
   for dename,devar in derived_vars.iteritems():
     if not devar.linear:
-      tmpshape = [len(wrfout.dimensions[ax]) for ax in devar.axes if ax != time] # infer shape
+      tmpshape = [devar.dimsizes[ax] if ax in devar.dimsizes else len(wrfout.dimensions[ax]) 
+                  for ax in devar.axes if ax != time] # infer shape (some dimensions are not in the input, e.g. bins)
       assert len(tmpshape) ==  len(devar.axes) -1 # no time dimension
       dedata[dename] = np.zeros(tmpshape, dtype=dtype_float) # allocate     
+  buffers = ReductionBuffers() # reusable buffers for time sums and missing value masks
   
-      
   # prepare computation of monthly means  
   filecounter = 0 # number of wrfout file currently processed 
   i0 = t0-1 # index position we write to: i = i0 + n (zero-based, of course)
+  # existing records in the output file (the file is written by the writer thread, while we continue)
+  meantimes = mean.variables[time][:]
+  
+  # checkpoint of the accumulator state in the middle of a month, which allows us to resume with PYAVG_RECOVER
+  ckfile = outfolder+checkpointpattern.format(filename[:-3]); cktmpfile = ckfile[:-4]+'_tmp.npz'
+  checkpoint = None; cktime = clock() # time of last checkpoint
+  if os.path.exists(ckfile):
+    if lrecover and not ( loverwrite or laddnew or lrecalc ):
+      checkpoint = dict(np.load(ckfile))
+      ckidx = int(checkpoint['meanidx'])
+      # all previous records have to be complete and no later record can have been written
+      lvalid = ckidx >= i0 and np.all(meantimes[:ckidx] != -1) 
+      lvalid = lvalid and ( len(meantimes) == ckidx or ( len(meantimes) == ckidx+1 and meantimes[ckidx] == -1 ) )
+      lvalid = lvalid and str(checkpoint['filename']) in filelist
+      lvalid = lvalid and ( not lday or 'day_day' in checkpoint ) # state of the current day
+      # the variables have to be the same
+      lvalid = lvalid and all([ 'data_'+varname in checkpoint and checkpoint['data_'+varname].shape == var.shape 
+                                for varname,var in data.iteritems() ])
+      lvalid = lvalid and all([ 'dedata_'+dename in checkpoint and checkpoint['dedata_'+dename].shape == devar.shape 
+                                for dename,devar in dedata.iteritems() ])
+      if lvalid:
+        filecounter = filelist.index(str(checkpoint['filename'])) # resume with this file
+        logger.info("\n{0:s} Resuming from checkpoint in month {1:d}, file '{2:s}', index {3:d}.\n".format(pidstr,
+                    ckidx, filelist[filecounter], int(checkpoint['wrfstartidx'])))
+      else:
+        logger.info("\n{0:s} Checkpoint '{1:s}' is inconsistent with output file - ignoring it.\n".format(pidstr,ckfile))
+        checkpoint = None
+    else: os.remove(ckfile) # remove old checkpoint
+      
+  # start background reader for input files (prefetching)
+  if nprefetch > 0:
+    pfvars = varlist + [bktpfx+varname for varname in varlist if acclist.get(varname)] + [wrftimestamp, wrfxtime]
+    prefetcher = FilePrefetcher(filelist[filecounter:], folder=infolder, varlist=pfvars, depth=nprefetch)
+    wrfout.close(); wrfout = prefetcher.nextFile(filelist[filecounter]) # the first file is also loaded by the reader
+  else: prefetcher = None
+  # function to open the next input file
+  def openInput(filecounter):
+    if prefetcher is None: return nc.Dataset(infolder+filelist[filecounter], 'r', format='NETCDF4')
+    else: return prefetcher.nextFile(filelist[filecounter]) # wait for reader, if necessary
+  if prefetcher is None and filecounter > 0: 
+    wrfout.close(); wrfout = openInput(filecounter) # resume from checkpoint
+  lnclock = False # whether the NetCDF library lock is held by this thread
+  # N.B.: without prefetching, input is read from file, so we need to hold the lock while accessing input files
+  linput = prefetcher is None 
+  # function to decode the time index of an input file (once per file)
+  def indexTimes(wrfout):
+    wrftimestamps = wrfout.variables[wrftimestamp][:]
+    return dv.joinTimeStamps(wrftimestamps), timeaxis.minutes(wrftimestamps) # strings and integer minutes 
+  # N.B.: times are counted in minutes since the first time stamp that is processed, in the given calendar
+  timeaxis = TimeAxis(origin=dv.joinTimeStamps(wrfout.variables[wrftimestamp][:1])[0], calendar=calendar)
+  wrfstamps, wrftimes = indexTimes(wrfout)
+  
+  # daily means are accumulated from the same slabs (PYAVG_STREAMS): base variables, derived variables that are 
+  # computed for every time step and linear derived variables that only depend on those
+  if lday:
+    dayvars = OrderedDict([(varname,data[varname].shape) for varname in varlist])
+    for group,names in plan.steps:
+      if group is None or isinstance(group,dv.ExpressionGroup):
+        for dename in names:
+          if derived_vars[dename].normalize and derived_vars[dename].tmpdata is None: dayvars[dename] = dedata[dename].shape
+    daylinear = []
+    for devar in derived_vars.itervalues():
+      if devar.linear and all([pq in dayvars or pq in [dl.name for dl in daylinear] for pq in devar.prerequisites]): 
+        daylinear.append(devar)
+    if chunk is None: dayname = streampattern.format(filetype,ndom,'daily')
+    else: dayname = partialdailypattern.format(filetype,ndom,ichunk)
+    dayfile = outfolder+dayname; tmpdayfile = outfolder+tmppfx+dayname
+    dayset = openStreamFile(dayfile, tmpdayfile, mean, dayvars.keys()+[devar.name for devar in daylinear]+[wrftimestamp], 
+                            'days', begindate, 'wrf{0:s}_d{1:02d} daily means'.format(filetype,ndom), 
+                            loverwrite=loverwrite, lrecover=lrecover)
+    daily = DailyStream(timeaxis, dayvars, dayset.begin_date, accumulated=[varname for varname in varlist if varname in acclist], 
+                        linear=daylinear)
+    logger.debug("{0:s} Daily means in '{1:s}': {2:s}".format(pidstr, dayname, ', '.join(dayvars.keys()+[devar.name for devar in daylinear])))
+  else: daily = None
+  daywriter = None # writer thread for daily means is started below
+  # separate files for monthly records of some derived variables (e.g. histograms), with the time axis of the 
+  # monthly file
+  sidesets = OrderedDict(); sidefiles = dict()
+  for stream,names in sidevars.iteritems():
+    if chunk is None: sidename = streampattern.format(filetype,ndom,stream)
+    else: sidename = partialstreampattern.format(filetype,ndom,ichunk,stream)
+    sidefiles[stream] = (outfolder+sidename, outfolder+tmppfx+sidename)
+    sidesets[stream] = openStreamFile(outfolder+sidename, outfolder+tmppfx+sidename, mean, [wrftimestamp], 'month', 
+                                      mean.begin_date, 'wrf{0:s}_d{1:02d} monthly {2:s} records'.format(filetype,ndom,stream), 
+                                      loverwrite=loverwrite, lrecover=lrecover)
+    for dename in names:
+      derived_vars[dename].checkPrerequisites(mean) # the prerequisites are in the monthly file
+      if dename not in sidesets[stream].variables: derived_vars[dename].createVariable(sidesets[stream])
+    logger.debug("{0:s} Monthly {1:s} records in '{2:s}': {3:s}".format(pidstr, stream, sidename, ', '.join(names)))
+  sidewriters = OrderedDict() # writer threads for separate files are started below
+  
+  # split domain into south_north bands, if the slab of one input file does not fit into memory (PYAVG_MEMLIMIT)
+  bands = [None]; bandconst = [const] # None means the entire domain
+  if memlimit > 0 and wrfyax in wrfout.dimensions:
+    ny = len(wrfout.dimensions[wrfyax])
+    # N.B.: bands only work, if derived variables are computed pointwise or with centredDiff stencils (with halo), 
+    #       and don't keep temporary storage of their own (unless it is pointwise and kept for each band)
+    ltile = all([wrfyax in devar.axes and (devar.tmpdata is None or devar.bandstate) 
+                 for devar in derived_vars.itervalues() if not devar.linear])
+    # memory per row and time step: prerequisites and derived variables according to the plan (peak), 
+    # other variables are transient
+    nobytes = [varbytes(wrfout.variables[var].shape, wrfout.variables[var].dimensions, wrfout.variables[var].dtype.itemsize, 
+                        lrow=True) for var in varlist if var not in pqset]
+    slabrow = tilefactor * len(wrftimes) * ( plan.estimatePeak(plansizes(lrow=True)) + max(nobytes or [0]) )
+    # N.B.: the accumulators always cover the entire domain
+    fixed = sum([var.nbytes for var in data.itervalues()]) + sum([var.nbytes for var in dedata.itervalues()])
+    if daily is not None: fixed += daily.nbytes(ndays=(wrftimes[-1]-wrftimes[0])//1440 + 2) # daily sums of a slab
+    # N.B.: prefetched files are loaded entirely, i.e. the current file and up to nprefetch files ahead
+    if prefetcher is not None:
+      filebytes = sum([wrfout.variables[var].dtype.itemsize * np.prod(wrfout.variables[var].shape, dtype='int64') 
+                       for var in pfvars if var in wrfout.variables]) # estimated from the first file
+      fixed += ( nprefetch + 1 ) * filebytes
+    nrow = int( ( memlimit - fixed ) // slabrow ) if slabrow > 0 else ny
+    if nrow < ny and not ltile:
+      logger.info("\n{0:s} Derived variables of filetype '{1:s}' can not be computed in bands - ignoring memory limit.\n".format(pidstr,filetype))
+    elif nrow < ny:
+      bands = splitBands(ny, nrow, halo=tilehalo)
+      # constant fields are split into bands once (derived fields that are cached in const are kept for each band)
+      bandconst = []
+      for band in bands:
+        if const is None: bandconst.append(None); continue
+        bconst = dict()
+        for cvar,cval in const.iteritems():
+          if cvar in constdims and wrfyax in constdims[cvar]:
+            slices = [slice(None)]*cval.ndim; slices[constdims[cvar].index(wrfyax)] = slice(band[2],band[3])
+            bconst[cvar] = cval[tuple(slices)]
+          else: bconst[cvar] = cval # scalars and fields without south_north axis
+        bandconst.append(bconst)
+      logger.info("\n{0:s} Processing wrf{1:s} files in {2:d} bands of {3:d} rows (memory limit {4:.1f} GB).\n".format(
+                  pidstr, filetype, len(bands), ny//len(bands), memlimit/1024.**3))
+  writer = None # writer thread is started below
+  nwritten = 0 # number of months processed
   ## start loop over month
   if lparallel: progressstr = '' # a string printing the processed dates
   else: logger.info('\n Processed dates:')
@@ -624,6 +1059,13 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
 
   try:
     
+    # start background writer, which keeps the output file open
+    writer = MonthlyWriter(mean, timevar=time, missing_value=missing_value, syncinterval=syncinterval)
+    if daily is not None: 
+      daily.writer = daywriter = MonthlyWriter(dayset, timevar=time, missing_value=missing_value, syncinterval=syncinterval)
+    for stream,sideset in sidesets.iteritems():
+      sidewriters[stream] = MonthlyWriter(sideset, timevar=time, missing_value=missing_value, syncinterval=syncinterval)
+    if linput: nclock.acquire(); lnclock = True
     # loop over month and progressively stepping through input files
     for n,meantime in enumerate(times):
       # meantime: (complete) month since simulation start
@@ -634,20 +1076,20 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
 
       # extend time array / month counter
       meanidx = i0 + n
-      if meanidx == len(mean.variables[time]): 
+      if checkpoint is not None and meanidx < int(checkpoint['meanidx']): continue # completed before checkpoint
+      if meanidx >= len(meantimes): 
         lskip = False # append next data point / time step
       elif loverwrite or laddnew or lrecalc: 
         lskip = False # overwrite this step or add data point for new variables
-      elif meanidx == len(mean.variables[time])-1:
-        if lrecover or mean.variables[time][meanidx] == -1:
+      elif meanidx == len(meantimes)-1:
+        if lrecover or meantimes[meanidx] == -1:
           lskip = False # recompute last step, because it may be incomplete
         else: lskip = True
       else: 
         lskip = True # skip this step, but we still have to verify the timing
       # check if we are overwriting existing data
-      if meanidx != len(mean.variables[time]):
-        assert meanidx < len(mean.variables[time])
-        assert meantime == mean.variables[time][meanidx] or mean.variables[time][meanidx] == -1
+      if meanidx < len(meantimes):
+        assert meantime == meantimes[meanidx] or meantimes[meanidx] == -1
       # N.B.: writing records is delayed to avoid incomplete records in case of a crash
       # current date
       currentyear, currentmonth = divmod(n+beginmonth-1,12)
@@ -655,31 +1097,50 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       # sanity checks
       assert meanidx + 1 == meantime  
       currentdate = '{0:04d}-{1:02d}'.format(currentyear,currentmonth)
-      # determine appropriate start index
-      wrfstartidx = 0    
-      while currentdate > str().join(wrfout.variables[wrftimestamp][wrfstartidx,0:7]):
-        wrfstartidx += 1 # count forward
-      if wrfstartidx != 0: logger.debug('\n{0:s} {1:s}: Starting month at index {2:d}.'.format(pidstr, currentdate, wrfstartidx))
-      # save WRF time-stamp for beginning of month for the new file, for record
-      starttimestamp = wrfout.variables[wrftimestamp][wrfstartidx,:] # written to file later
-      #logger.debug('\n{0:s}{1:s}-01_00:00:00, {2:s}'.format(pidstr, currentdate, str().join(wrfout.variables[wrftimestamp][wrfstartidx,:])))
-      if '{0:s}-01_00:00:00'.format(currentdate,) == str().join(wrfout.variables[wrftimestamp][wrfstartidx,:]): pass # proper start of the month
-      elif meanidx == 0 and '{0:s}-01_06:00:00'.format(currentdate,) == str().join(wrfout.variables[wrftimestamp][wrfstartidx,:]): pass # for some reanalysis... but only at start of simulation 
-      else: raise DateError, ("{0:s} Did not find first day of month to compute monthly average.".format(pidstr) +
-                              "file: {0:s} date: {1:s}-01_00:00:00".format(filename,currentdate))
-      
-      # prepare summation of output time steps
+      nextmonth = timeaxis.monthStart(currentyear, currentmonth+1) # first day of the next month
       lcomplete = False # 
-      ntime = 0 # accumulated output time steps     
-      # time when accumulation starts (in minutes)        
-      # N.B.: the first value is saved as negative, so that adding the last value yields a positive interval
-      if lxtime: xtime = -1 * wrfout.variables[wrfxtime][wrfstartidx] # minutes
-      monthlytimestamps = [] # list of timestamps, also used for time period calculation  
-      # clear temporary arrays
-      for varname,var in data.iteritems(): # base variables
-        data[varname] = np.zeros(var.shape, dtype=dtype_float) # reset to zero
-      for dename,devar in dedata.iteritems(): # derived variables
-        dedata[dename] = np.zeros(devar.shape, dtype=dtype_float) # reset to zero           
+      
+      if checkpoint is not None:
+        # resume accumulation in the middle of the month from the checkpoint (file was opened above)
+        assert meanidx == int(checkpoint['meanidx']) and filelist[filecounter] == str(checkpoint['filename'])
+        wrfstartidx = int(checkpoint['wrfstartidx']); ntime = int(checkpoint['ntime'])
+        starttimestamp = checkpoint['starttimestamp'] # written to file later
+        if lxtime: xtime = float(checkpoint['xtime']) # minutes
+        monthlytimestamps = checkpoint['monthlytimestamps'].tolist()
+        monthlytimes = [timeaxis.minutes(checkpoint['monthlytimestamps'])]
+        # restore accumulated and temporary arrays
+        for varname in data.keys(): data[varname] = checkpoint['data_'+varname]
+        for dename in dedata.keys(): dedata[dename] = checkpoint['dedata_'+dename]
+        tmpdata = {key[4:]:value if value.ndim > 0 else value[()] for key,value in checkpoint.iteritems() if key[:4] == 'tmp_'}
+        leadmonth = {key[5:]:value for key,value in checkpoint.iteritems() if key[:5] == 'lead_'}
+        if daily is not None: daily.setState({key[4:]:value for key,value in checkpoint.iteritems() if key[:4] == 'day_'})
+        checkpoint = None # only once
+        
+      else:
+        # determine appropriate start index
+        # N.B.: the first time step that is not before the first day of the month
+        wrfstartidx = int(np.searchsorted(wrftimes, timeaxis.monthStart(currentyear, currentmonth), side='left'))
+        if wrfstartidx != 0: logger.debug('\n{0:s} {1:s}: Starting month at index {2:d}.'.format(pidstr, currentdate, wrfstartidx))
+        # save WRF time-stamp for beginning of month for the new file, for record
+        starttimestamp = wrfout.variables[wrftimestamp][wrfstartidx,:] # written to file later
+        #logger.debug('\n{0:s}{1:s}-01_00:00:00, {2:s}'.format(pidstr, currentdate, str().join(wrfout.variables[wrftimestamp][wrfstartidx,:])))
+        if '{0:s}-01_00:00:00'.format(currentdate,) == wrfstamps[wrfstartidx]: pass # proper start of the month
+        elif meanidx == 0 and '{0:s}-01_06:00:00'.format(currentdate,) == wrfstamps[wrfstartidx]: pass # for some reanalysis... but only at start of simulation 
+        else: raise DateError, ("{0:s} Did not find first day of month to compute monthly average.".format(pidstr) +
+                                "file: {0:s} date: {1:s}-01_00:00:00".format(filename,currentdate))
+        
+        # prepare summation of output time steps
+        ntime = 0 # accumulated output time steps     
+        # time when accumulation starts (in minutes)        
+        # N.B.: the first value is saved as negative, so that adding the last value yields a positive interval
+        if lxtime: xtime = -1 * wrfout.variables[wrfxtime][wrfstartidx] # minutes
+        monthlytimestamps = [] # list of timestamps, also used for time period calculation  
+        monthlytimes = [] # decoded timestamps (minutes), for time period calculation
+        # clear temporary arrays
+        # N.B.: accumulators are reset in place; the results of the last month were copied for the writer
+        for var in data.itervalues(): var.fill(0) # base variables
+        for devar in dedata.itervalues(): devar.fill(0) # derived variables           
+        if daily is not None: daily.reset() # days never extend across months
 
       ## loop over files and average
       while not lcomplete:
@@ -687,142 +1148,196 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
         # determine valid end index by checking dates from the end counting backwards
         # N.B.: start index is determined above (if a new file was opened in the same month, 
         #       the start index is automatically set to 0 or 1 when the file is opened, below)
-        wrfendidx = len(wrfout.dimensions[wrftime])-1
-        while wrfendidx >= 0 and currentdate < str().join(wrfout.variables[wrftimestamp][wrfendidx,0:7]):
-          if not lcomplete: lcomplete = True # break loop over file if next month is in this file (critical!)        
-          wrfendidx -= 1 # count backwards
-        #if wrfendidx < len(wrfout.dimensions[wrftime])-1: # check if count-down actually happened 
-        wrfendidx += 1 # reverse last step so that counter sits at first step of next month               
+        # N.B.: the decoded time index is sorted, so we can just search for the first step of next month
+        wrfendidx = int(np.searchsorted(wrftimes, nextmonth, side='left')) # counter sits at first step of next month
+        if wrfendidx < len(wrftimes): lcomplete = True # break loop over file if next month is in this file (critical!)        
         # N.B.: if this is not the last file, there was no iteration and wrfendidx should be the length of the the file;
         #       in this case, wrfendidx is only used to define Python ranges, which are exclusive to the upper boundary;
         #       if the first date in the file is already the next month, wrfendidx will be 0 and this is the final step;
         assert wrfendidx >= wrfstartidx # i.e. wrfendidx = wrfstartidx = 0 is an empty step to finalize accumulation
-        assert lcomplete or wrfendidx == len(wrfout.dimensions[wrftime])
+        assert lcomplete or wrfendidx == len(wrftimes)
         # if this is the last file and the month is not complete, we have to forcefully terminate
         if filecounter == len(filelist)-1 and not lcomplete: 
           lcomplete = True # end loop
           lskip = True # don't write results for this month!
   
         if not lskip:
-          ## compute monthly averages
-          # loop over variables
-          for varname in varlist:
-            logger.debug('{0:s} {1:s}'.format(pidstr,varname))
-            if varname not in wrfout.variables:
-              logger.info("{:s} Variable {:s} missing in file '{:s}' - filling with NaN!".format(pidstr,varname,filelist[filecounter]))
-              data[varname] *= np.NaN # turn everything into NaN, if variable is missing  
-              # N.B.: this can happen, when an output stream was reconfigured between cycle steps
-            else:
-              var = wrfout.variables[varname]
-              tax = var.dimensions.index(wrftime) # index of time axis
-              slices = [slice(None)]*len(var.shape) 
-              # construct informative IOError message
-              ioerror = "An Error occcured in file '{:s}'; variable: '{:s}'\n('{:s}')".format(filelist[filecounter], varname, infolder)                  
-              # decide how to average
-              ## Accumulated Variables
-              if varname in acclist: 
-                if missing_value is not None: 
-                  raise NotImplementedError, "Can't handle accumulated variables with missing values yet."
-                # compute mean as difference between end points; normalize by time difference
-                if ntime == 0: # first time step of the month
-                  slices[tax] = wrfstartidx # relevant time interval
-                  try: tmp = var.__getitem__(slices) # get array
-                  except: raise IOError, ioerror # informative IO Error 
-                  if acclist[varname] is not None: # add bucket level, if applicable
-                    bkt = wrfout.variables[bktpfx+varname]
-                    tmp += bkt.__getitem__(slices) * acclist[varname]
-                  # check that accumulated fields at the beginning of the simulation are zero  
-                  if meanidx == 0 and wrfstartidx == 0:
-                    # note  that if we are skipping the first step, there is no check
-                    if np.max(tmp) != 0 or np.min(tmp) != 0: 
-                      raise ValueError, ( 'Accumulated fields were not initialized with zero!\n' +
-                                          '(this can happen, when the first input file is missing)' ) 
-                  data[varname] = -1 * tmp # so we can do an in-place operation later 
-                # N.B.: both, begin and end, can be in the same file, hence elif is not appropriate! 
-                if lcomplete: # last step
-                  slices[tax] = wrfendidx # relevant time interval
-                  try: tmp = var.__getitem__(slices) # get array
-                  except: raise IOError, ioerror # informative IO Error 
-                  if acclist[varname] is not None: # add bucket level, if applicable 
-                    bkt = wrfout.variables[bktpfx+varname]
-                    tmp += bkt.__getitem__(slices) * acclist[varname]   
-                  data[varname] +=  tmp # the starting data is already negative
-                # if variable is a prerequisit to others, compute instantaneous values
-                if varname in pqset:
-                  # compute mean via sum over all elements; normalize by number of time steps
-                  slices[tax] = slice(wrfstartidx,wrfendidx) # relevant time interval
-                  try: tmp = var.__getitem__(slices) # get array
-                  except: raise IOError, ioerror # informative IO Error 
-                  if acclist[varname] is not None: # add bucket level, if applicable
-                    bkt = wrfout.variables[bktpfx+varname]
-                    tmp = tmp + bkt.__getitem__(slices) * acclist[varname]
-                  pqdata[varname] = dv.ctrDiff(tmp, axis=tax, delta=1) # normalization comes later                   
-              elif varname[0:len(bktpfx)] == bktpfx: pass # do not process buckets
-              ## Normal Variables
-              else: 
-                # skip "empty" steps (only needed to difference accumulated variables)
-                if wrfendidx > wrfstartidx:
-                  # compute mean via sum over all elements; normalize by number of time steps
-                  slices[tax] = slice(wrfstartidx,wrfendidx) # relevant time interval
-                  try: tmp = var.__getitem__(slices) # get array
-                  except: raise IOError, ioerror # informative IO Error 
-                  if missing_value is not None:
-                    # N.B.: missing value handling is really only necessary when missing values are time-dependent
-                    tmp = np.where(tmp == missing_value, np.NaN, tmp) # set missing values to NaN
-                    #tmp = ma.masked_equal(tmp, missing_value, copy=False) # mask missing values
-                  data[varname] = data[varname] + tmp.sum(axis=tax) # add to sum
-                  # N.B.: in-place operations with non-masked array destroy the mask, hence need to use this
-                  # keep data in memory if used in computation of derived variables
-                  if varname in pqset: pqdata[varname] = tmp
-          ## compute derived variables
-          # but first generate a list of timestamps
+          ## generate a list of timestamps and compute the output interval (same for all bands)
           if lcomplete: tmpendidx = wrfendidx
           else: tmpendidx = wrfendidx -1 # end of file
           # assemble list of time stamps                        
-          currenttimestamps = [] # relevant timestamps in this file            
-          for i in xrange(wrfstartidx,tmpendidx+1):
-            timestamp = str().join(wrfout.variables[wrftimestamp][i,:])  
-            currenttimestamps.append(timestamp)
+          currenttimestamps = wrfstamps[wrfstartidx:tmpendidx+1].tolist() # relevant timestamps in this file            
+          currenttimes = wrftimes[wrfstartidx:tmpendidx+1] # same, but decoded
           monthlytimestamps.extend(currenttimestamps) # add to monthly collection
-          # normalize accumulated pqdata with output interval time
+          monthlytimes.append(currenttimes)
+          # time steps of days in this slab (and first time steps of days for accumulated variables)
+          if daily is not None:
+            daymarks = daily.beginSlab(wrftimes[wrfstartidx:wrfendidx], wrfout.variables[wrftimestamp][wrfstartidx:wrfendidx,:], 
+                                       nexttime=wrftimes[wrfendidx] if lcomplete else None)
           if wrfendidx > wrfstartidx:
             assert tmpendidx > wrfstartidx, 'There should never be a single value in a file: wrfstartidx={:d}, wrfendidx={:d}, lcomplete={:s}'.format(wrfstartidx,wrfendidx,str(lcomplete))
             # compute time delta
-            delta = dv.calcTimeDelta(currenttimestamps)
+            delta = dv.calcTimeDelta(currenttimes, timeaxis=timeaxis)
             if lxtime:
               xdelta = wrfout.variables[wrfxtime][tmpendidx] - wrfout.variables[wrfxtime][wrfstartidx]
               xdelta *=  60. # convert minutes to seconds
               if delta != xdelta: raise ValueError, "Time calculation from time stamps and model time are inconsistent: {:f} != {:f}".format(delta,xdelta)                 
             delta /=  float(tmpendidx - wrfstartidx) # the average interval between output time steps
-            # loop over time-step data
-            for pqname,pqvar in pqdata.iteritems():
-              if pqname in acclist: pqvar /= delta # normalize
-            # loop over derived variables
-            # special treatment for certain string variables
-            if 'Times' in pqset: pqdata['Times'] = currenttimestamps[:wrfendidx-wrfstartidx] # need same length as actual time dimension 
-            logger.debug('\n{0:s} Available prerequisites: {1:s}'.format(pidstr, str(pqdata.keys())))
-            for dename,devar in derived_vars.iteritems():
-              if not devar.linear: # only non-linear ones here, linear one at the end
-                logger.debug('\n{0:s} {1:s} {2:s}'.format(pidstr, dename, str(devar.prerequisites)))
-                tmp = devar.computeValues(pqdata, aggax=tax, delta=delta, const=const, tmp=tmpdata) # possibly needed as pre-requisite  
-                dedata[dename] = devar.aggregateValues(tmp, aggdata=dedata[dename], aggax=tax)
-                # N.B.: in-place operations with non-masked array destroy the mask, hence need to use this
-                if dename in pqset: pqdata[dename] = tmp
-                # N.B.: missing values should be handled implicitly, following missing values in pre-requisites            
-                del tmp # memory hygiene
+          ## loop over south_north bands (just one band, i.e. the entire domain, unless PYAVG_MEMLIMIT requires tiling)
+          for iband,band in enumerate(bands):
+            bandtmp = tmpdata if band is None else BandStorage(tmpdata, iband) # temporary storage of this band
+            ## compute monthly averages
+            # loop over variables
+            for varname in varlist:
+              logger.debug('{0:s} {1:s}'.format(pidstr,varname))
+              if varname not in wrfout.variables:
+                logger.info("{:s} Variable {:s} missing in file '{:s}' - filling with NaN!".format(pidstr,varname,filelist[filecounter]))
+                if iband == 0: data[varname] *= np.NaN # turn everything into NaN, if variable is missing  
+                # N.B.: this can happen, when an output stream was reconfigured between cycle steps
+              else:
+                var = wrfout.variables[varname]
+                tax = var.dimensions.index(wrftime) # index of time axis
+                yax = var.dimensions.index(wrfyax) if wrfyax in var.dimensions else None # index of south_north axis
+                # N.B.: variables without south_north axis are read entirely for every band, but only accumulated once
+                if yax is None and iband > 0 and varname not in pqset: continue
+                idx = bandIndex(data[varname], None if yax is None else yax-1, band) # band in accumulator (no time axis)
+                slices = [slice(None)]*len(var.shape) 
+                # construct informative IOError message
+                ioerror = "An Error occcured in file '{:s}'; variable: '{:s}'\n('{:s}')".format(filelist[filecounter], varname, infolder)                  
+                # decide how to average
+                ## Accumulated Variables
+                if varname in acclist: 
+                  if missing_value is not None: 
+                    raise NotImplementedError, "Can't handle accumulated variables with missing values yet."
+                  # compute mean as difference between end points; normalize by time difference
+                  if ntime == 0 and ( yax is not None or iband == 0 ): # first time step of the month
+                    slices[tax] = wrfstartidx # relevant time interval
+                    try: tmp = readBand(var, slices, band) # get array
+                    except: raise IOError, ioerror # informative IO Error 
+                    if acclist[varname] is not None: # add bucket level, if applicable
+                      bkt = wrfout.variables[bktpfx+varname]
+                      tmp += readBand(bkt, slices, band) * acclist[varname]
+                    # check that accumulated fields at the beginning of the simulation are zero  
+                    if meanidx == 0 and wrfstartidx == 0 and lsimstart:
+                      # note  that if we are skipping the first step, there is no check
+                      if np.max(tmp) != 0 or np.min(tmp) != 0: 
+                        raise ValueError, ( 'Accumulated fields were not initialized with zero!\n' +
+                                            '(this can happen, when the first input file is missing)' ) 
+                    # N.B.: store the negative, so we can do an in-place operation later 
+                    np.multiply(cropBand(tmp, None if yax is None else yax-1, band), -1, out=data[varname][idx])
+                  # N.B.: both, begin and end, can be in the same file, hence elif is not appropriate! 
+                  if lcomplete and ( yax is not None or iband == 0 ): # last step
+                    slices[tax] = wrfendidx # relevant time interval
+                    try: tmp = readBand(var, slices, band) # get array
+                    except: raise IOError, ioerror # informative IO Error 
+                    if acclist[varname] is not None: # add bucket level, if applicable 
+                      bkt = wrfout.variables[bktpfx+varname]
+                      tmp += readBand(bkt, slices, band) * acclist[varname]   
+                    data[varname][idx] += cropBand(tmp, None if yax is None else yax-1, band) # the starting data is already negative
+                  # daily means are differences between the first time steps of days
+                  if daily is not None and daymarks and ( yax is not None or iband == 0 ):
+                    slices[tax] = [wrfstartidx+i for i in daymarks] # first time steps of days
+                    try: tmp = readBand(var, slices, band) # get array
+                    except: raise IOError, ioerror # informative IO Error 
+                    if acclist[varname] is not None: # add bucket level, if applicable 
+                      bkt = wrfout.variables[bktpfx+varname]
+                      tmp += readBand(bkt, slices, band) * acclist[varname]   
+                    daily.addSlab(varname, cropBand(tmp, yax, band), axis=tax, idx=idx)
+                  # if variable is a prerequisit to others, compute instantaneous values
+                  if varname in pqset:
+                    # compute mean via sum over all elements; normalize by number of time steps
+                    slices[tax] = slice(wrfstartidx,wrfendidx) # relevant time interval
+                    try: tmp = readBand(var, slices, band) # get array
+                    except: raise IOError, ioerror # informative IO Error 
+                    if acclist[varname] is not None: # add bucket level, if applicable
+                      bkt = wrfout.variables[bktpfx+varname]
+                      tmp = tmp + readBand(bkt, slices, band) * acclist[varname]
+                    pqdata[varname] = centredDiff(tmp, axis=tax, delta=1) # normalization comes later                   
+                elif varname[0:len(bktpfx)] == bktpfx: pass # do not process buckets
+                ## Normal Variables
+                else: 
+                  # skip "empty" steps (only needed to difference accumulated variables)
+                  if wrfendidx > wrfstartidx:
+                    # compute mean via sum over all elements; normalize by number of time steps
+                    slices[tax] = slice(wrfstartidx,wrfendidx) # relevant time interval
+                    # N.B.: prerequisites are modified later, so they need a copy; other variables are only summed
+                    try: tmp = readBand(var, slices, band, lcopy=varname in pqset) # get array
+                    except: raise IOError, ioerror # informative IO Error 
+                    lmissing = missing_value is not None # missing value handling during reduction
+                    if lmissing and varname in pqset:
+                      # N.B.: missing value handling is really only necessary when missing values are time-dependent
+                      tmp = np.where(tmp == missing_value, np.NaN, tmp) # set missing values to NaN
+                      lmissing = False # already NaN
+                      #tmp = ma.masked_equal(tmp, missing_value, copy=False) # mask missing values
+                    # add to sum (in place, using reusable buffers; missing values are masked during the reduction)
+                    if band is None or yax is not None or iband == 0:
+                      buffers.addSum(data[varname][idx], cropBand(tmp, yax, band), axis=tax, 
+                                     missing_value=missing_value if lmissing else None)
+                      # sums of the time steps of every day
+                      if daily is not None: daily.addSlab(varname, cropBand(tmp, yax, band), axis=tax, idx=idx, 
+                                                          missing_value=missing_value if lmissing else None)
+                    # keep data in memory if used in computation of derived variables
+                    if varname in pqset: pqdata[varname] = tmp
+            ## compute derived variables
+            # normalize accumulated pqdata with output interval time
+            if wrfendidx > wrfstartidx:
+              # loop over time-step data
+              for pqname,pqvar in pqdata.iteritems():
+                if pqname in acclist: pqvar /= delta # normalize
+              # loop over derived variables
+              # special treatment for certain string variables
+              if 'Times' in pqset: pqdata['Times'] = currenttimestamps[:wrfendidx-wrfstartidx] # need same length as actual time dimension 
+              logger.debug('\n{0:s} Available prerequisites: {1:s}'.format(pidstr, str(pqdata.keys())))
+              if lnclock: nclock.release(); lnclock = False # let the writer access the library during computation
+              # execute plan: single derived variables, groups of fused expressions or batches of consecutive extrema 
+              # (only non-linear ones here)
+              for istep,(group,names) in enumerate(plan.steps):
+                logger.debug('\n{0:s} {1:s} {2:s}'.format(pidstr, ', '.join(names), str(plan.inputs[istep])))
+                if group is None: 
+                  devar = derived_vars[names[0]] # possibly needed as pre-requisite
+                  results = OrderedDict([(names[0],devar.computeValues(pqdata, aggax=tax, delta=delta, const=bandconst[iband], tmp=bandtmp))])
+                else: results = group.computeValues(pqdata, aggax=tax, delta=delta, const=bandconst[iband], tmp=bandtmp)
+                while results:
+                  dename, tmp = results.popitem(last=False); devar = derived_vars[dename]
+                  ldayvar = daily is not None and dename in daily.variables # values of every time step for daily means
+                  if band is None: 
+                    dedata[dename] = devar.aggregateValues(tmp, aggdata=dedata[dename], aggax=tax)
+                    if ldayvar: daily.addSlab(dename, tmp, axis=tax)
+                  else:
+                    # N.B.: the south_north axis of the result depends on whether the time axis was already aggregated
+                    yax = devar.axes.index(wrfyax) - len(devar.axes) + tmp.ndim
+                    idx = bandIndex(dedata[dename], devar.axes.index(wrfyax)-1, band)
+                    dedata[dename] = setBand(dedata[dename], idx, devar.aggregateValues(cropBand(tmp, yax, band), 
+                                                                        aggdata=dedata[dename][idx], aggax=tax))
+                    if ldayvar: daily.addSlab(dename, cropBand(tmp, yax, band), axis=tax, idx=idx)
+                  # N.B.: in-place operations with non-masked array destroy the mask, hence need to use this
+                  if dename in pqset: pqdata[dename] = tmp
+                  # N.B.: missing values should be handled implicitly, following missing values in pre-requisites            
+                  del tmp # memory hygiene
+                # release prerequisites that are not needed anymore (and cached intermediates that depend on them)
+                for pqname in plan.release[istep]: 
+                  if pqdata.get(pqname) is not None: dv.slabcache.discard(pqdata[pqname])
+                  pqdata[pqname] = None
+              dv.slabcache.clear() # intermediates are only valid for this slab
+              if linput: nclock.acquire(); lnclock = True
             
+          # add the slab to the current day and write completed days
+          if daily is not None:
+            if lnclock: nclock.release(); lnclock = False # the writer needs the NetCDF library (otherwise we could deadlock)
+            daily.endSlab()
+            if lcomplete: daily.flush() # the last day of the month
+            if linput: nclock.acquire(); lnclock = True
           # increment counters
           ntime += wrfendidx - wrfstartidx
           if lcomplete: 
             # N.B.: now wrfendidx should be a valid time step
             # check time steps for this month
-            laststamp = monthlytimestamps[0]
-            for timestamp in monthlytimestamps[1:]:
-              if laststamp >= timestamp: 
-                raise DateError, 'Timestamps not in order, or repetition: {:s}'.format(timestamp) 
-              laststamp = timestamp
+            monthlytimes = np.concatenate(monthlytimes)
+            lorder = np.diff(monthlytimes) > 0
+            if not np.all(lorder): 
+              raise DateError, 'Timestamps not in order, or repetition: {:s}'.format(monthlytimestamps[np.argmin(lorder)+1]) 
             # calculate time period and check against model time (if available)
-            timeperiod = dv.calcTimeDelta(monthlytimestamps)
+            timeperiod = dv.calcTimeDelta(monthlytimes, timeaxis=timeaxis)
             if lxtime:
               xtime += wrfout.variables[wrfxtime][wrfendidx] # get final time interval (in minutes)
               xtime *=  60. # convert minutes to seconds   
@@ -832,33 +1347,31 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
         # if we reached the end of the file, open a new one and go again
         if not lcomplete:            
           # N.B.: here wrfendidx is not a valid time step, but the length of the file, i.e. wrfendidx-1 is the last valid time step
-          lasttimestamp = str().join(wrfout.variables[wrftimestamp][wrfendidx-1,:]) # needed to determine, if first timestep is the same as last
+          lasttimestamp = wrfstamps[wrfendidx-1]; lasttime = wrftimes[wrfendidx-1] # needed to determine, if first timestep is the same as last
           assert lskip or lasttimestamp == monthlytimestamps[-1]
           # lasttimestep is also used for leap-year detection later on
-          assert len(wrfout.dimensions[wrftime]) == wrfendidx, (len(wrfout.dimensions[wrftime]),wrfendidx) # wrfendidx should be the length of the file, not the last index!
+          assert len(wrftimes) == wrfendidx, (len(wrftimes),wrfendidx) # wrfendidx should be the length of the file, not the last index!
           ## find first timestep (compare to last of previous file) and (re-)set time step counter
           # initialize search
-          tmptimestamp = lasttimestamp; filelen1 = len(wrfout.dimensions[wrftime]) - 1; wrfstartidx = filelen1;
-          while tmptimestamp <= lasttimestamp:
-            if wrfstartidx < filelen1:
-              wrfstartidx += 1 # step forward in current file
-            else:
-              # open next file, if we reach the end
-              wrfout.close() # close file
-              #del wrfout; gc.collect() # doesn't seem to work here - strange error
-              # N.B.: filecounter +1 < len(filelist) is already checked above 
-              filecounter += 1 # move to next file
-              if filecounter < len(filelist):    
-                logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
-                wrfout = nc.Dataset(infolder+filelist[filecounter], 'r', format='NETCDF4') # ... and open new one
-                filelen1 = len(wrfout.dimensions[wrftime]) - 1 # length of new file
-                wrfstartidx = 0 # reset index
-                # check consistency of missing value flag
-                assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
-              else: break # this is not really tested...
-            tmptimestamp = str().join(wrfout.variables[wrftimestamp][wrfstartidx,:])
+          # N.B.: the last time step is always at the end of the current file, so we start with the next file
+          while True:
+            # open next file
+            wrfout.close() # close file
+            #del wrfout; gc.collect() # doesn't seem to work here - strange error
+            # N.B.: filecounter +1 < len(filelist) is already checked above 
+            filecounter += 1 # move to next file
+            if filecounter < len(filelist):    
+              logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
+              wrfout = openInput(filecounter) # ... and open new one
+              wrfstamps, wrftimes = indexTimes(wrfout) # decode time index of new file
+              # check consistency of missing value flag
+              assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
+              # first time step after the last one that was processed
+              wrfstartidx = int(np.searchsorted(wrftimes, lasttime, side='right'))
+              if wrfstartidx < len(wrftimes): break # found it; otherwise the entire file was already processed
+            else: break # this is not really tested...
           # some checks
-          firsttimestamp = str().join(wrfout.variables[wrftimestamp][0,:])
+          firsttimestamp = wrfstamps[0]
           error_string = "Inconsistent time-stamps between files:\n lasttimestamp='{:s}', firsttimestamp='{:s}', wrfstartidx={:d}"
           if firsttimestamp == lasttimestamp: # skip the initialization step (was already processed in last step)
             if wrfstartidx != 1: raise DateError, error_string.format(lasttimestamp, firsttimestamp, wrfstartidx)
@@ -867,6 +1380,22 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           if firsttimestamp < lasttimestamp: # files overlap: count up to next timestamp in sequence
             #if wrfstartidx == 2: warn(error_string.format(lasttimestamp, firsttimestamp, wrfstartidx))
             if wrfstartidx == 0: raise DateError, error_string.format(lasttimestamp, firsttimestamp, wrfstartidx)
+          # save accumulator state and file cursor periodically, so that we can resume here (PYAVG_RECOVER)
+          if ckinterval > 0 and not lskip and filecounter < len(filelist) and clock() - cktime >= ckinterval:
+            ckstate = dict(meanidx=meanidx, filename=filelist[filecounter], wrfstartidx=wrfstartidx, ntime=ntime, 
+                           xtime=xtime if lxtime else np.NaN, starttimestamp=starttimestamp, 
+                           monthlytimestamps=np.array(monthlytimestamps))
+            for varname,var in data.iteritems(): ckstate['data_'+varname] = var
+            for dename,devar in dedata.iteritems(): ckstate['dedata_'+dename] = devar
+            for key,value in tmpdata.iteritems(): ckstate['tmp_'+key] = value
+            for key,value in leadmonth.iteritems(): ckstate['lead_'+key] = value
+            if daily is not None:
+              for key,value in daily.getState().iteritems(): ckstate['day_'+key] = value
+            # N.B.: write to temporary file first, so that a crash does not destroy the last checkpoint
+            with open(cktmpfile, 'wb') as ckf: np.savez(ckf, **ckstate)
+            os.rename(cktmpfile, ckfile)
+            logger.debug("\n{0:s} Saved checkpoint '{1:s}'.\n".format(pidstr,ckfile))
+            del ckstate; cktime = clock()
         else: # month complete
           # print feedback (the current month) to indicate completion
           if lparallel: progressstr += '{0:s}, '.format(currentdate) # bundle output in parallel mode
@@ -875,34 +1404,39 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           if lcarryover:
             for devar in derived_vars.values():
               if not (devar.tmpdata is None or devar.carryover):
-                if devar.tmpdata in tmpdata: del tmpdata[devar.tmpdata]
+                for key in tmpdata.keys(): # also the states of bands
+                  if key == devar.tmpdata or key.startswith(devar.tmpdata+'@'): del tmpdata[key]
           else: tmpdata = dict() # reset entire temporary storage
+          # record the month in which the lead ended (chunked mode)
+          for devar in leadvars:
+            lend = devar.leadComplete(tmpdata)
+            if lend is not None:
+              month = leadmonth.get(devar.name, np.zeros(np.shape(lend), dtype='int16') - 1)
+              leadmonth[devar.name] = np.where(np.logical_and(lend, month < 0), meanidx, month).astype('int16')
           # N.B.: now wrfendidx is a valid timestep, but indicates the first of the next month
-          lasttimestamp = str().join(wrfout.variables[wrftimestamp][wrfendidx,:]) # this should be the first timestep of the next month
+          lasttimestamp = wrfstamps[wrfendidx]; lasttime = wrftimes[wrfendidx] # this should be the first timestep of the next month
           assert lskip or lasttimestamp == monthlytimestamps[-1]                
           # open next file (if end of month and file coincide)
-          if wrfendidx == len(wrfout.dimensions[wrftime])-1: # reach end of file
+          if wrfendidx == len(wrftimes)-1: # reach end of file
             ## find first timestep (compare to last of previous file) and (re-)set time step counter
             # initialize search
-            tmptimestamp = lasttimestamp; filelen1 = len(wrfout.dimensions[wrftime]) - 1; wrfstartidx = filelen1;
-            while tmptimestamp <= lasttimestamp:
-              if wrfstartidx < filelen1:
-                wrfstartidx += 1 # step forward in current file
-              else:
-                # open next file, if we reach the end
-                wrfout.close() # close file
-                #del wrfout; gc.collect() # doesn't seem to work here - strange error
-                # N.B.: filecounter +1 < len(filelist) is already checked above 
-                filecounter += 1 # move to next file
-                if filecounter < len(filelist):    
-                  logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
-                  wrfout = nc.Dataset(infolder+filelist[filecounter], 'r', format='NETCDF4') # ... and open new one
-                  filelen1 = len(wrfout.dimensions[wrftime]) - 1 # length of new file
-                  wrfstartidx = 0 # reset index
-                  # check consistency of missing value flag
-                  assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
-                else: break # this is not really tested...
-              tmptimestamp = str().join(wrfout.variables[wrftimestamp][wrfstartidx,:])
+            # N.B.: the last time step is always at the end of the current file, so we start with the next file
+            while True:
+              # open next file
+              wrfout.close() # close file
+              #del wrfout; gc.collect() # doesn't seem to work here - strange error
+              # N.B.: filecounter +1 < len(filelist) is already checked above 
+              filecounter += 1 # move to next file
+              if filecounter < len(filelist):    
+                logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
+                wrfout = openInput(filecounter) # ... and open new one
+                wrfstamps, wrftimes = indexTimes(wrfout) # decode time index of new file
+                # check consistency of missing value flag
+                assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
+                # first time step after the last one that was processed
+                wrfstartidx = int(np.searchsorted(wrftimes, lasttime, side='right'))
+                if wrfstartidx < len(wrftimes): break # found it; otherwise the entire file was already processed
+              else: break # this is not really tested...
             # N.B.: same code as in "not complete" section
 #             wrfout.close() # close file
 #             #del wrfout; gc.collect() # doesn't seem to work here - strange error
@@ -919,61 +1453,57 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       ## now the the loop over files has terminated and we need to normalize and save the results
       
       if not lskip:
-        # extend time axis
-        mean.variables[time][meanidx] = -1 # mark timestep in progress
-        ncvar = None; vardata = None # dummies, to prevent crash later on, if varlist is empty 
+        # release the NetCDF library, so that the writer can proceed (otherwise we could deadlock below)
+        if lnclock: nclock.release(); lnclock = False
+        record = [] # list of variable names and data for the writer
+        siderecords = {stream:[] for stream in sidevars.iterkeys()} # records of separate files
+        results = dict() # monthly averages (new arrays, because the accumulators are reused)
+        vardata = None # dummy, to prevent crash later on, if varlist is empty 
         # loop over variable names
         for varname in varlist:
-          vardata = data[varname]
           # decide how to normalize
-          if varname in acclist: vardata /= timeperiod
-          else: vardata /= ntime
-          # save variable
-          ncvar = mean.variables[varname] # this time the destination variable
-          if missing_value is not None: # make sure the missing value flag is preserved
-            vardata = np.where(np.isnan(vardata), missing_value, vardata)
-            ncvar.missing_value = missing_value # just to make sure
-          if ncvar.ndim > 1: ncvar[meanidx,:] = vardata # here time is always the outermost index
-          else: ncvar[meanidx] = vardata
+          if varname in acclist: vardata = data[varname] / timeperiod
+          else: vardata = data[varname] / ntime
+          results[varname] = vardata
+          record.append( (varname,vardata) ) # save variable
         # compute derived variables
         logger.debug('\n{0:s}   Derived Variable Stats: (mean/min/max)'.format(pidstr))
         for dename,devar in derived_vars.iteritems():
           if devar.linear:           
-            vardata = devar.computeValues(data) # compute derived variable now from averages
+            vardata = devar.computeValues(results) # compute derived variable now from averages
           elif devar.normalize: 
             vardata = dedata[dename] / ntime # no accumulated variables here!
-          else: vardata = dedata[dename] # just the data...
+          else: vardata = dedata[dename].copy() # just the data... (copy, because the accumulator is reused)
           # not all variables are normalized (e.g. extrema)
           if ldebug:
-            if len(np.__version__) != 5: 
-              raise NotImplementedError, "Numpy version string too long or short ('{:s}'); require np.__version__ >= '1.8.0'".format(np.__version__)
-            elif len(np.__version__) == 5 and np.__version__ >= '1.8.0':
+            # N.B.: comparing version strings fails for numpy >= 1.10, but nanmean was added in 1.8.0
+            if hasattr(np, 'nanmean'):
               mmm = (float(np.nanmean(vardata)),float(np.nanmin(vardata)),float(np.nanmax(vardata)),)
             else:
               mmm = (float(np.mean(vardata)),float(np.min(vardata)),float(np.max(vardata)),)
             logger.debug('{0:s} {1:s}, {2:f}, {3:f}, {4:f}'.format(pidstr,dename,*mmm))
-          data[dename] = vardata # add to data array, so that it can be used to compute linear variables
-          # save variable
-          ncvar = mean.variables[dename] # this time the destination variable
-          if missing_value is not None: # make sure the missing value flag is preserved
-            vardata = np.where(np.isnan(vardata), missing_value, vardata)
-            ncvar.missing_value = missing_value # just to make sure
-          if ncvar.ndim > 1: ncvar[meanidx,:] = vardata # here time is always the outermost index
-          else: ncvar[meanidx] = vardata            
+          results[dename] = vardata # add to results, so that it can be used to compute linear variables
+          if dename in sidestream: siderecords[sidestream[dename]].append( (dename,vardata) ) # separate file
+          else: record.append( (dename,vardata) ) # save variable
           #raise dv.DerivedVariableError, "%s Derived variable '%s' is not linear."%(pidstr,devar.name) 
-        # update current end date        
-        mean.end_date = starttimestamp[:10] # the date of the first day of the last included month
-        mean.variables[wrftimestamp][meanidx,:] = starttimestamp 
-        mean.variables[time][meanidx] = meantime # update time axis (last action)
-        # sync data and clear memory
-        mean.sync(); mean.close() # sync and close dataset
-        del mean, ncvar, vardata # remove all other references to data
-        gc.collect() # clean up memory
-        # N.B.: the netCDF4 module keeps all data written to a netcdf file in memory; there is no flush command
-        mean = nc.Dataset(tmpmeanfile, mode='a', format='NETCDF4') # re-open to append more data (mode='a')
-        # N.B.: flushing the mean file here prevents repeated close/re-open when no data was written (i.e. 
-        #       the month was skiped); only flush memory when data was actually written. 
+        # time-stamp of the first day of the month (also the current end date)
+        record.append( (wrftimestamp,starttimestamp) )
+        # hand over to writer thread; it marks the record in progress (time=-1) and updates the time axis last
+        writer.put(meanidx, meantime, record, atts=dict(end_date=starttimestamp[:10]))
+        for stream,siderecord in siderecords.iteritems():
+          siderecord.append( (wrftimestamp,starttimestamp) )
+          sidewriters[stream].put(meanidx, meantime, siderecord, atts=dict(end_date=starttimestamp[:10]))
+        nwritten += 1
+        # N.B.: the results are new arrays (the accumulators are reset in place), so the writer can use them;
+        #       the output file remains open and is synced periodically by the writer (see PYAVG_SYNC)
+        del record, siderecords, results, vardata
+        if linput: nclock.acquire(); lnclock = True
         
+    # write pending records and sync
+    if lnclock: nclock.release(); lnclock = False
+    writer.close() # reraises errors from the writer thread
+    if daywriter is not None: daywriter.close()
+    for sidewriter in sidewriters.itervalues(): sidewriter.close()
     ec = 0 # set zero exit code for this operation
         
   except Exception:
@@ -981,10 +1511,16 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
     logger.exception('\n # {0:s} WARNING: an Error occured while stepping through files! '.format(pidstr)+
                      '\n # Last State: month={0:d}, variable={1:s}, file={2:s}'.format(meanidx,varname,filelist[filecounter])+
                      '\n # Saving current data and exiting\n')
+    if lnclock: nclock.release() # otherwise the next job in this process would deadlock
     wrfout.close()
+    if writer is not None: writer.close(lraise=False) # write pending records
+    if daywriter is not None: daywriter.close(lraise=False)
+    for sidewriter in sidewriters.itervalues(): sidewriter.close(lraise=False)
     #logger.exception(pidstr) # print stack trace of last exception and current process ID
     ec = 1 # set non-zero exit code
     # N.B.: this enables us to still close the file!
+  # stop background reader
+  if prefetcher is not None: prefetcher.close()
     
   ## here the loop over months finishes and we can close the output file 
   # print progress
@@ -992,18 +1528,233 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   # save to file
   if not lparallel: logger.info('') # terminate the line (of dates) 
   else: logger.info('\n{0:s} Processed dates: {1:s}'.format(pidstr, progressstr))   
+  if dv.slabcache.misses: 
+    logger.info('{0:s} Shared intermediates of derived variables (cache hits/misses):\n{1:s}'.format(pidstr, dv.slabcache.report()))
+  # record processing time per month, which is used to schedule jobs in the next run
+  if ec == 0 and nwritten > 0: mean.setncattr(timingatt, (clock()-tstart)/nwritten)
   mean.sync()
   logger.info("\n{0:s} Writing output to: {1:s}\n('{2:s}')\n".format(pidstr, filename, meanfile))
   # close files        
   mean.close()  
   # rename file to proper name
   os.rename(tmpmeanfile,meanfile)    
+  if daily is not None:
+    logger.info("{0:s} Writing daily means to: {1:s}\n('{2:s}')\n".format(pidstr, dayname, dayfile))
+    dayset.close(); os.rename(tmpdayfile,dayfile)
+  for stream,sideset in sidesets.iteritems():
+    sidefile, tmpsidefile = sidefiles[stream]
+    logger.info("{0:s} Writing monthly {1:s} records to: {2:s}\n('{3:s}')\n".format(pidstr, stream, os.path.basename(sidefile), sidefile))
+    sideset.close(); os.rename(tmpsidefile,sidefile)
+  # the checkpoint is no longer needed 
+  if ec == 0 and os.path.exists(ckfile): os.remove(ckfile)
+  # save carry-over state at the end of the chunk, which is needed to merge chunks
+  if chunk is not None and ec == 0:
+    carryover = dict()
+    for devar in leadvars:
+      state = devar.boundaryState(tmpdata, month=leadmonth.get(devar.name))
+      if state is not None:
+        # N.B.: the separator can not be part of a variable name (avoids collisions of prefixes)
+        carryover[devar.name+':kind'] = devar.__class__.__name__ # class that joins the states
+        for key,value in state.iteritems(): carryover[devar.name+':'+key] = value
+    np.savez(outfolder+carrypattern.format(filetype,ndom,ichunk), **carryover)
+  # aggregate seasonal and annual means from the monthly means (in chunked mode, after the chunks are merged)
+  if chunk is None and ec == 0: ec = writePeriodStreams(filetype, ndom, tmppfx=tmppfx, pidstr=pidstr, logger=logger)
   # clean up memory
   del mean, data  
   # return exit code
   return ec
 
 
+def writePeriodStreams(filetype, ndom, tmppfx='tmp_wrfavg_', pidstr='', logger=None):
+  ''' Aggregate the seasonal and/or annual means that were selected with PYAVG_STREAMS from the monthly means 
+      (only complete periods are written and existing files are replaced) and update the climatologies that were
+      selected with PYAVG_CLIM with new months. Returns an exit code. '''
+  meanfile = outfolder+outputpattern.format(filetype,ndom)
+  linear = [devar for devar in derived_variables[filetype] if devar.linear] # recomputed from aggregated means
+  try:
+    for period in streams:
+      if period not in period_months: continue # daily and monthly means are computed in processFileList
+      filename = streampattern.format(filetype,ndom,period)
+      nrec = aggregatePeriods(meanfile, outfolder+filename, outfolder+tmppfx+filename, period, calendar=calendar, 
+                              linear=linear)
+      logger.info("{0:s} Writing {1:d} {2:s} means to: {3:s}\n('{4:s}')\n".format(pidstr, nrec, period, filename, 
+                                                                              outfolder+filename))
+    for period in climperiods:
+      # N.B.: if existing months were recomputed, the running sums have to be recomputed as well
+      filename = climpattern.format(filetype,ndom,period); statename = climstatepattern.format(filetype,ndom,period)
+      nrec = updateClimatology(meanfile, outfolder+filename, outfolder+tmppfx+filename, outfolder+statename, 
+                               outfolder+tmppfx+statename, period, lstd=lclimstd, lreset=( loverwrite or lrecalc ))
+      logger.info("{0:s} Writing climatology of {1:d} months to: {2:s}\n('{3:s}')\n".format(pidstr, nrec, filename, 
+                                                                                   outfolder+filename))
+    ec = 0 # set zero exit code for this operation
+  except Exception:
+    logger.exception('\n # {0:s} WARNING: an Error occured while aggregating {1:s} means! '.format(pidstr,period)+
+                     '\n # The monthly means are not affected.\n')
+    ec = 1 # set non-zero exit code
+  return ec
+
+
+## merge partial files from chunked processing
+def loadBoundaries(carryfile):
+  ''' Load the boundary states of derived variables from a carry-over file; returns a dictionary of the class 
+      that joins the states (see DerivedVariable.joinBoundary) and the states for every variable. '''
+  carry = np.load(carryfile); boundaries = dict()
+  for key in carry.files:
+    varname, field = key.rsplit(':',1)
+    boundaries.setdefault(varname, dict())[field] = carry[key]
+  return {varname:(getattr(dv,str(state.pop('kind'))),state) for varname,state in boundaries.iteritems()}
+
+def mergeChunks(filetype, ndom, nchunk, lparallel=False, pidstr='', logger=None, ldebug=False):
+  ''' Merge the partial monthly files produced by chunked processFileList calls in time order, and join the 
+      states of derived variables that extend across chunk boundaries; supposed to be run in parallel. '''
+  filename = outputpattern.format(filetype,ndom)
+  if lparallel: tmppfx = 'tmp_wrfavg_{:s}_'.format(pidstr[1:-1])
+  else: tmppfx = 'tmp_wrfavg_'.format(pidstr[1:-1])
+  meanfile = outfolder+filename
+  tmpmeanfile = outfolder+tmppfx+filename
+  partials = [outfolder+partialpattern.format(filetype,ndom,ichunk) for ichunk in xrange(nchunk)]
+  carryfiles = [outfolder+carrypattern.format(filetype,ndom,ichunk) for ichunk in xrange(nchunk)]
+  # daily means (PYAVG_STREAMS) are also merged
+  dayparts = [outfolder+partialdailypattern.format(filetype,ndom,ichunk) for ichunk in xrange(nchunk)] if 'daily' in streams else []
+  # separate files of monthly records (e.g. histograms), if this file type has any
+  sideparts = OrderedDict()
+  for stream in monthly_streams:
+    parts = [outfolder+partialstreampattern.format(filetype,ndom,ichunk,stream) for ichunk in xrange(nchunk)]
+    if stream in streams and os.path.exists(parts[0]): sideparts[stream] = parts
+  
+  try:
+    
+    # check that all chunks have been completed
+    for partial,carryfile in zip(partials,carryfiles):
+      if not os.path.exists(partial) or not os.path.exists(carryfile):
+        raise IOError, "Chunk '{:s}' was not completed - can not merge partial files.".format(partial)
+    for daypart in dayparts:
+      if not os.path.exists(daypart): raise IOError, "Daily means '{:s}' are missing - can not merge partial files.".format(daypart)
+    for sidepart in sum(sideparts.values(), []):
+      if not os.path.exists(sidepart): raise IOError, "Partial file '{:s}' is missing - can not merge partial files.".format(sidepart)
+    logger.info("\n{0:s} Merging {1:d} partial files for wrf{2:s} domain {3:d}.".format(pidstr,nchunk,filetype,ndom))
+    # the first chunk serves as template
+    shutil.copy(partials[0],tmpmeanfile)
+    mean = nc.Dataset(tmpmeanfile, mode='a', format='NETCDF4')
+    varlist = [varname for varname,var in mean.variables.iteritems() if var.dimensions[0] == time and varname != time]
+    # states at the end of the previous chunk
+    prev = {varname:state for varname,(kind,state) in loadBoundaries(carryfiles[0]).iteritems()}
+    # append the other chunks in time order
+    for partial,carryfile in zip(partials[1:],carryfiles[1:]):
+      logger.debug("{0:s} Appending partial file '{1:s}'.".format(pidstr,partial))
+      part = nc.Dataset(partial, mode='r', format='NETCDF4')
+      if part.begin_date != shiftMonth(mean.end_date): 
+        raise DateError, "Chunks are not contiguous: '{:s}' does not follow '{:s}'.".format(part.begin_date,mean.end_date)
+      boundaries = loadBoundaries(carryfile)
+      i0 = len(mean.dimensions[time]) # offset of this chunk
+      for i in xrange(len(part.dimensions[time])):
+        if part.variables[time][i] == -1: raise DateError, "Incomplete record in partial file '{:s}'.".format(partial)
+        mean.variables[time][i0+i] = -1 # mark timestep in progress
+        for varname in varlist:
+          vardata = part.variables[varname][i,:] if part.variables[varname].ndim > 1 else part.variables[varname][i]
+          # join the lead of this chunk with the state at the end of the previous chunk 
+          if varname in boundaries:
+            kind, state = boundaries[varname]
+            vardata = kind.joinBoundary(vardata, i, prev[varname], state)
+          ncvar = mean.variables[varname]
+          if ncvar.ndim > 1: ncvar[i0+i,:] = vardata # here time is always the outermost index
+          else: ncvar[i0+i] = vardata
+        mean.variables[time][i0+i] = part.variables[time][i] + i0 # update time axis (last action)
+      # update states at the end of the chunk (including the previous chunks, if the lead never ended)
+      for varname,(kind,state) in boundaries.iteritems(): prev[varname] = kind.carryBoundary(prev[varname], state)
+      mean.end_date = part.end_date
+      part.close(); mean.sync()
+    mean.close()
+    # merge daily means: records are placed according to the begin date of each chunk
+    if dayparts:
+      dayname = streampattern.format(filetype,ndom,'daily')
+      shutil.copy(dayparts[0],outfolder+tmppfx+dayname)
+      dayset = nc.Dataset(outfolder+tmppfx+dayname, mode='a', format='NETCDF4')
+      timeaxis = TimeAxis(calendar=calendar)
+      firstday = timeaxis.daysSinceEpoch(*[int(tmp) for tmp in dayset.begin_date.split('-')])
+      for daypart in dayparts[1:]:
+        logger.debug("{0:s} Appending daily means '{1:s}'.".format(pidstr,daypart))
+        part = nc.Dataset(daypart, mode='r', format='NETCDF4')
+        offset = int( timeaxis.daysSinceEpoch(*[int(tmp) for tmp in part.begin_date.split('-')]) - firstday )
+        if offset != len(dayset.dimensions[time]): 
+          raise DateError, "Daily means are not contiguous: '{:s}' does not follow '{:s}'.".format(part.begin_date,dayset.end_date)
+        appendRecords(dayset, part, offset=offset)
+        part.close(); dayset.sync()
+      dayset.close()
+      os.rename(outfolder+tmppfx+dayname,outfolder+dayname)
+    # merge separate files of monthly records (histograms, diurnal cycles): the same as monthly means
+    for stream,parts in sideparts.iteritems():
+      sidename = streampattern.format(filetype,ndom,stream)
+      shutil.copy(parts[0],outfolder+tmppfx+sidename)
+      sideset = nc.Dataset(outfolder+tmppfx+sidename, mode='a', format='NETCDF4')
+      for sidepart in parts[1:]:
+        logger.debug("{0:s} Appending monthly {1:s} records '{2:s}'.".format(pidstr,stream,sidepart))
+        part = nc.Dataset(sidepart, mode='r', format='NETCDF4')
+        if part.begin_date != shiftMonth(sideset.end_date): 
+          raise DateError, "Chunks are not contiguous: '{:s}' does not follow '{:s}'.".format(part.begin_date,sideset.end_date)
+        appendRecords(sideset, part, offset=len(sideset.dimensions[time]))
+        part.close(); sideset.sync()
+      sideset.close()
+      os.rename(outfolder+tmppfx+sidename,outfolder+sidename)
+    # rename file to proper name and remove partial files
+    os.rename(tmpmeanfile,meanfile)
+    for partial,carryfile in zip(partials,carryfiles):
+      os.remove(partial); os.remove(carryfile)
+    for daypart in dayparts: os.remove(daypart)
+    for sidepart in sum(sideparts.values(), []): os.remove(sidepart)
+    logger.info("\n{0:s} Writing output to: {1:s}\n('{2:s}')\n".format(pidstr, filename, meanfile))
+    ec = 0 # set zero exit code for this operation
+    
+  except Exception:
+    # report error
+    logger.exception('\n # {0:s} WARNING: an Error occured while merging partial files! '.format(pidstr)+
+                     '\n # The partial files are left in place.\n')
+    ec = 1 # set non-zero exit code
+  # aggregate seasonal and annual means from the merged monthly means
+  if ec == 0: ec = writePeriodStreams(filetype, ndom, tmppfx=tmppfx, pidstr=pidstr, logger=logger)
+    
+  # return exit code
+  return ec
+
+
+
+## process tasks from a queue that is shared with other invocations
+def workQueue(queuefolder, lparallel=False, pidstr='', logger=None, ldebug=False):
+  ''' Claim tasks from a task queue on the file system and run them (averaging or merging of chunks), until 
+      all tasks are done; several invocations on different nodes can work on the same queue. '''
+  def toStr(arg):
+    # N.B.: JSON returns unicode strings, which can cause problems with NetCDF attributes
+    if isinstance(arg,unicode): return str(arg)
+    elif isinstance(arg,list): return [toStr(a) for a in arg]
+    else: return arg
+  queue = TaskQueue(queuefolder, leasetimeout=leasetimeout)
+  ec = 0 # number of tasks that failed in this worker
+  while True:
+    claim = queue.claim()
+    if claim is None:
+      # check, if there are tasks left (waiting for dependencies or claimed by other workers)
+      status = queue.status()
+      if status is None or len(status[2]) == 0: break
+      sleep(min(60.,leasetimeout/10.)); continue
+    taskid, task = claim
+    logger.info("\n{0:s} Claimed task '{1:s}'.".format(pidstr,taskid))
+    args = toStr(task['args'])
+    if task['kind'] == 'merge': func = mergeChunks
+    else: func = processFileList
+    try: tec = func(*args, lparallel=lparallel, pidstr=pidstr, logger=logger, ldebug=ldebug)
+    except Exception:
+      logger.exception("\n{0:s} Task '{1:s}' failed:".format(pidstr,taskid)); tec = 1
+    queue.complete(taskid, lsuccess=(tec == 0))
+    if tec != 0: ec += 1
+  # report failed tasks and remove queue (only one worker will actually remove it)
+  status = queue.status()
+  if status is not None:
+    if len(status[1]) > 0: logger.info("\n{0:s} Failed tasks: {1:s}".format(pidstr,', '.join(status[1])))
+    queue.remove()
+  # return exit code
+  return ec
+
+
 ## now begin execution    
 if __name__ == '__main__':
 
@@ -1014,7 +1765,12 @@ if __name__ == '__main__':
         str(loverwrite), str(lrecover), str(lderivedonly), str(lcarryover)))
   print('ADDNEW: {:s}, RECALC: {:s}'.format(str(laddnew), str(recalcvars) if lrecalc else str(lrecalc)))
   print('FILETYPES: {:s}, DOMAINS: {:s}'.format(str(filetypes),str(domains)))
-  print('THREADS: {:s}, DEBUG: {:s}'.format(str(NP),str(ldebug)))
+  print('THREADS: {:s}, CHUNKS: {:s}, PREFETCH: {:d}, DEBUG: {:s}'.format(str(NP),'AUTO' if lautochunk else str(nchunks),
+                                                                      nprefetch,str(ldebug)))
+  print('CATALOG: {:s}, SYNC: {:.0f}s, CHECKPOINT: {:.0f}s'.format('CHECK' if lcheckcatalog else str(lcatalog), 
+                                                                 syncinterval, ckinterval))
+  print('QUEUE: {:s}, MEMLIMIT: {:s}'.format('{:.0f}s'.format(leasetimeout) if lqueue else str(lqueue),
+                                          '{:.1f} GB'.format(memlimit/1024.**3) if memlimit > 0 else 'None'))
   print('')
   # compile regular expression, used to infer start and end dates and month (later, during computation)
   datestr = '{0:s}-{1:s}-{2:s}'.format(yearstr,monthstr,daystr)
@@ -1023,12 +1779,21 @@ if __name__ == '__main__':
   # get file list
   wrfrgx = re.compile(inputpattern.format('.*','\d\d',datestr,)) # for initial search (all filetypes)
   # regular expression to match the name pattern of WRF timestep output files
-  masterlist = [wrfrgx.match(filename) for filename in os.listdir(infolder)] # list folder and match
-  masterlist = [match.group() for match in masterlist if match is not None] # assemble valid file list
+  catalog = None
+  if lcatalog:
+    # query catalog; the folder is only listed, if it was modified since the last update 
+    try: catalog = WRFCatalog(infolder, lcheck=lcheckcatalog)
+    except CatalogError as err: 
+      print('\nWARNING: {:s}\n         Listing input folder instead.\n'.format(str(err))) # fall back to listing
+  if catalog is not None:
+    masterlist = [filename for filename in catalog.listFiles() if wrfrgx.match(filename)]
+  else:
+    masterlist = [wrfrgx.match(filename) for filename in os.listdir(infolder)] # list folder and match
+    masterlist = [match.group() for match in masterlist if match is not None] # assemble valid file list
   if len(masterlist) == 0: raise IOError, 'No matching WRF output files found for date: {0:s}'.format(datestr)
   
   ## loop over filetypes and domains to construct job list
-  args = []
+  jobs = [] # job properties, including cost estimates
   for filetype in filetypes:    
     # make list of files
     filelist = []
@@ -1041,14 +1806,90 @@ if __name__ == '__main__':
       filelist.sort() # now, when the list is shortest, we can sort...
       # N.B.: sort alphabetically, so that files are in temporally sequence
       # now put everything into the lists
-      if len(filelist) > 0:
-        args.append( (filelist, filetype, domain) )
-      else:          
+      if len(filelist) == 0:
         print("Can not process filetype '{:s}' (domain {:d}): no source files.".format(filetype,domain))
+        continue
+      # time range and input size (from catalog, if possible)
+      begindate, enddate = getMonthRange(*getTimeRange(filelist, catalog=catalog))
+      nmonth = max(1,countMonths(begindate, enddate))
+      if catalog is not None: nbytes = catalog.getTotalSize(filelist)
+      else: nbytes = sum([os.path.getsize(infolder+filename) for filename in filelist])
+      # check existing output: processing time of last run and months that are already done
+      meanfile = outfolder+outputpattern.format(filetype,domain)
+      lexists = os.path.exists(meanfile); secpm = None; nexist = 0
+      if lexists:
+        try:
+          mean = nc.Dataset(meanfile, 'r', format='NETCDF4')
+          if timingatt in mean.ncattrs(): secpm = float(mean.getncattr(timingatt))
+          if not ( loverwrite or laddnew or lrecalc ): nexist = len(mean.dimensions[time])
+          mean.close()
+        except (IOError, RuntimeError): pass # broken files are handled (removed) by processFileList
+      # N.B.: existing output can not be chunked, because chunks always start a new (partial) file
+      lchunk = ( nchunks > 1 or lautochunk ) and not ( laddnew or lrecalc ) and ( loverwrite or not lexists )
+      jobs.append(dict(filelist=filelist, filetype=filetype, domain=domain, begindate=begindate, enddate=enddate,
+                       nmonth=nmonth, nexist=min(nexist,nmonth), secpm=secpm, lchunk=lchunk, 
+                       model=estimateCost(filetype, nbytes)))
+  if catalog is not None: catalog.close() # not needed by worker processes
+
+  ## estimate cost of jobs and distribute work
+  # calibrate cost model with timings from previous runs (seconds per unit of model cost)
+  rates = [job['secpm']*job['nmonth']/job['model'] for job in jobs if job['secpm'] and job['model'] > 0]
+  rate = np.median(rates) if len(rates) > 0 else 1.
+  for job in jobs:
+    cost = job['secpm']*job['nmonth'] if job['secpm'] else job['model']*rate # cost of entire period
+    job['cost'] = cost * float(job['nmonth']-job['nexist']) / job['nmonth'] # only months that still need processing
+  # split expensive jobs into chunks, which are processed in parallel and merged later
+  if lautochunk: share = sum([job['cost'] for job in jobs]) / float(NP or multiprocessing.cpu_count()) # fair share
+  args = []; mergeargs = [] # argument lists with cost
+  for job in jobs:
+    filetype = job['filetype']; domain = job['domain']
+    if not job['lchunk']: nchunk = 1
+    elif lautochunk: nchunk = int(np.ceil(job['cost']/share)) if share > 0 else 1
+    else: nchunk = nchunks
+    chunks = splitMonthRange(job['begindate'], job['enddate'], nchunk=nchunk) if nchunk > 1 else []
+    if len(chunks) > 1:
+      for ichunk,(chunkbegin,chunkend) in enumerate(chunks):
+        chunklist = selectChunkFiles(job['filelist'], chunkbegin, chunkend)
+        chunkcost = job['cost'] * countMonths(chunkbegin, chunkend) / float(job['nmonth'])
+        chunk = (ichunk, len(chunks), chunkbegin, chunkend, chunks[0][0]) # origin: begin of the first chunk
+        args.append( (chunkcost, (chunklist, filetype, domain, chunk)) )
+      mergeargs.append( (filetype, domain, len(chunks)) )
+      print("Splitting filetype '{:s}' (domain {:d}) into {:d} chunks.".format(filetype,domain,len(chunks)))
+    else: args.append( (job['cost'], (job['filelist'], filetype, domain)) )
+  # dispatch longest jobs first, so that the makespan is not determined by an expensive job that started last 
+  args.sort(key=lambda arg: arg[0], reverse=True)
+  print('\nJob order (estimated cost in {:s}):'.format('seconds' if len(rates) > 0 else 'relative units'))
+  for cost,arg in args:
+    chunkstr = ', chunk {:d}'.format(arg[3][0]) if len(arg) > 3 else ''
+    print('  wrf{:s}_d{:02d}{:s}: {:g}'.format(arg[1],arg[2],chunkstr,cost if len(rates) > 0 else cost/1024.**3))
+  args = [arg for cost,arg in args]
   print('\n')
     
   # call parallel execution function
   kwargs = dict() # no keyword arguments
-  ec = asyncPoolEC(processFileList, args, kwargs, NP=NP, ldebug=ldebug, ltrialnerror=True)
+  if lqueue:
+    # create task queue (unless another invocation already did); task IDs determine the order
+    tasks = []; chunkids = dict()
+    for rank,arg in enumerate(args):
+      taskid = '{:04d}_wrf{:s}_d{:02d}'.format(rank,arg[1],arg[2])
+      if len(arg) > 3: 
+        taskid += '_chunk{:02d}'.format(arg[3][0])
+        chunkids.setdefault((arg[1],arg[2]),[]).append(taskid)
+      tasks.append( (taskid, dict(kind='average', args=list(arg))) )
+    # N.B.: merge tasks depend on all chunks and are ranked last, so that they do not block workers
+    for rank,(filetype,domain,nchunk) in enumerate(mergeargs):
+      taskid = '{:04d}_wrf{:s}_d{:02d}_merge'.format(len(args)+rank,filetype,domain)
+      tasks.append( (taskid, dict(kind='merge', args=[filetype,domain,nchunk], deps=chunkids[(filetype,domain)])) )
+    queue = TaskQueue(outfolder+queuefolder, leasetimeout=leasetimeout)
+    if queue.initialize(tasks): print('Created task queue with {:d} tasks in {:s}\n'.format(len(tasks),queue.folder))
+    else: print('Joining existing task queue in {:s}\n'.format(queue.folder))
+    # every process works on the queue until all tasks are done
+    workers = [(outfolder+queuefolder,) for i in xrange(NP or multiprocessing.cpu_count())]
+    ec = asyncPoolEC(workQueue, workers, kwargs, NP=NP, ldebug=ldebug, ltrialnerror=True)
+  else:
+    ec = asyncPoolEC(processFileList, args, kwargs, NP=NP, ldebug=ldebug, ltrialnerror=True)
+    # merge partial files from chunks (only chunks that completed successfully can be merged)
+    if len(mergeargs) > 0:
+      ec += asyncPoolEC(mergeChunks, mergeargs, kwargs, NP=NP, ldebug=ldebug, ltrialnerror=True)
   # exit with number of failures plus 10 as exit code
   exit(int(10+ec) if ec > 0 else 0)
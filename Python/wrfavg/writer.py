@@ -0,0 +1,97 @@
+'''
+Created on 2026-10-18
+
+A module providing a background writer, which keeps the monthly output file open and writes finished
+monthly records from a queue, while the averaging of the next month continues in wrfout_average.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+import sys, threading, Queue
+from time import time as clock
+from wrfavg.prefetch import nclock
+
+
+# class for errors with the writer
+class WriterError(Exception):
+  ''' Exceptions related to the background writer. '''
+  pass
+
+
+class MonthlyWriter(object):
+  '''
+    A background thread that writes monthly records to an open NetCDF dataset, in the order of submission;
+    the time variable is set to -1 first and to its final value last, so that incomplete records can be detected.
+  '''
+
+  def __init__(self, dataset, timevar='time', missing_value=None, syncinterval=0., maxqueue=1, lock=nclock):
+    ''' Start the writer thread; syncinterval is the minimum time between syncs in seconds (0: sync after every
+        record), and maxqueue the number of records that can be pending (limits memory usage). '''
+    if maxqueue < 1: raise WriterError, 'The writer queue has to hold at least one record.'
+    self.dataset = dataset; self.timevar = timevar
+    self.missing_value = missing_value
+    self.syncinterval = syncinterval; self.lastsync = clock()
+    self.lock = lock # lock for the NetCDF library (shared with other threads)
+    self.queue = Queue.Queue(maxsize=maxqueue)
+    self.error = None # exception info of a failed write
+    self.missing = set() # variables that already have a missing value flag
+    self.thread = threading.Thread(target=self._writeRecords, name='MonthlyWriter')
+    self.thread.daemon = True # don't keep the process alive
+    self.thread.start()
+
+  def _writeRecords(self):
+    ''' Worker function executed by the writer thread. '''
+    while True:
+      record = self.queue.get()
+      if record is None: break # signal to stop
+      # N.B.: after an error, records are discarded, so that the consumer does not block
+      if self.error is None:
+        try: self._writeRecord(*record)
+        except Exception: self.error = sys.exc_info() # pass on to main thread
+    # final sync
+    if self.error is None:
+      try:
+        with self.lock: self.dataset.sync()
+      except Exception: self.error = sys.exc_info()
+
+  def _writeRecord(self, idx, timevalue, variables, atts):
+    ''' Write one record; the time variable is updated last. '''
+    with self.lock: self.dataset.variables[self.timevar][idx] = -1 # mark record in progress
+    for varname,vardata in variables:
+      # make sure the missing value flag is preserved (only floating point data)
+      lmissing = self.missing_value is not None and np.issubdtype(vardata.dtype, np.inexact)
+      if lmissing: vardata = np.where(np.isnan(vardata), self.missing_value, vardata)
+      # N.B.: release the lock between variables, so that other threads can access the library
+      with self.lock:
+        ncvar = self.dataset.variables[varname]
+        if lmissing and varname not in self.missing:
+          ncvar.missing_value = self.missing_value; self.missing.add(varname)
+        if ncvar.ndim > 1: ncvar[idx,:] = vardata # here time is always the outermost index
+        else: ncvar[idx] = vardata
+    with self.lock:
+      for att,value in atts.iteritems(): self.dataset.setncattr(att,value)
+      self.dataset.variables[self.timevar][idx] = timevalue # update time axis (last action)
+      # sync periodically
+      if clock() - self.lastsync >= self.syncinterval:
+        self.dataset.sync(); self.lastsync = clock()
+
+  def _raiseError(self):
+    ''' Reraise an exception from the writer thread in the calling thread. '''
+    if self.error is not None:
+      errtype, err, tb = self.error
+      raise errtype, err, tb
+
+  def put(self, idx, timevalue, variables, atts=None):
+    ''' Submit a record (list of variable names and arrays); blocks, if too many records are pending.
+        N.B.: the arrays must not be modified after submission! '''
+    self._raiseError() # don't continue, if writing failed
+    if not self.thread.is_alive(): raise WriterError, 'The writer thread is not running.'
+    self.queue.put( (idx, timevalue, list(variables), atts or dict()) )
+
+  def close(self, lraise=True):
+    ''' Write all pending records, sync the dataset and stop the thread; reraise errors from the writer. '''
+    if self.thread.is_alive():
+      self.queue.put(None); self.thread.join()
+    if lraise: self._raiseError()